@@ -1,51 +1,53 @@
-# =============================================================================
-# Fix matplotlib backend to avoid tkinter threading issues
-# =============================================================================
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-from flask import Flask, request, jsonify, send_file, render_template, send_from_directory
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, send_file, render_template, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import numpy as np
 import pandas as pd
 import torch
 import torch.nn as nn
-import tensorflow as tf
 import librosa
 import torchaudio
 import soundfile as sf
-import matplotlib.pyplot as plt
 import rasterio
-from scipy.signal import medfilt, find_peaks
+from scipy.signal import medfilt
 from PIL import Image
 from datetime import datetime
 import io
 import base64
 import tempfile
+import hmac
 import shutil
+import zipfile
 import traceback
 import webbrowser
 import threading
 import os
-from transformers import AutoProcessor, AutoModelForAudioClassification
+import time
 from voice_model import ECAPA_gender
+from model_registry import ModelRegistry, file_version
+from result_cache import ResultCache, hash_stream, hash_bytes
+from metrics import registry as metrics, stage, set_route, SIZE_BUCKETS
+from tracing import tracer, span, traced, run_traced
+from batching import batcher_from_env, group_by_length
+from jobs import JOB_STATUSES, JobManager, JobQueueFull
+from doppler import choose_stft_params, track_dominant_frequency, encode_spectrogram_response, PassBy
+from cache import LRUCache
+from doppler_dataset import generate_dataset, parameter_grid
+from sar_stats import SARStatsAccumulator, raster_statistics, read_quicklook, to_db
+from sar_render import render_quicklook, png_base64, SAR_DISPLAY_SIZE, STRETCH_PERCENTILES
+from sar_tiles import register_scene, get_scene, tile_cache as sar_tile_cache
+from sar_convert import render_raster_png, convert_many, extract_rasters, unique_name, shared_pool, CONVERT_FORMATS, TIFF_EXTENSIONS
+from spectro_tiles import register_recording, get_recording, encode_tile_png, tile_cache as spectro_tile_cache
+from array_io import open_npy_upload
+from ecg_io import load_ecg_array, fit_ecg_input, iter_ecg_windows, ECG_SAMPLES, ECG_SAMPLE_RATE, ECG_MIN_STRIDE
+from audio_io import probe_audio, decode_audio, validate_audio, iter_resampled_blocks, resampler_cache
 import torch.nn.functional as F
 from typing import Optional
     
 
-# Import your model functions
-try:
-    from model import get_model
-except ImportError:
-    # Fallback for production
-    def get_model(n_classes, last_layer):
-        # You might need to implement a fallback or ensure model.py is included
-        pass
-
-app = Flask(__name__)
-# Allow all origins for development
-CORS(app)
+# Every route and hook is registered on this blueprint; create_app() builds
+# the Flask application around it (wsgi.py for production, __main__ for dev).
+api = Blueprint("deepsignal", __name__)
 
 # =============================================================================
 # Configuration
@@ -55,7 +57,7 @@ MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 ALLOWED_EXTENSIONS = {'npy', 'npz', 'csv', 'txt'}
 
 # Configuration of drone and sar
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
+MAX_CONTENT_LENGTH = int(os.environ.get("MAX_CONTENT_LENGTH_MB", 50)) * 1024 * 1024  # 50MB max file size by default
 ALLOWED_AUDIO_EXTENSIONS = {'wav', 'mp3', 'm4a', 'flac', 'aac'}
 ALLOWED_IMAGE_EXTENSIONS = {'tif', 'tiff', 'jpg', 'jpeg', 'png'}
 
@@ -66,30 +68,18 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 # Load Models
 # =============================================================================
 
-# Load ECG Model
-try:
-    model_path = "model.hdf5"
-    ecg_model = get_model(n_classes=6, last_layer='sigmoid')
-    ecg_model.load_weights(model_path)
-    print("✅ ECG Model loaded successfully")
-except Exception as e:
-    print(f"❌ Error loading ECG model: {e}")
-    ecg_model = None
+# Models are loaded lazily on first use through the registry, so a worker that
+# only serves SAR or Doppler traffic never pays for TensorFlow or transformers.
+# Set PRELOAD_MODELS=ecg,eeg,drone,voice (or "all") to load some of them up front;
+# the entry points (wsgi.py, python app.py) do that, importing this module does not.
+models = ModelRegistry()
 
 ecg_labels = ["1dAVb", "RBBB", "LBBB", "SB", "AF", "ST"]
+ECG_MODEL_PATH = "model.hdf5"
 
-# Load EEG Model
 EEG_MODEL_PATH = "eegnet_deploy.pt"
 device = torch.device("cpu")
 
-try:
-    eeg_model = torch.jit.load(EEG_MODEL_PATH, map_location=device)
-    eeg_model.eval()
-    print(f"✅ EEG Model loaded successfully from {EEG_MODEL_PATH}")
-except Exception as e:
-    print(f"❌ Error loading EEG model: {e}")
-    eeg_model = None
-
 eeg_label_map = [
     "Healthy",
     "Alzheimer's",
@@ -98,23 +88,169 @@ eeg_label_map = [
     "Parkinson's Disease"
 ]
 
-# Load Drone Model
-try:
-    MODEL_NAME = "preszzz/drone-audio-detection-05-17-trial-0"
-    print(f"🚀 Loading drone model: {MODEL_NAME}")
+MODEL_NAME = "preszzz/drone-audio-detection-05-17-trial-0"
+
+VOICE_MODEL_PATH = "gender_classifier.model"
+voice_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+def load_ecg_model():
+    """Build the ECG ResNet and load its weights"""
+    # TensorFlow is only imported when the ECG model is actually needed
+    from model import get_model
+    ecg_model = get_model(n_classes=6, last_layer='sigmoid')
+    ecg_model.load_weights(ECG_MODEL_PATH)
+    return ecg_model
+
+def load_eeg_model():
+    """Load the TorchScript EEGNet"""
+    eeg_model = torch.jit.load(EEG_MODEL_PATH, map_location=device)
+    eeg_model.eval()
+    return eeg_model
+
+def load_drone_model():
+    """Load the Hugging Face drone processor and classifier"""
+    from transformers import AutoProcessor, AutoModelForAudioClassification
     processor = AutoProcessor.from_pretrained(MODEL_NAME)
     model = AutoModelForAudioClassification.from_pretrained(MODEL_NAME)
-    print("✅ Drone model loaded successfully")
+    model.eval()
     print(f"📋 Available drone classes: {list(model.config.id2label.values())}")
-except Exception as e:
-    print(f"❌ Error loading drone model: {e}")
-    processor = None
-    model = None
+    return processor, model
+
+def load_voice_model():
+    """Load the ECAPA-TDNN voice gender classifier"""
+    if not os.path.exists(VOICE_MODEL_PATH):
+        raise FileNotFoundError(f"Model file not found: {VOICE_MODEL_PATH}")
+    voice_model = ECAPA_gender(C=1024)
+    voice_model.load_state_dict(torch.load(VOICE_MODEL_PATH, map_location=voice_device))
+    voice_model.to(voice_device)
+    voice_model.eval()
+    print(f"✅ Model device: {voice_device}")
+    return voice_model
+
+models.register("ecg", load_ecg_model, "Keras ECG ResNet (6 classes)", file_version(ECG_MODEL_PATH))
+models.register("eeg", load_eeg_model, "TorchScript EEGNet (5 classes)", file_version(EEG_MODEL_PATH))
+models.register("drone", load_drone_model, f"Hugging Face {MODEL_NAME}", MODEL_NAME)
+models.register("voice", load_voice_model, "ECAPA-TDNN voice gender classifier", file_version(VOICE_MODEL_PATH))
+
+def get_drone_model():
+    """Return (processor, model) for drone classification, or (None, None)"""
+    loaded = models.get("drone")
+    return loaded if loaded is not None else (None, None)
+
+# =============================================================================
+# Inference Batching
+# =============================================================================
+# Every model call goes through a MicroBatcher so concurrent requests share one
+# forward pass. Limits are per model: BATCH_<NAME>_MAX_SIZE / BATCH_<NAME>_MAX_WAIT_MS.
+
+def _require_model(name):
+    loaded = models.get(name)
+    if loaded is None:
+        raise RuntimeError(f"{name} model not loaded")
+    return loaded
+
+def _ecg_batch(arrays):
+    """(4096, 12) float32 arrays -> per-record sigmoid probabilities"""
+    ecg_model = _require_model("ecg")
+    probs = ecg_model.predict(np.stack(arrays), verbose=0)
+    return list(probs)
+
+def _eeg_batch(tensors):
+    """(trials, 19, 128) tensors -> per-request raw outputs, split back by trial count"""
+    eeg_model = _require_model("eeg")
+    sizes = [t.shape[0] for t in tensors]
+    with torch.no_grad():
+        outputs = eeg_model(torch.cat(tensors, dim=0))
+    return list(torch.split(outputs, sizes, dim=0))
+
+def _drone_batch(waveforms):
+    """16 kHz mono float32 waveforms -> per-clip logits"""
+    processor, model = _require_model("drone")
+    results = [None] * len(waveforms)
+    for _, indices in group_by_length(waveforms).items():
+        inputs = processor(
+            [waveforms[i] for i in indices],
+            sampling_rate=16000,
+            return_tensors="pt",
+            padding=True
+        )
+        with torch.no_grad():
+            logits = model(**inputs).logits
+        for row, i in enumerate(indices):
+            results[i] = logits[row:row + 1]
+    return results
+
+def _voice_batch(audios):
+    """(1, samples) 16 kHz tensors -> per-clip ECAPA outputs"""
+    voice_model = _require_model("voice")
+    results = [None] * len(audios)
+    for _, indices in group_by_length(audios).items():
+        batch = torch.cat([audios[i] for i in indices], dim=0).to(voice_device)
+        with torch.no_grad():
+            outputs = voice_model(batch)
+        for row, i in enumerate(indices):
+            results[i] = outputs[row:row + 1].cpu()
+    return results
+
+batchers = {
+    "ecg": batcher_from_env("ecg", _ecg_batch, max_batch_size=16, max_wait_ms=10),
+    "eeg": batcher_from_env("eeg", _eeg_batch, max_batch_size=8, max_wait_ms=5),
+    "drone": batcher_from_env("drone", _drone_batch, max_batch_size=8, max_wait_ms=10),
+    "voice": batcher_from_env("voice", _voice_batch, max_batch_size=8, max_wait_ms=10),
+}
 
 # =============================================================================
 # Helper Functions
 # =============================================================================
 
+@traced()
+def predict_ecg_segments(recording, stride=ECG_SAMPLES, batch_size=16):
+    """Classify every 4096-sample window of a recording and aggregate the results"""
+    _require_model("ecg")
+
+    timeline, segment_probs = [], []
+    with stage("inference") as inference:
+        for starts, batch in iter_ecg_windows(recording, ECG_SAMPLES, stride, batch_size):
+            # Through the ECG batcher: Keras predict must not run concurrently
+            # with the batcher thread's own predict on the same model
+            probs = np.stack(batchers["ecg"].submit_many(list(batch)))
+            segment_probs.append(probs)
+            for start, p in zip(starts, probs):
+                timeline.append({
+                    "start_sample": int(start),
+                    "start_s": round(start / ECG_SAMPLE_RATE, 3),
+                    "end_s": round((start + ECG_SAMPLES) / ECG_SAMPLE_RATE, 3),
+                    "abnormal": bool(np.any(p >= 0.5)),
+                    "probabilities": {ecg_labels[i]: round(float(p[i]), 4) for i in range(len(ecg_labels))}
+                })
+    inference_ms = inference.ms
+
+    probs = np.concatenate(segment_probs, axis=0)
+    max_probs = probs.max(axis=0)
+    best_index = int(np.argmax(max_probs))
+    abnormal_segments = sum(w["abnormal"] for w in timeline)
+    print(f"✅ ECG segmented: {len(timeline)} windows, {abnormal_segments} abnormal, {inference_ms:.1f} ms")
+
+    return {
+        "mode": "segmented",
+        "normal_abnormal": "Abnormal" if abnormal_segments else "Normal",
+        "best_class": ecg_labels[best_index],
+        "best_prob": float(max_probs[best_index]),
+        "all_probabilities": {ecg_labels[i]: float(max_probs[i]) for i in range(len(ecg_labels))},
+        "aggregate": {
+            "segments": len(timeline),
+            "abnormal_segments": int(abnormal_segments),
+            "mean_probabilities": {ecg_labels[i]: round(float(probs[:, i].mean()), 4) for i in range(len(ecg_labels))},
+            "max_probabilities": {ecg_labels[i]: round(float(max_probs[i]), 4) for i in range(len(ecg_labels))},
+            "positive_fraction": {ecg_labels[i]: round(float((probs[:, i] >= 0.5).mean()), 4) for i in range(len(ecg_labels))}
+        },
+        "window_samples": ECG_SAMPLES,
+        "stride_samples": stride,
+        "sample_rate": ECG_SAMPLE_RATE,
+        "timeline": timeline,
+        "timing": {"inference_ms": round(inference_ms, 3)}
+    }
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -134,81 +270,138 @@ def save_uploaded_file(file, filename):
     print(f"📁 File saved to: {filepath}")
     return filepath
 
-def preprocess_eeg_signal(signal: np.ndarray):
+def prune_expired_files(directory, ttl_seconds):
+    """Delete files in ``directory`` not modified for ``ttl_seconds``; returns how many"""
+    removed = 0
+    now = time.time()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if os.path.isfile(path) and now - os.path.getmtime(path) > ttl_seconds:
+                os.unlink(path)
+                removed += 1
+        except OSError:
+            pass
+    if removed:
+        print(f"🧹 Removed {removed} expired file(s) from {directory}")
+    return removed
+
+def eeg_trials_view(signal: np.ndarray):
     """
-    Preprocess EEG signal exactly like training.
-    - Transpose each trial to (19,128)
-    - Normalize each channel (z-score)
-    - Handle any input shape (19x128, 345x128x19, etc.)
+    Arrange any supported EEG input as (trials, channels, samples) without copying.
+    - (trials, 128, 19) is transposed to (trials, 19, 128)
+    - (128, 19) / (19, 128) become a single trial
     """
-    print(f"🔄 Preprocessing EEG signal with shape: {signal.shape}")
-
     # Case 1 — signal is (trials, time, channels)
     if signal.ndim == 3 and signal.shape[-1] == 19:
         signal = np.transpose(signal, (0, 2, 1))  # (trials, 19, 128)
-        print("📊 Transposed (trials,128,19) → (trials,19,128)")
 
     # Case 2 — signal is (channels, samples)
     elif signal.ndim == 2:
         if signal.shape[0] == 128 and signal.shape[1] == 19:
             signal = signal.T  # (19,128)
-            print("📊 Transposed (128,19) → (19,128)")
         signal = np.expand_dims(signal, axis=0)  # (1,19,128)
 
+    if signal.ndim != 3:
+        raise ValueError(f"Unsupported EEG shape {signal.shape}; expected (trials,128,19), (128,19) or (19,128)")
+    return signal
+
+@traced()
+def preprocess_eeg_signal(signal: np.ndarray):
+    """
+    Preprocess EEG signal exactly like training.
+    - Transpose each trial to (19,128)
+    - Normalize each channel (z-score)
+    - Handle any input shape (19x128, 345x128x19, etc.)
+    Works on a slice of trials at a time: one float32 copy, normalized in place.
+    """
+    signal = eeg_trials_view(signal)
+
     # Ensure correct channel/time dimensions
     trials, chans, samples = signal.shape
     if chans != 19 or samples != 128:
-        print(f"⚠️ Adjusting shape from {signal.shape} to (trials,19,128)")
-        fixed = np.zeros((trials, 19, 128))
+        fixed = np.zeros((trials, 19, 128), dtype=np.float32)
         fixed[:, :min(chans, 19), :min(samples, 128)] = signal[:, :min(chans, 19), :min(samples, 128)]
         signal = fixed
-
-    # Normalize each trial per channel
-    normed = []
-    for trial in signal:
-        norm_trial = (trial - trial.mean(axis=1, keepdims=True)) / (trial.std(axis=1, keepdims=True) + 1e-6)
-        normed.append(norm_trial)
-    signal = np.stack(normed).astype(np.float32)
-
-    tensor = torch.tensor(signal, dtype=torch.float32)
-    print(f"✅ Final EEG tensor shape: {tensor.shape}")
-    return tensor
-
-def run_eeg_model_inference(tensor):
-    """Run EEGNet model inference and return prediction + confidence."""
-    print(f"🧠 Running EEG inference on tensor: {tensor.shape}")
-
+    else:
+        # Also pages in a memory-mapped slice; the upload itself is never modified
+        signal = np.array(signal, dtype=np.float32, order="C")
+
+    # Normalize every trial per channel (z-score over time), vectorized and in place
+    mean = signal.mean(axis=2, keepdims=True)
+    signal -= mean
+    std = signal.std(axis=2, keepdims=True)
+    std += 1e-6
+    signal /= std
+
+    return torch.from_numpy(signal)
+
+EEG_CHUNK_TRIALS = int(os.environ.get("EEG_CHUNK_TRIALS", 256))
+
+@traced()
+def run_eeg_model_inference(signal, chunk_trials=EEG_CHUNK_TRIALS):
+    """Run EEGNet over every trial in fixed-size chunks and aggregate the predictions."""
+    trials = eeg_trials_view(signal)
+    n_trials = trials.shape[0]
+    if trials.shape[1:] != (19, 128):
+        print(f"⚠️ Adjusting shape from {trials.shape} to (trials,19,128)")
+    print(f"🧠 Running EEG inference on {n_trials} trials in chunks of {chunk_trials}")
+
+    start = time.perf_counter()
+    probabilities = np.empty((n_trials, len(eeg_label_map)), dtype=np.float32)
     with torch.no_grad():
-        # EEGNet expects (batch, 19, 128)
-        outputs = eeg_model(tensor)
-        print(f"🧩 Raw EEG model output shape: {outputs.shape}")
-
-        # Handle shape automatically
-        if outputs.ndim > 2:
-            outputs = outputs.view(outputs.size(0), -1)
-
-        probabilities = torch.nn.functional.softmax(outputs, dim=1)
-        pred_indices = torch.argmax(probabilities, dim=1)
-        pred_idx = torch.mode(pred_indices).values.item()
-        confidence = probabilities[0, pred_idx].item()
-        prediction = eeg_label_map[pred_idx]
-
-        print(f"🎯 EEG Predicted: {prediction} ({confidence*100:.1f}%)")
-
-        return {
-            "prediction": prediction,
-            "confidence": round(confidence, 4),
-            "all_probabilities": {eeg_label_map[i]: round(probabilities[0, i].item(), 4) for i in range(len(eeg_label_map))}
-        }
+        for first in range(0, n_trials, chunk_trials):
+            # EEGNet expects (batch, 19, 128); memory is bounded by one chunk
+            with stage("preprocess"):
+                tensor = preprocess_eeg_signal(trials[first:first + chunk_trials])
+            with stage("inference"):
+                outputs = batchers["eeg"].submit(tensor)
+
+            # Handle shape automatically
+            if outputs.ndim > 2:
+                outputs = outputs.view(outputs.size(0), -1)
+
+            probabilities[first:first + len(tensor)] = torch.nn.functional.softmax(outputs, dim=1).numpy()
+    elapsed = time.perf_counter() - start
+
+    # Majority vote across trials; confidence is the mean probability of the winning class
+    pred_indices = probabilities.argmax(axis=1)
+    votes = np.bincount(pred_indices, minlength=len(eeg_label_map))
+    pred_idx = int(np.argmax(votes))
+    mean_probs = probabilities.mean(axis=0)
+    confidence = float(mean_probs[pred_idx])
+    prediction = eeg_label_map[pred_idx]
+    trials_per_second = n_trials / elapsed if elapsed > 0 else None
+
+    print(f"🎯 EEG Predicted: {prediction} ({confidence*100:.1f}%), {n_trials} trials in {elapsed:.3f}s")
+
+    return {
+        "prediction": prediction,
+        "confidence": round(confidence, 4),
+        "all_probabilities": {eeg_label_map[i]: round(float(mean_probs[i]), 4) for i in range(len(eeg_label_map))},
+        "vote_counts": {eeg_label_map[i]: int(votes[i]) for i in range(len(eeg_label_map))},
+        "trial_predictions": [
+            {"prediction": eeg_label_map[idx], "confidence": round(float(probabilities[t, idx]), 4)}
+            for t, idx in enumerate(pred_indices)
+        ],
+        "n_trials": n_trials,
+        "inference_seconds": round(elapsed, 4),
+        "trials_per_second": round(trials_per_second, 1) if trials_per_second else None
+    }
 
 def process_uploaded_file(filepath):
     """Process uploaded file and return signal data"""
     ext = os.path.splitext(filepath)[1].lower()
     
     if ext == '.npy':
-        signal = np.load(filepath, allow_pickle=True)
+        # Memory-mapped: only the header is read to report the shape
+        signal = np.load(filepath, mmap_mode='r', allow_pickle=False)
     elif ext == '.npz':
-        with np.load(filepath, allow_pickle=True) as data:
+        with np.load(filepath, allow_pickle=False) as data:
             signal = data[data.files[0]]  # Get first array
     elif ext in ['.csv', '.txt']:
         signal = np.loadtxt(filepath, delimiter=',')
@@ -217,103 +410,202 @@ def process_uploaded_file(filepath):
     
     return signal
 
-def validate_audio_file(audio_path):
-    """Validate audio file before processing"""
+@traced()
+def read_audio_upload(file):
+    """Read an uploaded audio file into memory, validate it and decode it once"""
+    audio_bytes = file.read()
+    info = probe_audio(audio_bytes)
     try:
-        # Check file exists and has content
-        if not os.path.exists(audio_path):
-            raise ValueError("Audio file does not exist")
-        
-        file_size = os.path.getsize(audio_path)
-        if file_size < 100:
-            raise ValueError(f"Audio file too small ({file_size} bytes)")
-        
-        # Try to load and get basic info
-        waveform, sr = librosa.load(audio_path, sr=None, duration=1)  # Load just 1 second for validation
-        
-        if len(waveform) < 400:
-            raise ValueError(f"Audio too short: {len(waveform)} samples")
-        
-        if sr < 8000:
-            raise ValueError(f"Sample rate too low: {sr} Hz")
-            
-        print(f"✅ Audio validation passed - SR: {sr} Hz, Samples: {len(waveform)}")
-        return True
-        
+        # Cheap header checks first, so bad uploads are rejected before decoding
+        with stage("decode"):
+            validate_audio(audio_bytes, info=info)
+            decoded = decode_audio(audio_bytes, file.filename)
+            if info is None:
+                validate_audio(audio_bytes, decoded=decoded)
     except Exception as e:
         print(f"❌ Audio validation failed: {e}")
         raise ValueError(f"Invalid audio file: {str(e)}")
 
-def predict_drone(audio_path):
+    print(f"✅ Audio decoded - SR: {decoded.samplerate} Hz, Samples: {len(decoded.samples)}, "
+          f"Duration: {decoded.duration:.2f}s, Size: {len(audio_bytes)} bytes")
+    return decoded
+
+@traced()
+def predict_drone(audio):
+    """Classify a DecodedAudio clip; returns (label, confidence, all_probabilities)"""
     try:
-        print(f"🔊 Loading audio from: {audio_path}")
-        
-        # Load with librosa - ensure we get enough samples
-        waveform, sr = librosa.load(
-            audio_path, 
-            sr=16000,
-            mono=True,
-            duration=5.0  # Ensure minimum 5 seconds
-        )
-        
-        print(f"✅ Audio loaded - SR: {sr} Hz, Samples: {len(waveform)}, Duration: {len(waveform)/sr:.2f}s")
+        processor, model = get_drone_model()
+
+        # Classify the first 5 seconds at 16 kHz
+        waveform = audio.head(16000, 5.0)
+        print(f"✅ Audio ready - SR: 16000 Hz, Samples: {len(waveform)}, Duration: {len(waveform)/16000:.2f}s")
         
         # Validate minimum length - need at least 1 second for processing
         min_samples = 16000  # 1 second at 16kHz
         if len(waveform) < min_samples:
             print(f"⚠️ Audio too short ({len(waveform)} samples), padding to {min_samples}")
             # Pad with zeros to reach minimum length
-            padded_waveform = np.zeros(min_samples)
+            padded_waveform = np.zeros(min_samples, dtype=np.float32)
             padded_waveform[:len(waveform)] = waveform
             waveform = padded_waveform
         
         print(f"🎯 Final waveform shape: {waveform.shape}, Min: {waveform.min():.4f}, Max: {waveform.max():.4f}")
         
-        # Convert to torch tensor - ensure correct shape for processor
-        # The processor expects a 1D array for single audio
-        waveform_tensor = torch.from_numpy(waveform).float()
-        print(f"🎯 Tensor shape: {waveform_tensor.shape}")
-        
-        # Model input - use the raw waveform, not unsqueezed
-        print("🧠 Preparing model input...")
-        inputs = processor(
-            waveform_tensor,  # Use 1D tensor, processor will handle batching
-            sampling_rate=16000, 
-            return_tensors="pt", 
-            padding=True
-        )
-        
-        print(f"✅ Inputs prepared: {inputs.keys()}")
-        print(f"   - input_values shape: {inputs['input_values'].shape}")
+        # The batcher runs the processor and model on a batch of 1D waveforms
+        print("🧠 Running batched drone inference...")
+        with stage("inference"):
+            logits = batchers["drone"].submit(waveform)
 
         with torch.no_grad():
-            logits = model(**inputs).logits
             pred_id = torch.argmax(logits, dim=-1).item()
             label = model.config.id2label[pred_id]
             
             # Calculate confidence scores
             probabilities = torch.nn.functional.softmax(logits, dim=1)
             confidence = probabilities[0][pred_id].item()
+
+            # All class probabilities for the frontend, from the same forward pass
+            all_probs = {
+                class_name: round(probabilities[0][i].item(), 4)
+                for i, class_name in model.config.id2label.items()
+            }
             
             print(f"✅ Drone classification: {label} (confidence: {confidence:.3f})")
         
-        return label, confidence
+        return label, confidence, all_probs
         
     except Exception as e:
         print(f"❌ Error in predict_drone: {str(e)}")
         traceback.print_exc()
         raise e
+def drone_class_index(model):
+    """Index of the 'drone present' class in the classifier's labels"""
+    for i, name in model.config.id2label.items():
+        lowered = str(name).lower()
+        if "drone" in lowered and not lowered.startswith(("no", "non", "not")):
+            return int(i)
+    # Binary classifiers without a descriptive label: assume index 1 is positive
+    return 1 if len(model.config.id2label) == 2 else 0
+
+def merge_detection_windows(timeline, threshold):
+    """Merge overlapping/adjacent windows above ``threshold`` into intervals"""
+    intervals = []
+    for window in timeline:
+        p = window["drone_probability"]
+        if p < threshold:
+            continue
+        if intervals and window["start"] <= intervals[-1]["end"]:
+            current = intervals[-1]
+            current["end"] = max(current["end"], window["end"])
+            current["max_probability"] = max(current["max_probability"], p)
+            current["windows"] += 1
+        else:
+            intervals.append({"start": window["start"], "end": window["end"],
+                              "max_probability": p, "windows": 1})
+    return intervals
+
+@traced()
+def predict_drone_timeline(audio_bytes, filename=None, window_seconds=5.0, hop_seconds=2.5,
+                           threshold=0.5, batch_windows=8, block_seconds=30.0):
+    """Slide overlapping windows over a whole recording and classify each one.
+
+    The upload is decoded and resampled in blocks and windows are classified
+    in batches, so memory is bounded by one block plus one batch of windows
+    regardless of the recording length.
+    """
+    processor, model = get_drone_model()
+    sr = 16000
+    win = int(round(window_seconds * sr))
+    hop = max(1, int(round(hop_seconds * sr)))
+    positive = drone_class_index(model)
+    classes = [model.config.id2label[i] for i in range(len(model.config.id2label))]
+
+    timeline = []
+    pending, pending_starts = [], []
+
+    def flush():
+        if not pending:
+            return
+        # Through the batcher, so long recordings share the model with single clips
+        with stage("inference"):
+            logits = torch.cat(batchers["drone"].submit_many(list(pending)), dim=0)
+        probabilities = torch.nn.functional.softmax(logits, dim=1).numpy()
+        for start, probs in zip(pending_starts, probabilities):
+            timeline.append({
+                "start": round(start / sr, 3),
+                "end": round((start + win) / sr, 3),
+                "label": classes[int(np.argmax(probs))],
+                "drone_probability": round(float(probs[positive]), 4),
+                "probabilities": [round(float(p), 4) for p in probs]
+            })
+        pending.clear()
+        pending_starts.clear()
+
+    started = datetime.now()
+    buffer = np.zeros(0, dtype=np.float32)
+    buffer_offset = 0  # absolute sample index of buffer[0]
+    next_start = 0
+    total_samples = 0
+
+    for block in iter_resampled_blocks(audio_bytes, sr, block_seconds, filename):
+        total_samples += len(block)
+        buffer = np.concatenate([buffer, block])
+        while next_start + win <= buffer_offset + len(buffer):
+            local = next_start - buffer_offset
+            pending.append(buffer[local:local + win].copy())
+            pending_starts.append(next_start)
+            next_start += hop
+            if len(pending) >= batch_windows:
+                flush()
+        # Drop samples no future window can use
+        drop = next_start - buffer_offset
+        if drop > 0:
+            buffer = buffer[drop:]
+            buffer_offset = next_start
+
+    # Zero-pad the trailing partial window (or the whole clip if shorter than one window)
+    remaining = buffer_offset + len(buffer) - next_start
+    if remaining >= sr or (remaining > 0 and not timeline and not pending):
+        tail = np.zeros(win, dtype=np.float32)
+        local = next_start - buffer_offset
+        tail[:remaining] = buffer[local:local + remaining]
+        pending.append(tail)
+        pending_starts.append(next_start)
+    flush()
+
+    wall_seconds = (datetime.now() - started).total_seconds()
+    audio_seconds = total_samples / sr
+    intervals = merge_detection_windows(timeline, threshold)
+    print(f"✅ Drone timeline: {len(timeline)} windows, {len(intervals)} detections, "
+          f"{audio_seconds:.1f}s audio in {wall_seconds:.2f}s")
+
+    return {
+        "classes": classes,
+        "positive_class": classes[positive],
+        "window_seconds": window_seconds,
+        "hop_seconds": hop_seconds,
+        "threshold": threshold,
+        "timeline": timeline,
+        "detections": intervals,
+        "drone_detected": bool(intervals),
+        "audio_seconds": round(audio_seconds, 3),
+        "processing_seconds": round(wall_seconds, 3),
+        "throughput_audio_seconds_per_second": round(audio_seconds / wall_seconds, 2) if wall_seconds > 0 else None
+    }
+
+@traced()
 def analyze_sar_image(image_path, is_tiff=True):
     """
     Analyze SAR image using the provided Python code
-    Returns: original_image, generated_plot, analysis_stats
+    Returns: original_image (base64 PNG), histogram (bin counts/edges in dB), analysis_stats, metadata
     """
     try:
         if is_tiff:
-            # Process TIFF files with rasterio
-            with rasterio.open(image_path) as src:
-                img = src.read(1)  # read first band
-                
+            # Process TIFF files with rasterio: statistics stream over block
+            # windows, the preview comes from a decimated read at display size
+            with rasterio.open(image_path) as src, stage("decode"):
+                img = read_quicklook(src, max_size=SAR_DISPLAY_SIZE)
+
                 # Get image metadata
                 metadata = {
                     'width': src.width,
@@ -323,6 +615,8 @@ def analyze_sar_image(image_path, is_tiff=True):
                     'count': src.count,
                     'dtype': str(src.dtypes[0])
                 }
+            with stage("preprocess"):
+                accumulator = raster_statistics(image_path)
         else:
             # Process regular images (JPG, PNG)
             pil_img = Image.open(image_path)
@@ -337,75 +631,32 @@ def analyze_sar_image(image_path, is_tiff=True):
                 'mode': pil_img.mode,
                 'format': pil_img.format
             }
-
-        # Convert to dB scale (avoid log of zero) - This is the key SAR analysis step
-        img_db = 10 * np.log10(img.astype(np.float64) + 1e-6)
-
-        # ----------------------------
-        # Generate the analysis plot (exactly as in your Python code)
-        # ----------------------------
-        plt.figure(figsize=(12, 6))
-
-        # 1. Show image
-        plt.subplot(1, 2, 1)
-        plt.imshow(img_db, cmap="gray")
-        plt.title("SAR Quicklook")
-        plt.colorbar(label="Intensity (dB)")
-        plt.axis("off")
-
-        # 2. Histogram of intensities
-        plt.subplot(1, 2, 2)
-        plt.hist(img_db.flatten(), bins=200, color="darkorange", edgecolor="black")
-        plt.xlabel("Backscatter Intensity (dB)")
-        plt.ylabel("Number of Pixels")
-        plt.title("Histogram of Pixel Intensities")
-
-        plt.tight_layout()
-
-        # Save plot to bytes
-        plot_buffer = io.BytesIO()
-        plt.savefig(plot_buffer, format='png', dpi=150, bbox_inches='tight')
-        plot_buffer.seek(0)
-        plot_data = base64.b64encode(plot_buffer.getvalue()).decode('utf-8')
-        plt.close()
-
-        # Create display version of original image (converted to PNG)
-        original_buffer = io.BytesIO()
-        
-        if is_tiff:
-            # Convert TIFF to PNG for display using the dB scaled image
-            plt.figure(figsize=(8, 6))
-            plt.imshow(img_db, cmap="gray")
-            plt.title("SAR Image (dB Scale)")
-            plt.colorbar(label="Intensity (dB)")
-            plt.axis("off")
-            plt.tight_layout()
-            plt.savefig(original_buffer, format='png', dpi=150, bbox_inches='tight')
-            plt.close()
-        else:
-            # For regular images
-            plt.figure(figsize=(8, 6))
-            plt.imshow(img, cmap="viridis")
-            plt.title("Uploaded Image")
-            plt.colorbar(label="Intensity")
-            plt.axis("off")
-            plt.tight_layout()
-            plt.savefig(original_buffer, format='png', dpi=150, bbox_inches='tight')
-            plt.close()
-        
-        original_buffer.seek(0)
-        original_data = base64.b64encode(original_buffer.getvalue()).decode('utf-8')
-
-        # Calculate statistics (exactly as in your Python code)
-        stats = {
-            'mean': round(float(np.mean(img_db)), 4),
-            'median': round(float(np.median(img_db)), 4),
-            'min': round(float(np.min(img_db)), 4),
-            'max': round(float(np.max(img_db)), 4),
-            'std': round(float(np.std(img_db)), 4),
-            'variance': round(float(np.var(img_db)), 4)
+            accumulator = SARStatsAccumulator().update(to_db(img))
+
+        # Statistics from the streaming pass; the median comes from a 0.01 dB
+        # histogram (see median_error_bound_db)
+        stats = accumulator.stats()
+
+        # Histogram of intensities as bin counts; the frontend draws it
+        hist_counts, hist_edges = accumulator.histogram(bins=200)
+        histogram = {
+            'counts': hist_counts.tolist(),
+            'edges': [round(float(edge), 4) for edge in hist_edges],
+            'unit': 'dB'
         }
 
+        # Display version of the image, rendered directly to PNG
+        with stage("render"):
+            if is_tiff:
+                # dB scale, stretched between the scene-wide 2nd and 98th percentiles
+                vmin, vmax = (accumulator.percentile(p) for p in STRETCH_PERCENTILES)
+                png = render_quicklook(to_db(img), vmin, vmax, cmap="gray")
+                stats['display_range_db'] = [round(vmin, 4), round(vmax, 4)]
+            else:
+                # Regular images keep their raw intensities
+                png = render_quicklook(img, float(img.min()), float(img.max()), cmap="viridis")
+            original_data = png_base64(png)
+
         # Print statistics to console (for debugging)
         print("SAR Analysis Results:")
         print("Mean:", stats['mean'])
@@ -414,7 +665,7 @@ def analyze_sar_image(image_path, is_tiff=True):
         print("Max:", stats['max'])
         print("Std:", stats['std'])
 
-        return original_data, plot_data, stats, metadata
+        return original_data, histogram, stats, metadata
 
     except Exception as e:
         raise Exception(f"Error in SAR analysis: {str(e)}")
@@ -423,48 +674,16 @@ def analyze_sar_image(image_path, is_tiff=True):
 # Voice Gender Classification - ECAPA-TDNN Integration
 # =============================================================================
 
-# Load Voice Gender Classification Model
-try:
-    # Load the model
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    voice_model = ECAPA_gender(C=1024)
-    
-    # Load the trained weights
-    model_path = "gender_classifier.model"
-    if os.path.exists(model_path):
-        voice_model.load_state_dict(torch.load(model_path, map_location=device))
-        voice_model.to(device)
-        voice_model.eval()
-        print("✅ ECAPA-TDNN Voice Gender Classification Model loaded successfully")
-        print(f"✅ Model device: {device}")
-    else:
-        print(f"❌ Model file not found: {model_path}")
-        voice_model = None
-        
-except Exception as e:
-    print(f"❌ Error loading voice gender model: {e}")
-    traceback.print_exc()
-    voice_model = None
-
-def preprocess_audio_for_ecapa(audio_path, target_sr=16000, duration=3.0):
-    """Preprocess audio for ECAPA-TDNN model"""
+@traced()
+def preprocess_audio_for_ecapa(audio, target_sr=16000, duration=3.0):
+    """Preprocess a DecodedAudio clip for the ECAPA-TDNN model"""
     try:
-        print(f"🔄 Preprocessing audio: {audio_path}")
-        
-        # Load audio using torchaudio (matching your model's load_audio method)
-        audio, sr = torchaudio.load(audio_path)
-        print(f"✅ Audio loaded - original shape: {audio.shape}, sample rate: {sr}")
+        print(f"🔄 Preprocessing audio: {len(audio.samples)} samples at {audio.samplerate}Hz")
         
-        # Resample if necessary
-        if sr != target_sr:
-            print(f"🔄 Resampling from {sr}Hz to {target_sr}Hz")
-            resampler = torchaudio.transforms.Resample(orig_freq=sr, new_freq=target_sr)
-            audio = resampler(audio)
-        
-        # Convert to mono
-        if audio.shape[0] > 1:
-            print("🔄 Converting stereo to mono")
-            audio = audio.mean(dim=0, keepdim=True)
+        # Mono float32 at the model rate, resampled once and shared with other consumers
+        if audio.samplerate != target_sr:
+            print(f"🔄 Resampling from {audio.samplerate}Hz to {target_sr}Hz")
+        audio = audio.tensor(target_sr)
         
         # Ensure minimum length
         min_samples = int(target_sr * 1.0)  # At least 1 second
@@ -491,26 +710,26 @@ def preprocess_audio_for_ecapa(audio_path, target_sr=16000, duration=3.0):
         traceback.print_exc()
         raise Exception(f"Audio preprocessing failed: {str(e)}")
     
-def predict_voice_gender_ecapa(audio_path):
-    """Predict voice gender using ECAPA-TDNN model"""
+@traced()
+def predict_voice_gender_ecapa(audio):
+    """Predict voice gender of a DecodedAudio clip using ECAPA-TDNN model"""
     try:
+        voice_model = models.get("voice")
         if voice_model is None:
             raise Exception("Voice model not loaded")
         
-        print(f"🎯 Starting voice prediction for: {audio_path}")
+        print(f"🎯 Starting voice prediction ({audio.duration:.2f}s)")
         
         # Preprocess audio
-        audio_tensor = preprocess_audio_for_ecapa(audio_path)
+        with stage("preprocess"):
+            audio_tensor = preprocess_audio_for_ecapa(audio)
         print(f"✅ Audio preprocessed - shape: {audio_tensor.shape}")
         
-        # Move to appropriate device
-        audio_tensor = audio_tensor.to(device)
-        print(f"✅ Audio moved to device: {device}")
-        
         # Run inference
         with torch.no_grad():
             print("🧠 Running model inference...")
-            outputs = voice_model(audio_tensor)
+            with stage("inference"):
+                outputs = batchers["voice"].submit(audio_tensor)
             print(f"✅ Model output shape: {outputs.shape}")
             print(f"✅ Raw outputs: {outputs}")
             
@@ -552,38 +771,38 @@ def predict_voice_gender_ecapa(audio_path):
 # Main Routes - Serve All HTML Pages
 # =============================================================================
 
-@app.route("/")
+@api.route("/")
 def home():
     """Serve main landing page"""
     return send_file("index.html")
 
-@app.route("/ecg")
+@api.route("/ecg")
 def ecg_page():
     """Serve ECG analysis page"""
     return send_file("ecg.html")
 
-@app.route("/eeg")
+@api.route("/eeg")
 def eeg_page():
     """Serve EEG analysis page"""
     return send_file("eeg.html")
 
-@app.route("/doppler-analysis")
+@api.route("/doppler-analysis")
 def doppler_analysis():
     """Serve Doppler analysis page"""
     return send_file("doppler-analysis.html")
 
-@app.route("/spectro")
+@api.route("/spectro")
 def spectro():
     """Serve spectrogram analysis page"""
     return send_file("spectro.html")
 
-@app.route("/drone-sar-analysis")
+@api.route("/drone-sar-analysis")
 def drone_sar_analysis():
     """Serve drone and SAR analysis page"""
     return send_file("drone-sar-analysis.html")
 
 # Serve any other HTML pages you have
-@app.route("/<page_name>.html")
+@api.route("/<page_name>.html")
 def serve_html(page_name):
     """Serve any HTML page by name"""
     try:
@@ -595,28 +814,28 @@ def serve_html(page_name):
 # Static File Serving
 # =============================================================================
 
-@app.route('/js/<path:filename>')
+@api.route('/js/<path:filename>')
 def serve_js(filename):
     """Serve JavaScript files"""
     return send_from_directory('js', filename)
 
-@app.route('/css/<path:filename>')
+@api.route('/css/<path:filename>')
 def serve_css(filename):
     """Serve CSS files"""
     return send_from_directory('css', filename)
 
-@app.route('/images/<path:filename>')
+@api.route('/images/<path:filename>')
 def serve_images(filename):
     """Serve image files"""
     return send_from_directory('images', filename)
 
-@app.route('/icons/<path:filename>')
+@api.route('/icons/<path:filename>')
 def serve_icons(filename):
     """Serve icon files"""
     return send_from_directory('icons', filename)
 
 # Serve any other static files
-@app.route('/<path:filename>')
+@api.route('/<path:filename>')
 def serve_static_files(filename):
     """Serve any static files (fallback)"""
     try:
@@ -628,17 +847,26 @@ def serve_static_files(filename):
 # Health Check & System Info
 # =============================================================================
 
-@app.route("/api/health", methods=["GET"])
+@api.route("/api/health", methods=["GET"])
 def health_check():
     return jsonify({
         "message": "Multi-Model Medical Analysis API is running",
         "status": "healthy",
         "models_loaded": {
-            "ecg_model": ecg_model is not None,
-            "eeg_model": eeg_model is not None,
-            "drone_model": model is not None,
-            "voice_gender_model": voice_model is not None
+            "ecg_model": models.is_loaded("ecg"),
+            "eeg_model": models.is_loaded("eeg"),
+            "drone_model": models.is_loaded("drone"),
+            "voice_gender_model": models.is_loaded("voice")
         },
+        "models": models.status(),
+        "batching": {name: b.stats() for name, b in batchers.items()},
+        "resampler_cache": resampler_cache.stats(),
+        "jobs": jobs.stats(),
+        "result_cache": result_cache.stats(),
+        "tracing": tracer.stats(),
+        "spectro_tile_cache": spectro_tile_cache.stats(),
+        "simulate_cache": simulate_cache.stats(),
+        "sar_tile_cache": sar_tile_cache.stats(),
         "upload_directory": UPLOAD_DIR,
         "supported_applications": [
             "ECG Analysis", 
@@ -651,67 +879,339 @@ def health_check():
         "timestamp": datetime.now().isoformat()
     })
 
+@api.route("/api/batching/stats", methods=["GET"])
+def batching_stats():
+    """Queue depth and batch-size statistics for each model's batcher"""
+    return jsonify({
+        "batchers": {name: b.stats() for name, b in batchers.items()},
+        "timestamp": datetime.now().isoformat()
+    })
+
 # =============================================================================
-# ECG Analysis Endpoints
+# Metrics
 # =============================================================================
+# Prometheus text format at /metrics: request latency, status, in-flight and
+# payload-size series per route, stage timers from the handlers (see
+# metrics.stage) and scrape-time gauges for models, batchers, caches and jobs.
+
+request_seconds = metrics.histogram(
+    "deepsignal_request_duration_seconds", "Request latency by route.", labels=("route", "method"))
+requests_total = metrics.counter(
+    "deepsignal_requests_total", "Requests served by route and status code.", labels=("route", "method", "status"))
+requests_in_flight = metrics.gauge(
+    "deepsignal_requests_in_flight", "Requests currently being handled.", labels=("route",))
+request_bytes = metrics.histogram(
+    "deepsignal_request_size_bytes", "Request body size.", labels=("route",), buckets=SIZE_BUCKETS)
+response_bytes = metrics.histogram(
+    "deepsignal_response_size_bytes", "Response body size (when known up front).", labels=("route",),
+    buckets=SIZE_BUCKETS)
+
+def collect_service_metrics(registry):
+    model_load = registry.gauge("deepsignal_model_load_seconds", "Duration of the last model load.", ("model",))
+    model_loaded = registry.gauge("deepsignal_model_loaded", "1 if the model is loaded, else 0.", ("model",))
+    for name, info in models.status().items():
+        model_loaded.set(1 if info["loaded"] else 0, model=name)
+        if info["load_time_s"] is not None:
+            model_load.set(info["load_time_s"], model=name)
+
+    queue_depth = registry.gauge("deepsignal_batcher_queue_depth", "Inputs waiting for a batch.", ("model",))
+    batch_size = registry.gauge("deepsignal_batcher_mean_batch_size", "Mean inference batch size.", ("model",))
+    for name, batcher in batchers.items():
+        info = batcher.stats()
+        queue_depth.set(info["queue_depth"], model=name)
+        batch_size.set(info["mean_batch_size"], model=name)
+
+    cache_entries = registry.gauge("deepsignal_cache_entries", "Entries held by an in-memory cache.", ("cache",))
+    cache_bytes = registry.gauge("deepsignal_cache_bytes", "Bytes held by an in-memory cache.", ("cache",))
+    cache_hit_rate = registry.gauge("deepsignal_cache_hit_rate", "Lifetime hit rate of a cache.", ("cache",))
+    caches = {
+        "results": result_cache.memory,
+        "resampler": resampler_cache,
+        "spectro_tiles": spectro_tile_cache,
+        "simulate": simulate_cache,
+        "sar_tiles": sar_tile_cache,
+    }
+    for name, cache in caches.items():
+        info = cache.stats()
+        cache_entries.set(info["entries"], cache=name)
+        cache_bytes.set(info.get("bytes", 0), cache=name)
+        cache_hit_rate.set(info["hit_rate"], cache=name)
+
+    job_count = registry.gauge("deepsignal_jobs", "Background jobs by status.", ("status",))
+    counts = jobs.stats()["jobs"]
+    # Every status on every scrape, so a count that drops to zero is not left stale
+    for status in JOB_STATUSES:
+        job_count.set(counts.get(status, 0), status=status)
+
+metrics.add_collector(collect_service_metrics)
+
+@api.before_app_request
+def start_request_metrics():
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    g.metrics_route = route
+    g.metrics_start = time.perf_counter()
+    set_route(route)
+    requests_in_flight.inc(route=route)
+    if request.content_length:
+        request_bytes.observe(request.content_length, route=route)
+
+@api.after_app_request
+def record_response_metrics(response):
+    g.metrics_status = response.status_code
+    if response.content_length is not None:
+        response_bytes.observe(response.content_length, route=g.get("metrics_route", "<unmatched>"))
+    return response
 
-@app.route("/api/analyze_ecg", methods=["POST"])
-def analyze_ecg():
-    """Analyze ECG signals from CSV files"""
-    try:
-        if ecg_model is None:
-            return jsonify({"error": "ECG Model not loaded"}), 500
-        
-        file = request.files["file"]
-        df = pd.read_csv(file, header=0)
-
-        # Normalize column names
-        df.columns = [c.strip().upper() for c in df.columns]
-        expected_leads = ["I","II","III","AVR","AVL","AVF","V1","V2","V3","V4","V5","V6"]
+@api.teardown_app_request
+def finish_request_metrics(exc=None):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return
+    route = g.metrics_route
+    request_seconds.observe(time.perf_counter() - start, route=route, method=request.method)
+    requests_total.inc(route=route, method=request.method, status=g.get("metrics_status", 500))
+    requests_in_flight.dec(route=route)
+    set_route(None)
+
+@api.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
-        # Keep only expected leads
-        df = df[[c for c in df.columns if c in expected_leads]]
+# =============================================================================
+# Request Tracing
+# =============================================================================
+# TRACE_ENABLED=1 records a span tree for every request; those slower than
+# TRACE_SLOW_MS are kept (last TRACE_BUFFER) for /debug/traces. trace=1 on any
+# request traces and keeps that one request even when tracing is off.
+#
+# Traces expose paths, sizes and timings of other clients' requests, so the
+# /debug/traces routes and trace=1 are only honoured from localhost, or from
+# anywhere with an X-Debug-Token header matching TRACE_DEBUG_TOKEN. Other
+# callers get a 404 and their trace=1 is ignored.
+
+TRACE_DEBUG_TOKEN = os.environ.get("TRACE_DEBUG_TOKEN") or None
+LOOPBACK_ADDRS = ("127.0.0.1", "::1")
+
+def debug_authorized():
+    """True for requests allowed to force traces and read the trace buffer"""
+    token = request.headers.get("X-Debug-Token")
+    if TRACE_DEBUG_TOKEN and token:
+        return hmac.compare_digest(token.encode("utf-8"), TRACE_DEBUG_TOKEN.encode("utf-8"))
+    return request.remote_addr in LOOPBACK_ADDRS
+
+def debug_not_found():
+    return jsonify({"error": "Not found"}), 404
+
+@api.before_app_request
+def start_request_trace():
+    force = request.args.get("trace") == "1" and debug_authorized()
+    route = request.url_rule.rule if request.url_rule is not None else request.path
+    trace = tracer.start(f"{request.method} {route}", force=force,
+                         path=request.path, bytes=request.content_length)
+    g.trace, g.trace_forced = trace, force
+    if trace is not None and request.mimetype == "multipart/form-data":
+        # Parse the upload now so its time is not charged to the handler
+        with span("upload", bytes=request.content_length):
+            request.files
+
+@api.after_app_request
+def tag_request_trace(response):
+    trace = g.get("trace")
+    if trace is not None:
+        trace.root.set(status=response.status_code)
+        response.headers["X-Trace-Id"] = trace.id
+    return response
 
-        # Fill missing leads with zeros
-        for lead in expected_leads:
-            if lead not in df.columns:
-                df[lead] = 0.0
-        df = df[expected_leads]
+@api.teardown_app_request
+def finish_request_trace(exc=None):
+    trace = g.pop("trace", None)
+    if trace is not None:
+        tracer.finish(trace, error=exc, keep=g.get("trace_forced", False))
+
+@api.route("/debug/traces", methods=["GET"])
+def list_traces():
+    """Slowest recent requests (newest first), without their span trees"""
+    if not debug_authorized():
+        return debug_not_found()
+    return jsonify({
+        "tracing": tracer.stats(),
+        "traces": [trace.summary() for trace in tracer.traces()],
+    })
 
-        # Convert to numpy
-        ecg_array = df.to_numpy().astype(np.float32)
+@api.route("/debug/traces/<trace_id>", methods=["GET"])
+def get_trace(trace_id):
+    if not debug_authorized():
+        return debug_not_found()
+    trace = tracer.get(trace_id)
+    if trace is None:
+        return jsonify({"error": "Trace not found or evicted"}), 404
+    return jsonify(trace.to_dict())
+
+@api.route("/debug/traces", methods=["DELETE"])
+def clear_traces():
+    if not debug_authorized():
+        return debug_not_found()
+    tracer.clear()
+    return jsonify({"message": "Trace buffer cleared"})
 
-        # Pad or truncate to 4096 samples
-        if ecg_array.shape[0] < 4096:
-            pad_len = 4096 - ecg_array.shape[0]
-            ecg_array = np.pad(ecg_array, ((0, pad_len), (0, 0)), mode="constant")
-        if ecg_array.shape[0] > 4096:
-            ecg_array = ecg_array[:4096, :]
+# =============================================================================
+# Background Jobs
+# =============================================================================
+# Heavy endpoints (/upload_car, /sar/analyze) accept async=1 to run on a
+# bounded background pool instead of holding the request worker. Status and
+# results are persisted under UPLOAD_DIR/jobs, so any worker can answer a poll.
+
+jobs = JobManager(
+    max_workers=int(os.environ.get("JOB_WORKERS", 2)),
+    max_pending=int(os.environ.get("JOB_MAX_PENDING", 32)),
+    ttl_seconds=float(os.environ.get("JOB_RESULT_TTL", 600)),
+    store_dir=os.path.join(UPLOAD_DIR, "jobs")
+)
+
+def wants_async():
+    """True if the client opted into async mode (async=1/true/yes)"""
+    return str(request.values.get("async", "")).lower() in ("1", "true", "yes")
+
+def submit_job(kind, fn, *args):
+    """Queue fn(*args) as a background job and return the 202 response"""
+    try:
+        job = jobs.submit(kind, run_traced, f"job {kind}", fn, *args)
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    print(f"🧵 Queued {kind} job {job.id}")
+    response = job.to_dict(include_result=False)
+    response["status_url"] = f"/api/jobs/{job.id}"
+    return jsonify(response), 202
 
-        # If only 1 lead, tile to 12
-        if ecg_array.shape[1] == 1:
-            ecg_array = np.tile(ecg_array, (1, 12))
+# =============================================================================
+# Result Cache
+# =============================================================================
+# Analysis results keyed by upload hash + endpoint + parameters + model
+# version. Set RESULT_CACHE_DIR to share results between worker processes,
+# RESULT_CACHE_ENABLED=0 to turn caching off; cache=0 bypasses it per request.
+
+result_cache = ResultCache(
+    max_entries=int(os.environ.get("RESULT_CACHE_ENTRIES", 512)),
+    max_bytes=int(float(os.environ.get("RESULT_CACHE_MB", 128)) * 1024 * 1024),
+    disk_dir=os.environ.get("RESULT_CACHE_DIR") or None,
+    enabled=os.environ.get("RESULT_CACHE_ENABLED", "1").lower() not in ("0", "false", "no"),
+)
+
+def upload_params(file, **params):
+    """Cache-key parameters: the request's options plus the upload's extension"""
+    params["ext"] = os.path.splitext(file.filename or "")[1].lower()
+    return params
+
+def cached_response(endpoint, content_hash, params, model, compute, algo_version=None):
+    """compute() as JSON through the result cache; X-Result-Cache reports the source.
+
+    Cached bodies are served as stored bytes, without a parse/serialize round
+    trip; hits carry no timestamp or timing fields (see result_cache.VOLATILE_KEYS).
+    The key holds the model's weights version (registry metadata; the model is
+    only loaded by ``compute`` on a miss) and ``algo_version`` for endpoints
+    whose results come from code rather than weights.
+    """
+    if str(request.values.get("cache", "1")).lower() in ("0", "false", "no"):
+        result = compute()
+        with stage("serialize"):
+            response = jsonify(result)
+        response.headers["X-Result-Cache"] = "bypass"
+        return response
+
+    version = [models.version(model) if model else None, algo_version]
+    key = result_cache.make_key(endpoint, content_hash, params, version)
+    with span("result_cache") as cache_span:
+        body, source = result_cache.get_or_compute(key, compute)
+        cache_span.set(source=source)
+    response = Response(body, mimetype="application/json")
+    response.headers["X-Result-Cache"] = source
+    return response
 
-        # Prepare for model
-        ecg_input = np.expand_dims(ecg_array, axis=0)
+@api.route("/api/cache/stats", methods=["GET"])
+def result_cache_stats():
+    return jsonify(result_cache.stats())
+
+@api.route("/api/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Poll a background job for status, progress and (once done) its result"""
+    job = jobs.get(job_id)
+    if job is not None:
+        return jsonify(job.to_dict())
+    # Submitted to another worker process: serve its persisted status
+    body = jobs.load(job_id)
+    if body is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    return Response(body, mimetype="application/json")
 
-        # Prediction
-        probs = ecg_model.predict(ecg_input)
+# =============================================================================
+# ECG Analysis Endpoints
+# =============================================================================
 
-        # Classification
-        if all(p < 0.5 for p in probs[0]):
-            normal_abnormal = "Normal"
-        else:
-            normal_abnormal = "Abnormal"
+@api.route("/api/analyze_ecg", methods=["POST"])
+def analyze_ecg():
+    """Analyze ECG signals from CSV, .npy/.npz or raw float32 (.bin/.ecg) files"""
+    try:
+        if "file" not in request.files:
+            return jsonify({"error": "No file uploaded"}), 400
+        file = request.files["file"]
+        content_hash = hash_stream(file.stream)
 
-        best_index = int(np.argmax(probs[0]))
+        # Segmented mode: classify the whole recording window by window
+        if request.values.get("mode") == "segmented":
+            try:
+                stride = int(request.values.get("stride", ECG_SAMPLES))
+            except ValueError:
+                return jsonify({"error": "stride must be an integer number of samples"}), 400
+            if stride < ECG_MIN_STRIDE:
+                return jsonify({"error": f"stride must be at least {ECG_MIN_STRIDE} samples"}), 400
+
+            def compute_segments():
+                _require_model("ecg")
+                with stage("decode") as parse:
+                    recording, upload_info = load_ecg_array(file, max_rows=None)
+                result = predict_ecg_segments(recording, stride)
+                result["input"] = upload_info
+                result["timing"]["parse_ms"] = round(parse.ms, 3)
+                return result
+
+            return cached_response("analyze_ecg", content_hash,
+                                   upload_params(file, mode="segmented", stride=stride), "ecg", compute_segments)
+
+        def compute():
+            _require_model("ecg")  # loaded on a cache miss only
+            # Parse straight into the (4096, 12) float32 model input
+            with stage("decode") as parse:
+                ecg_array, upload_info = load_ecg_array(file)
+                ecg_array = fit_ecg_input(ecg_array)
+            parse_ms = parse.ms
+
+            # Prediction (batched with concurrent requests)
+            with stage("inference") as inference:
+                probs = np.expand_dims(batchers["ecg"].submit(ecg_array), axis=0)
+            inference_ms = inference.ms
+            print(f"⏱️ ECG {upload_info['format']}: parse {parse_ms:.1f} ms, inference {inference_ms:.1f} ms")
+
+            # Classification
+            if all(p < 0.5 for p in probs[0]):
+                normal_abnormal = "Normal"
+            else:
+                normal_abnormal = "Abnormal"
+
+            best_index = int(np.argmax(probs[0]))
+
+            return {
+                "normal_abnormal": normal_abnormal,
+                "best_class": ecg_labels[best_index],
+                "best_prob": float(probs[0][best_index]),
+                "all_probabilities": {ecg_labels[i]: float(probs[0][i]) for i in range(len(ecg_labels))},
+                "input": upload_info,
+                "timing": {
+                    "parse_ms": round(parse_ms, 3),
+                    "inference_ms": round(inference_ms, 3)
+                }
+            }
 
-        return jsonify({
-            "normal_abnormal": normal_abnormal,
-            "best_class": ecg_labels[best_index],
-            "best_prob": float(probs[0][best_index]),
-            "all_probabilities": {ecg_labels[i]: float(probs[0][i]) for i in range(len(ecg_labels))}
-        })
+        return cached_response("analyze_ecg", content_hash, upload_params(file), "ecg", compute)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -720,7 +1220,7 @@ def analyze_ecg():
 # EEG Analysis Endpoints
 # =============================================================================
 
-@app.route("/api/upload", methods=["POST"])
+@api.route("/api/upload", methods=["POST"])
 def upload_file():
     """Endpoint specifically for file upload without processing"""
     if "file" not in request.files:
@@ -757,13 +1257,10 @@ def upload_file():
         print(f"❌ Upload error: {str(e)}")
         return jsonify({"error": f"Upload failed: {str(e)}"}), 500
 
-@app.route('/api/classify_eeg', methods=['POST'])
+@api.route('/api/classify_eeg', methods=['POST'])
 def classify_eeg():
     """Classify EEG signals from uploaded files"""
     try:
-        if eeg_model is None:
-            return jsonify({'error': 'EEG Model not loaded'}), 500
-
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
 
@@ -771,31 +1268,35 @@ def classify_eeg():
         if file.filename == '':
             return jsonify({'error': 'Empty filename'}), 400
 
-        # Secure and temporarily save file
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(tempfile.gettempdir(), filename)
-        file.save(temp_path)
-        print(f"📁 Uploaded EEG file saved to: {temp_path}")
-
-        # Load signal
-        signal = np.load(temp_path, allow_pickle=True)
-        print(f"📊 Loaded EEG signal shape: {signal.shape}")
-
-        # Preprocess
-        tensor = preprocess_eeg_signal(signal)
-
-        # Run model inference
-        results = run_eeg_model_inference(tensor)
+        content_hash = hash_stream(file.stream)
 
-        # Clean up
-        os.remove(temp_path)
+        def compute():
+            _require_model("eeg")  # loaded on a cache miss only
+            # Load without a temp copy; large .npy uploads are memory-mapped
+            with stage("decode"):
+                if file.filename.lower().endswith('.npz'):
+                    # Uploads are untrusted: never unpickle object arrays
+                    with np.load(io.BytesIO(file.read()), allow_pickle=False) as data:
+                        signal = data[data.files[0]]  # Get first array
+                else:
+                    signal = open_npy_upload(file.stream, allow_pickle=False)
+            print(f"📊 Loaded EEG signal shape: {signal.shape}")
+
+            # Preprocess and run model inference chunk by chunk
+            results = run_eeg_model_inference(signal)
+
+            return {
+                'prediction': results['prediction'],
+                'confidence': results['confidence'],
+                'probabilities': results['all_probabilities'],
+                'vote_counts': results['vote_counts'],
+                'trial_predictions': results['trial_predictions'],
+                'n_trials': results['n_trials'],
+                'inference_seconds': results['inference_seconds'],
+                'trials_per_second': results['trials_per_second']
+            }
 
-        # Return JSON response
-        return jsonify({
-            'prediction': results['prediction'],
-            'confidence': results['confidence'],
-            'probabilities': results['all_probabilities']
-        })
+        return cached_response("classify_eeg", content_hash, upload_params(file), "eeg", compute)
 
     except Exception as e:
         print(f"❌ EEG Classification Error: {str(e)}")
@@ -806,7 +1307,7 @@ def classify_eeg():
 # File Management Endpoints
 # =============================================================================
 
-@app.route("/api/files", methods=["GET"])
+@api.route("/api/files", methods=["GET"])
 def list_files():
     """List all uploaded files"""
     try:
@@ -830,7 +1331,7 @@ def list_files():
     except Exception as e:
         return jsonify({"error": f"Could not list files: {str(e)}"}), 500
 
-@app.route("/api/files/<filename>", methods=["DELETE"])
+@api.route("/api/files/<filename>", methods=["DELETE"])
 def delete_file(filename):
     """Delete a specific uploaded file"""
     try:
@@ -850,101 +1351,187 @@ def delete_file(filename):
 # Doppler Analysis Endpoints
 # =============================================================================
 
-@app.route('/simulate', methods=['POST'])
+# Bump when the analysis output changes (tracker, transport, ...): it is part
+# of the result-cache key, and RESULT_CACHE_DIR outlives deploys
+DOPPLER_ALGO_VERSION = "2"
+
+# Identical demo requests from the Doppler page are served from memory
+SIMULATE_CACHE_MAX_ITEM = int(float(os.environ.get("SIMULATE_CACHE_MAX_ITEM_MB", 16)) * 1024 * 1024)
+simulate_cache = LRUCache(
+    max_entries=int(os.environ.get("SIMULATE_CACHE_ENTRIES", 32)),
+    max_bytes=int(float(os.environ.get("SIMULATE_CACHE_MB", 128)) * 1024 * 1024),
+    name="simulate",
+)
+
+def stream_passby_wav(passby, cache_key):
+    """Yield the WAV header and PCM blocks; cache the file if it is small enough."""
+    header = passby.wav_header()
+    keep = [header] if passby.wav_size() <= SIMULATE_CACHE_MAX_ITEM else None
+    yield header
+    for chunk in passby.pcm16_blocks():
+        if keep is not None:
+            keep.append(chunk)
+        yield chunk
+    if keep is not None:
+        simulate_cache.put(cache_key, b"".join(keep))
+
+@api.route('/simulate', methods=['POST'])
 def simulate():
     data = request.get_json()
-    sig_type = int(data['type'])
-    f_engine = float(data['freq'])
-    v_car = float(data['speed'])
-    d_perp = float(data['dist'])
-
-    fs = 44100
-    c = 343.0
-    alpha = 1.0
-    x_start = -200.0
-    x_end = 200.0
-
-    # حساب المدة
-    duration = abs(x_end - x_start) / v_car
-    t = np.linspace(0.0, duration, int(fs * duration), endpoint=False)
-    x = x_start + v_car * t
-    d = np.sqrt(x ** 2 + d_perp ** 2)
-
-    # حساب تأثير دوبلر
-    v_radial = - (x * v_car) / (d + 1e-12)
-
-    # توليد الإشارة بناءً على النوع
-    if sig_type == 1:
-        # Realistic car engine
-        f_inst = f_engine * (c / (c - v_radial))
-        f_inst = np.clip(f_inst, 20.0, fs / 4.0)
-        phase = 2.0 * np.pi * np.cumsum(f_inst) / fs
-
-        harm_amps = [1.0, 0.6, 0.35, 0.18, 0.1]
-        signal = np.zeros_like(t)
-        for k, amp in enumerate(harm_amps, start=1):
-            signal += amp * np.sin(k * phase)
-        # إضافة ضوضاء خفيفة
-        noise = np.random.normal(0.0, 1.0, len(t))
-        noise = np.convolve(noise, np.ones(fs // 4000) / (fs // 4000), mode='same')
-        signal += 0.25 * noise
-
-    elif sig_type == 2:
-        # Square wave
-        f_inst = f_engine * (c / (c - v_radial))
-        f_inst = np.clip(f_inst, 20.0, fs / 4.0)
-        phase = 2.0 * np.pi * np.cumsum(f_inst) / fs
-        signal = np.sign(np.sin(phase))
-
-    elif sig_type == 3:
-        # Sawtooth wave
-        f_inst = f_engine * (c / (c - v_radial))
-        f_inst = np.clip(f_inst, 20.0, fs / 4.0)
-        phase = 2.0 * np.pi * np.cumsum(f_inst) / fs
-        signal = 2 * ((phase / (2 * np.pi)) % 1) - 1
-
-    elif sig_type == 4:
-        # 🚑 Ambulance siren - الإصلاح هنا
-        f1, f2 = 700, 900  # ترددات الصفارة
-        tone_period = 0.3  # فترة التبديل بين الترددين (بالثواني)
-
-        # إنشاء مصفوفة التبديل بين الترددين
-        tone_switch = np.floor(t / tone_period) % 2
-        f_siren = np.where(tone_switch == 0, f1, f2)
-
-        # تطبيق تأثير دوبلر على كل تردد
-        f_inst = f_siren * (c / (c - v_radial))
-        f_inst = np.clip(f_inst, 20.0, fs / 4.0)
-
-        # حساب الطور بشكل صحيح
-        phase = 2.0 * np.pi * np.cumsum(f_inst) / fs
-        signal = np.sin(phase)
+    try:
+        key = (int(data['type']), float(data['freq']), float(data['speed']), float(data['dist']))
+        passby = PassBy(*key)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid simulation parameters: {e}"}), 400
+
+    cached = simulate_cache.get(key)
+    if cached is not None:
+        return Response(cached, mimetype="audio/wav")
+
+    # Synthesized block by block (continuous phase) and streamed as it is made
+    response = Response(stream_passby_wav(passby, key), mimetype="audio/wav")
+    response.headers["Content-Length"] = str(passby.wav_size())
+    return response
 
-    else:
-        # Default sine wave
-        f_inst = f_engine * (c / (c - v_radial))
-        f_inst = np.clip(f_inst, 20.0, fs / 4.0)
-        phase = 2.0 * np.pi * np.cumsum(f_inst) / fs
-        signal = np.sin(phase)
-
-    # تطبيق التوهين والتلاشي
-    att = 1.0 / (d ** alpha + 1e-12)
-    fade = np.ones_like(t)
-    ramp = int(0.02 * fs)
-    fade[:ramp] = np.linspace(0.0, 1.0, ramp)
-    fade[-ramp:] = np.linspace(1.0, 0.0, ramp)
-    signal *= att * fade
-
-    # تطبيع الإشارة
-    signal = signal / np.max(np.abs(signal))
-
-    # حفظ كملف WAV وإرجاعه
-    buf = io.BytesIO()
-    sf.write(buf, signal, fs, format='WAV')
-    buf.seek(0)
-    return send_file(buf, mimetype="audio/wav")
-
-@app.route('/upload_car', methods=['POST'])
+# Labelled training sets over parameter grids, built as background jobs.
+# Size is bounded per clip and in total; finished archives are deleted after
+# DATASET_TTL seconds.
+DATASET_DIR = os.path.join(UPLOAD_DIR, "datasets")
+DATASET_MAX_CLIPS = int(os.environ.get("DATASET_MAX_CLIPS", 20000))
+DATASET_MAX_CLIP_SECONDS = float(os.environ.get("DATASET_MAX_CLIP_SECONDS", 60))
+DATASET_SAMPLE_RATES = (1000, 96000)
+DATASET_MAX_SAMPLES = int(float(os.environ.get("DATASET_MAX_SAMPLES", 5e8)))  # 1 GB of int16
+DATASET_WORKERS = min(int(os.environ.get("DATASET_WORKERS", 4)), os.cpu_count() or 1)
+DATASET_TTL = float(os.environ.get("DATASET_TTL", 24 * 3600))
+
+@traced()
+def build_doppler_dataset(params, progress=lambda *args: None):
+    name = f"doppler_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.urandom(4).hex()}.npz"
+    summary = generate_dataset(os.path.join(DATASET_DIR, name), workers=DATASET_WORKERS,
+                               progress=progress, **params)
+    summary["path"] = name
+    summary["download_url"] = f"/api/doppler/dataset/{name}"
+    return summary
+
+@api.route('/api/doppler/dataset', methods=['POST'])
+def doppler_dataset():
+    """Queue a dataset build; body holds lists for types/freqs/speeds/dists plus options"""
+    data = request.get_json(silent=True) or {}
+    grid = {key: data.get(key, default) for key, default in
+            (("types", [0]), ("freqs", [440.0]), ("speeds", [20.0]), ("dists", [10.0]))}
+    options = {key: data[key] for key in ("repeats", "clip_seconds", "sample_rate", "jitter_seconds",
+                                          "alpha", "normalize", "seed") if key in data}
+    try:
+        n_clips = len(parameter_grid(repeats=options.get("repeats", 1), **grid)["type"])
+        clip_seconds = float(options.get("clip_seconds", 4.0))
+        sample_rate = int(options.get("sample_rate", 16000))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid parameter grid: {e}"}), 400
+    if n_clips > DATASET_MAX_CLIPS:
+        return jsonify({"error": f"Grid has {n_clips} clips; the limit is {DATASET_MAX_CLIPS}"}), 400
+    if not 0 < clip_seconds <= DATASET_MAX_CLIP_SECONDS:
+        return jsonify({"error": f"clip_seconds must be in (0, {DATASET_MAX_CLIP_SECONDS:g}]"}), 400
+    if not DATASET_SAMPLE_RATES[0] <= sample_rate <= DATASET_SAMPLE_RATES[1]:
+        return jsonify({"error": f"sample_rate must be in [{DATASET_SAMPLE_RATES[0]}, {DATASET_SAMPLE_RATES[1]}]"}), 400
+    total_samples = n_clips * int(round(clip_seconds * sample_rate))
+    if total_samples > DATASET_MAX_SAMPLES:
+        return jsonify({"error": f"Dataset would hold {total_samples} samples; the limit is {DATASET_MAX_SAMPLES}. "
+                                 f"Use fewer clips, shorter clips or a lower sample_rate"}), 400
+    options.update(clip_seconds=clip_seconds, sample_rate=sample_rate)
+
+    prune_expired_files(DATASET_DIR, DATASET_TTL)
+    return submit_job("doppler_dataset", build_doppler_dataset, {**grid, **options})
+
+@api.route('/api/doppler/dataset/<name>', methods=['GET'])
+def download_doppler_dataset(name):
+    return send_from_directory(os.path.abspath(DATASET_DIR), secure_filename(name), as_attachment=True)
+
+@traced()
+def compute_car_doppler(audio_bytes, filename=None, progress=lambda *args: None):
+    """Estimate vehicle speed from a pass-by recording (Doppler shift of the dominant tone).
+
+    Returns numpy arrays; ``analyze_car_audio`` and the binary transport
+    convert them for the wire.
+    """
+    # Decode once in memory and analyse at 44.1 kHz
+    sr = 44100
+    with stage("decode"):
+        y = decode_audio(audio_bytes, filename).resampled(sr)
+    progress(0.1, "decoded")
+
+    # STFT parameters - high resolution, with the hop growing for long
+    # recordings so the frame count stays bounded
+    n_fft, hop_length = choose_stft_params(len(y))
+
+    with stage("preprocess"):
+        D = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+        DB = librosa.amplitude_to_db(D, ref=np.max)
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    times = librosa.frames_to_time(np.arange(D.shape[1]), sr=sr, hop_length=hop_length)
+
+    progress(0.4, "stft")
+
+    # Define frequency range
+    freq_min, freq_max = 100, 10000
+    freq_mask = (freqs >= freq_min) & (freqs <= freq_max)
+    
+    D_filtered = D[freq_mask, :]
+    DB_filtered = DB[freq_mask, :]
+    freqs_filtered = freqs[freq_mask]
+
+    # Extract dominant frequencies (strongest peak per frame, parabolic refinement)
+    with stage("inference"):
+        main_freqs = track_dominant_frequency(D_filtered, freqs_filtered)
+    progress(0.9, "peak tracking")
+    
+    # Apply median filter
+    kernel_size = min(11, len(main_freqs) if len(main_freqs) % 2 == 1 else len(main_freqs) - 1)
+    if kernel_size >= 3:
+        main_freqs = medfilt(main_freqs, kernel_size=kernel_size)
+    
+    # Find f_approach and f_recede more intelligently
+    # Ignore first and last 15% of data
+    valid_start = int(len(main_freqs) * 0.15)
+    valid_end = int(len(main_freqs) * 0.85)
+    valid_freqs = main_freqs[valid_start:valid_end]
+    
+    # Calculate percentiles instead of min/max to avoid outliers
+    f_approach = np.percentile(valid_freqs, 98)  # top 2%
+    f_recede = np.percentile(valid_freqs, 2)     # bottom 2%
+    
+    # Original frequency (geometric average more accurate than arithmetic)
+    f_source = np.sqrt(f_approach * f_recede)
+    
+    c = 343.0  # speed of sound m/s
+    
+    # Doppler equation
+    v = c * (f_approach - f_recede) / (f_approach + f_recede)
+    
+    # Calculate velocity for each frame
+    velocities = c * (main_freqs - f_source) / f_source
+
+    return {
+        "times": times,
+        "frequencies": main_freqs,
+        "velocities": velocities,
+        "spectrogram": DB_filtered,
+        "freq_axis": freqs_filtered,
+        "estimated_velocity": float(v),
+        "f_approach": float(f_approach),
+        "f_recede": float(f_recede),
+        "f_source": float(f_source),
+        "stft": {"n_fft": n_fft, "hop_length": hop_length, "frames": int(D.shape[1])},
+        "message": "Analysis completed successfully"
+    }
+
+def analyze_car_audio(audio_bytes, filename=None, progress=lambda *args: None):
+    """JSON form of ``compute_car_doppler`` (full-resolution lists)"""
+    result = compute_car_doppler(audio_bytes, filename, progress)
+    for key in ("times", "frequencies", "velocities", "spectrogram", "freq_axis"):
+        result[key] = result[key].tolist()
+    return result
+
+@api.route('/upload_car', methods=['POST'])
 def upload_car():
     if "file" not in request.files:
         return jsonify({"error": "No file uploaded"}), 400
@@ -958,105 +1545,105 @@ def upload_car():
         return jsonify({"error": "Only .wav, .mp3, .ogg files are supported"}), 400
 
     try:
-        # Read audio file
         audio_bytes = file.read()
-        y, sr = librosa.load(io.BytesIO(audio_bytes), sr=44100)
 
-        # STFT parameters - higher resolution
-        n_fft = 8192
-        hop_length = 256
-        
-        D = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
-        DB = librosa.amplitude_to_db(D, ref=np.max)
-        freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
-        times = librosa.frames_to_time(np.arange(D.shape[1]), sr=sr, hop_length=hop_length)
+        # Opt-in async mode: return a job id right away
+        if wants_async():
+            return submit_job("doppler", analyze_car_audio, audio_bytes, file.filename)
+
+        # Opt-in compact transport: quantized, downsampled spectrogram as multipart
+        if request.values.get("format") == "binary":
+            width = max(1, min(int(request.values.get("width", 1024)), 8192))
+            height = max(1, min(int(request.values.get("height", 512)), 4096))
+            dtype = request.values.get("dtype", "uint8")
+            if dtype not in ("uint8", "float16"):
+                return jsonify({"error": "dtype must be 'uint8' or 'float16'"}), 400
+            result = compute_car_doppler(audio_bytes, file.filename)
+            with stage("serialize"):
+                body, content_type = encode_spectrogram_response(result, width=width, height=height, dtype=dtype)
+            return Response(body, content_type=content_type)
+
+        return cached_response("upload_car", hash_bytes(audio_bytes), upload_params(file), None,
+                               lambda: analyze_car_audio(audio_bytes, file.filename),
+                               algo_version=DOPPLER_ALGO_VERSION)
+    except Exception as e:
+        return jsonify({"error": f"Error processing file: {str(e)}"}), 500
 
-        # Define frequency range
-        freq_min, freq_max = 100, 10000
-        freq_mask = (freqs >= freq_min) & (freqs <= freq_max)
-        
-        D_filtered = D[freq_mask, :]
-        DB_filtered = DB[freq_mask, :]
-        freqs_filtered = freqs[freq_mask]
-
-        # Extract dominant frequencies
-        main_freqs = []
-        for i in range(D_filtered.shape[1]):
-            col = D_filtered[:, i]
-            
-            # Find peaks
-            peaks, properties = find_peaks(col, height=np.max(col) * 0.3, distance=10)
-            
-            if len(peaks) > 0:
-                # Select strongest peak
-                strongest_peak = peaks[np.argmax(col[peaks])]
-                
-                # Use parabolic interpolation for better accuracy
-                if strongest_peak > 0 and strongest_peak < len(col) - 1:
-                    y0, y1, y2 = col[strongest_peak-1], col[strongest_peak], col[strongest_peak+1]
-                    offset = 0.5 * (y0 - y2) / (y0 - 2*y1 + y2) if (y0 - 2*y1 + y2) != 0 else 0
-                    peak_freq = freqs_filtered[strongest_peak] + offset * (freqs_filtered[1] - freqs_filtered[0])
-                    main_freqs.append(peak_freq)
-                else:
-                    main_freqs.append(freqs_filtered[strongest_peak])
-            else:
-                # fallback
-                main_freqs.append(freqs_filtered[np.argmax(col)])
-        
-        main_freqs = np.array(main_freqs)
-        
-        # Apply median filter
-        kernel_size = min(11, len(main_freqs) if len(main_freqs) % 2 == 1 else len(main_freqs) - 1)
-        if kernel_size >= 3:
-            main_freqs = medfilt(main_freqs, kernel_size=kernel_size)
-        
-        # Find f_approach and f_recede more intelligently
-        # Ignore first and last 15% of data
-        valid_start = int(len(main_freqs) * 0.15)
-        valid_end = int(len(main_freqs) * 0.85)
-        valid_freqs = main_freqs[valid_start:valid_end]
-        
-        # Calculate percentiles instead of min/max to avoid outliers
-        f_approach = np.percentile(valid_freqs, 98)  # top 2%
-        f_recede = np.percentile(valid_freqs, 2)     # bottom 2%
-        
-        # Original frequency (geometric average more accurate than arithmetic)
-        f_source = np.sqrt(f_approach * f_recede)
-        
-        c = 343.0  # speed of sound m/s
-        
-        # Doppler equation
-        v = c * (f_approach - f_recede) / (f_approach + f_recede)
-        
-        # Calculate velocity for each frame
-        velocities = c * (main_freqs - f_source) / f_source
+# =============================================================================
+# Spectrogram Tile Endpoints
+# =============================================================================
+# Upload once, then fetch only the tiles in view:
+#   POST /api/spectrogram/tiles                       -> pyramid description + id
+#   GET  /api/spectrogram/tiles/<id>                  -> pyramid description
+#   GET  /api/spectrogram/tiles/<id>/<level>/<t>/<f>  -> PNG tile (?format=raw for uint8 bytes)
+# Decoded recordings are stored under SPECTRO_STORE_DIR, so any worker can serve their tiles.
 
-        return jsonify({
-            "times": times.tolist(),
-            "frequencies": main_freqs.tolist(),
-            "velocities": velocities.tolist(),
-            "spectrogram": DB_filtered.tolist(),
-            "freq_axis": freqs_filtered.tolist(),
-            "estimated_velocity": float(v),
-            "f_approach": float(f_approach),
-            "f_recede": float(f_recede),
-            "f_source": float(f_source),
-            "message": "Analysis completed successfully"
-        })
+SPECTRO_STORE_DIR = os.path.join(UPLOAD_DIR, "spectro_recordings")
+
+def describe_pyramid(pyramid):
+    info = pyramid.describe()
+    info["tile_url"] = f"/api/spectrogram/tiles/{pyramid.id}/{{level}}/{{time_tile}}/{{freq_tile}}"
+    return info
+
+@api.route("/api/spectrogram/tiles", methods=["POST"])
+def create_spectrogram_tiles():
+    if "file" not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+    file = request.files["file"]
+    if file.filename == "":
+        return jsonify({"error": "No file selected"}), 400
+
+    try:
+        data = file.read()
+        validate_audio(data, info=probe_audio(data))
+        pyramid = register_recording(data, lambda payload: decode_audio(payload, file.filename),
+                                     SPECTRO_STORE_DIR)
+        return jsonify(describe_pyramid(pyramid))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
+        traceback.print_exc()
         return jsonify({"error": f"Error processing file: {str(e)}"}), 500
 
+@api.route("/api/spectrogram/tiles/<rec_id>", methods=["GET"])
+def spectrogram_tiles_info(rec_id):
+    pyramid = get_recording(rec_id, SPECTRO_STORE_DIR)
+    if pyramid is None:
+        return jsonify({"error": "Unknown or expired recording; upload it again"}), 404
+    return jsonify(describe_pyramid(pyramid))
+
+@api.route("/api/spectrogram/tiles/<rec_id>/<int:level>/<int:time_tile>/<int:freq_tile>", methods=["GET"])
+def spectrogram_tile(rec_id, level, time_tile, freq_tile):
+    pyramid = get_recording(rec_id, SPECTRO_STORE_DIR)
+    if pyramid is None:
+        return jsonify({"error": "Unknown or expired recording; upload it again"}), 404
+    try:
+        with stage("render"):
+            tile = pyramid.tile(level, time_tile, freq_tile)
+    except IndexError as e:
+        return jsonify({"error": str(e)}), 404
+
+    if request.args.get("format") == "raw":
+        response = Response(tile.tobytes(), content_type="application/octet-stream")
+        response.headers["X-Tile-Shape"] = f"{tile.shape[0]},{tile.shape[1]}"
+    else:
+        response = Response(encode_tile_png(tile), content_type="image/png")
+    # Tiles of a recording never change; let the browser keep them
+    response.headers["Cache-Control"] = "public, max-age=86400, immutable"
+    return response
+
 # =============================================================================
 # Drone Analysis Endpoints
 # =============================================================================
 
-@app.route("/drone-test", methods=["GET"])
+@api.route("/drone-test", methods=["GET"])
 def drone_test():
     """Test endpoint for drone analysis"""
     return jsonify({
         "message": "Drone analysis endpoint is working",
-        "model_loaded": model is not None,
-        "processor_loaded": processor is not None,
+        "model_loaded": models.is_loaded("drone"),
+        "processor_loaded": models.is_loaded("drone"),
+        "model_status": models.status()["drone"],
         "endpoints": {
             "test": "/drone-test (GET)",
             "predict": "/predict (POST)",
@@ -1065,7 +1652,7 @@ def drone_test():
         "instructions": "Send a POST request to /predict with an audio file"
     })
 
-@app.route("/test-audio", methods=["POST"])
+@api.route("/test-audio", methods=["POST"])
 def test_audio():
     """Test endpoint to check if audio files are valid"""
     if "file" not in request.files:
@@ -1076,35 +1663,21 @@ def test_audio():
         return jsonify({"error": "No file selected"}), 400
 
     try:
-        # Save file temporarily
-        temp_path = os.path.join(UPLOAD_DIR, f"test_{secure_filename(file.filename)}")
-        file.save(temp_path)
-        
-        # Get file info
-        file_size = os.path.getsize(temp_path)
-        
-        # Test loading with librosa
-        waveform, sr = librosa.load(temp_path, sr=None)
-        duration = len(waveform) / sr
-        
-        # Clean up
-        os.remove(temp_path)
+        # Decode in memory; no temporary file needed
+        audio_bytes = file.read()
+        audio = decode_audio(audio_bytes, file.filename)
         
         return jsonify({
             "valid": True,
-            "file_size_bytes": file_size,
-            "sample_rate": sr,
-            "samples": len(waveform),
-            "duration_seconds": round(duration, 2),
+            "file_size_bytes": len(audio_bytes),
+            "sample_rate": audio.samplerate,
+            "samples": len(audio.samples),
+            "duration_seconds": round(audio.duration, 2),
+            "header": audio.info.to_dict() if audio.info else None,
             "message": "Audio file is valid"
         })
         
     except Exception as e:
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except:
-                pass
         return jsonify({
             "valid": False,
             "error": str(e),
@@ -1112,9 +1685,10 @@ def test_audio():
         }), 400
 
 
-@app.route("/predict/status", methods=["GET"])
+@api.route("/predict/status", methods=["GET"])
 def predict_status():
     """Get current prediction system status"""
+    processor, model = get_drone_model()
     return jsonify({
         "model_loaded": model is not None,
         "processor_loaded": processor is not None,
@@ -1126,13 +1700,10 @@ def predict_status():
 # Drone Prediction Endpoint
 # =============================================================================
 
-@app.route("/predict", methods=["POST"])
+@api.route("/predict", methods=["POST"])
 def predict():
     """Main endpoint for drone audio classification"""
     try:
-        if model is None or processor is None:
-            return jsonify({"error": "Drone model not loaded"}), 500
-
         if "file" not in request.files:
             return jsonify({"error": "No audio file uploaded"}), 400
 
@@ -1143,57 +1714,70 @@ def predict():
         if not allowed_audio_file(file.filename):
             return jsonify({"error": f"Invalid file type. Allowed: {ALLOWED_AUDIO_EXTENSIONS}"}), 400
 
-        # Save file temporarily
-        temp_path = os.path.join(UPLOAD_DIR, f"drone_{secure_filename(file.filename)}")
-        file.save(temp_path)
-        
-        print(f"📁 Saved uploaded file to: {temp_path}")
+        content_hash = hash_stream(file.stream)
 
-        try:
-            # Validate audio file first
-            validate_audio_file(temp_path)
-            
-            # Run prediction
-            label, confidence = predict_drone(temp_path)
-            
-            # Get all class probabilities for better frontend display
-            waveform, sr = librosa.load(temp_path, sr=16000, mono=True, duration=10.0)
-            if len(waveform) < 16000:
-                target_length = 16000
-                repeats = (target_length // len(waveform)) + 1
-                waveform = np.tile(waveform, repeats)[:target_length]
-            
-            audio_list = waveform.tolist()
-            inputs = processor(audio_list, sampling_rate=16000, return_tensors="pt", padding=True)
-            
-            with torch.no_grad():
-                outputs = model(**inputs)
-                logits = outputs.logits
-                probabilities = torch.nn.functional.softmax(logits, dim=1)
-                
-                # Get all class probabilities
-                all_probs = {}
-                for i, class_name in model.config.id2label.items():
-                    all_probs[class_name] = round(probabilities[0][i].item(), 4)
-            
-            # Clean up
-            os.remove(temp_path)
-            
-            return jsonify({
+        # Long-recording mode: per-window timeline over the whole file
+        if request.values.get("mode") == "timeline":
+            try:
+                window_seconds = float(request.values.get("window_seconds", 5.0))
+                hop_seconds = request.values.get("hop_seconds")
+                hop_seconds = None if hop_seconds is None else float(hop_seconds)
+                threshold = float(request.values.get("threshold", 0.5))
+            except ValueError:
+                return jsonify({"error": "window_seconds, hop_seconds and threshold must be numbers"}), 400
+            if not np.isfinite([window_seconds, threshold, hop_seconds or 0.0]).all():
+                return jsonify({"error": "window_seconds, hop_seconds and threshold must be finite"}), 400
+            if not 0.0 <= threshold <= 1.0:
+                return jsonify({"error": "threshold must be in [0, 1]"}), 400
+            window_seconds = min(max(window_seconds, 1.0), 30.0)
+            if hop_seconds is None:
+                hop_seconds = window_seconds / 2
+            hop_seconds = min(max(hop_seconds, 0.25), window_seconds)
+
+            def compute_timeline():
+                _require_model("drone")
+                audio_bytes = file.read()
+                info = probe_audio(audio_bytes)
+                try:
+                    validate_audio(audio_bytes, info=info)
+                except Exception as e:
+                    raise ValueError(f"Invalid audio file: {str(e)}")
+                result = predict_drone_timeline(audio_bytes, file.filename, window_seconds, hop_seconds, threshold)
+                return {
+                    "success": True,
+                    "mode": "timeline",
+                    "prediction": result["positive_class"] if result["drone_detected"] else "no detection",
+                    **result,
+                    "message": "Timeline analysis successful",
+                    "timestamp": datetime.now().isoformat()
+                }
+
+            params = upload_params(file, mode="timeline", window_seconds=window_seconds,
+                                   hop_seconds=hop_seconds, threshold=threshold)
+            return cached_response("predict", content_hash, params, "drone", compute_timeline)
+
+        def compute():
+            _require_model("drone")  # loaded on a cache miss only
+            # Validate and decode the upload once, in memory
+            audio = read_audio_upload(file)
+
+            # One inference gives the label and every class probability
+            label, confidence, all_probs = predict_drone(audio)
+
+            return {
                 "success": True,
                 "prediction": label,
                 "confidence": round(confidence, 4),
                 "all_probabilities": all_probs,
                 "message": "Classification successful",
                 "timestamp": datetime.now().isoformat()
-            })
-            
-        except Exception as e:
-            # Clean up on error
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            raise e
+            }
 
+        return cached_response("predict", content_hash, upload_params(file), "drone", compute)
+
+    except ValueError as e:
+        # Unreadable, too short or too low-rate audio
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         print(f"❌ Prediction error: {str(e)}")
         traceback.print_exc()
@@ -1206,12 +1790,47 @@ def predict():
 # SAR Analysis Endpoints
 # =============================================================================
 
-@app.route('/sar/analyze', methods=['POST'])
+# Bump when the analysis output changes; part of the result-cache key
+SAR_ALGO_VERSION = "2"
+
+@traced()
+def run_sar_analysis(image_bytes, filename, progress=lambda *args: None):
+    """Analyze an uploaded SAR/regular image held in memory; returns the JSON payload"""
+    file_ext = os.path.splitext(filename)[1].lower()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
+        temp_file.write(image_bytes)
+        temp_path = temp_file.name
+
+    try:
+        # Determine if it's a TIFF file
+        is_tiff = filename.lower().endswith(('.tif', '.tiff'))
+        progress(0.1, "analyzing")
+
+        # Analyze the SAR image using the provided Python code
+        original_data, histogram, stats, metadata = analyze_sar_image(temp_path, is_tiff)
+    finally:
+        # Clean up temporary files
+        os.unlink(temp_path)
+
+    return {
+        'original_image': f'data:image/png;base64,{original_data}',
+        'histogram': histogram,
+        'analysis': stats,
+        'metadata': metadata,
+        'file_info': {
+            'original_name': filename,
+            'processed_type': 'PNG',
+            'is_sar_image': is_tiff
+        }
+    }
+
+@api.route('/sar/analyze', methods=['POST'])
 def analyze_sar():
     """
     Analyze SAR images and generate intensity plots using the provided Python code
     Expected: Image file (TIFF, JPG, PNG)
     Returns: Original image, analysis plot, and statistical data
+    Send async=1 to get a job id back immediately and poll /api/jobs/<id>
     """
     if 'file' not in request.files:
         return jsonify({'error': 'No file uploaded'}), 400
@@ -1224,40 +1843,20 @@ def analyze_sar():
         return jsonify({'error': 'Invalid file type. Please upload TIFF, JPG, or PNG files.'}), 400
     
     try:
-        # Save file temporarily
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
-            file.save(temp_file.name)
-            temp_path = temp_file.name
-        
-        # Determine if it's a TIFF file
-        is_tiff = file.filename.lower().endswith(('.tif', '.tiff'))
-        
-        # Analyze the SAR image using the provided Python code
-        original_data, plot_data, stats, metadata = analyze_sar_image(temp_path, is_tiff)
-        
-        # Clean up temporary files
-        os.unlink(temp_path)
-        
-        return jsonify({
-            'original_image': f'data:image/png;base64,{original_data}',
-            'generated_plot': f'data:image/png;base64,{plot_data}',
-            'analysis': stats,
-            'metadata': metadata,
-            'file_info': {
-                'original_name': file.filename,
-                'processed_type': 'PNG',
-                'is_sar_image': is_tiff
-            }
-        })
+        image_bytes = file.read()
+
+        # Opt-in async mode: return a job id right away
+        if wants_async():
+            return submit_job("sar", run_sar_analysis, image_bytes, file.filename)
+
+        return cached_response("sar_analyze", hash_bytes(image_bytes), upload_params(file), None,
+                               lambda: run_sar_analysis(image_bytes, file.filename),
+                               algo_version=SAR_ALGO_VERSION)
         
     except Exception as e:
-        # Clean up in case of error
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            os.unlink(temp_path)
         return jsonify({'error': f'Error processing SAR image: {str(e)}'}), 500
 
-@app.route('/sar/convert', methods=['POST'])
+@api.route('/sar/convert', methods=['POST'])
 def convert_tiff():
     """
     Convert TIFF files to PNG format
@@ -1278,8 +1877,8 @@ def convert_tiff():
             file.save(temp_tiff.name)
             tiff_path = temp_tiff.name
         
-        # Convert to PNG using the SAR analysis function
-        original_data, _, _, _ = analyze_sar_image(tiff_path, is_tiff=True)
+        # Decode and render only; no statistics or histogram
+        original_data = png_base64(render_raster_png(tiff_path))
         
         # Clean up
         os.unlink(tiff_path)
@@ -1295,11 +1894,153 @@ def convert_tiff():
             os.unlink(tiff_path)
         return jsonify({'error': f'Error converting TIFF to PNG: {str(e)}'}), 500
     
+# Many rasters per request: a zip upload or several 'files', converted on one
+# process pool per worker shared by every request (CONVERT_WORKERS processes).
+# Batches of more than CONVERT_SYNC_MAX_FILES always run as a background job.
+# Result archives are deleted after CONVERSION_TTL seconds.
+CONVERSION_DIR = os.path.join(UPLOAD_DIR, "conversions")
+CONVERT_WORKERS = max(1, min(int(os.environ.get("CONVERT_WORKERS", 4)), os.cpu_count() or 1))
+CONVERT_SYNC_MAX_FILES = int(os.environ.get("CONVERT_SYNC_MAX_FILES", 8))
+CONVERT_SIZE_RANGE = (64, SAR_DISPLAY_SIZE * 4)  # PNG longer side; never full resolution here
+CONVERSION_TTL = float(os.environ.get("CONVERSION_TTL", 24 * 3600))
+
+@traced()
+def run_bulk_conversion(work_dir, paths, fmt, max_size, progress=lambda *args: None):
+    """Convert ``paths``, zip the outputs into CONVERSION_DIR and remove ``work_dir``"""
+    try:
+        out_dir = os.path.join(work_dir, "out")
+        summary = convert_many(paths, out_dir, fmt=fmt, max_size=max_size,
+                               pool=shared_pool(CONVERT_WORKERS), progress=progress)
+        os.makedirs(CONVERSION_DIR, exist_ok=True)
+        name = f"sar_{fmt}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.urandom(4).hex()}.zip"
+        # PNGs and deflated GeoTIFFs are already compressed
+        with zipfile.ZipFile(os.path.join(CONVERSION_DIR, name), "w", zipfile.ZIP_STORED) as archive:
+            for result in summary["results"]:
+                if "output" in result:
+                    archive.write(os.path.join(out_dir, result["output"]), result["output"])
+        summary["download_url"] = f"/sar/convert/batch/{name}"
+        return summary
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+@api.route('/sar/convert/batch', methods=['POST'])
+def convert_tiff_batch():
+    """
+    Convert many TIFFs at once (format=png|tif, max_size for PNG previews); async=1 for a job
+    """
+    uploads = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+    if not uploads:
+        return jsonify({'error': 'No files uploaded'}), 400
+
+    fmt = request.values.get('format', 'png')
+    if fmt not in CONVERT_FORMATS:
+        return jsonify({'error': f'format must be one of {list(CONVERT_FORMATS)}'}), 400
+    try:
+        max_size = int(request.values.get('max_size', SAR_DISPLAY_SIZE))
+    except ValueError:
+        return jsonify({'error': 'max_size must be an integer number of pixels'}), 400
+    max_size = min(max(max_size, CONVERT_SIZE_RANGE[0]), CONVERT_SIZE_RANGE[1])
+
+    prune_expired_files(CONVERSION_DIR, CONVERSION_TTL)
+    work_dir = tempfile.mkdtemp(prefix="sar_convert_")
+    try:
+        in_dir = os.path.join(work_dir, "in")
+        os.makedirs(in_dir)
+        paths, used = [], set()
+        for upload in uploads:
+            name = secure_filename(upload.filename)
+            if name.lower().endswith('.zip'):
+                zip_path = os.path.join(work_dir, unique_name(name, used))
+                upload.save(zip_path)
+                paths.extend(extract_rasters(zip_path, in_dir, used))
+            elif name.lower().endswith(TIFF_EXTENSIONS):
+                path = os.path.join(in_dir, unique_name(name, used))
+                upload.save(path)
+                paths.append(path)
+        if not paths:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return jsonify({'error': 'No .tif/.tiff files found in the upload'}), 400
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({'error': f'Error reading upload: {str(e)}'}), 400
+
+    if wants_async() or len(paths) > CONVERT_SYNC_MAX_FILES:
+        response, status = submit_job("sar_convert", run_bulk_conversion, work_dir, paths, fmt, max_size)
+        if status != 202:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return response, status
+    try:
+        return jsonify(run_bulk_conversion(work_dir, paths, fmt, max_size))
+    except Exception as e:
+        return jsonify({'error': f'Error converting files: {str(e)}'}), 500
+
+@api.route('/sar/convert/batch/<name>', methods=['GET'])
+def download_converted_batch(name):
+    return send_from_directory(os.path.abspath(CONVERSION_DIR), secure_filename(name), as_attachment=True)
+
+# =============================================================================
+# SAR Tile Endpoints
+# =============================================================================
+# Deep-zoom viewing of uploaded rasters:
+#   POST /sar/tiles                      -> scene description + tile URL template
+#   GET  /sar/tiles/<scene_id>           -> scene description
+#   GET  /sar/tiles/<scene_id>/z/x/y.png -> 256x256 PNG tile
+
+SAR_SCENE_DIR = os.path.join(UPLOAD_DIR, "sar_scenes")
+
+def describe_scene(scene):
+    info = scene.describe()
+    info["tile_url"] = f"/sar/tiles/{scene.id}/{{z}}/{{x}}/{{y}}.png"
+    return info
+
+@api.route('/sar/tiles', methods=['POST'])
+def create_sar_tiles():
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+    if not file.filename.lower().endswith(('.tif', '.tiff')):
+        return jsonify({'error': 'Please upload a GeoTIFF for tiled viewing'}), 400
+
+    try:
+        scene = register_scene(file.stream, SAR_SCENE_DIR)
+        return jsonify(describe_scene(scene))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': f'Error preparing SAR tiles: {str(e)}'}), 500
+
+@api.route('/sar/tiles/<scene_id>', methods=['GET'])
+def sar_tiles_info(scene_id):
+    scene = get_scene(scene_id, SAR_SCENE_DIR)
+    if scene is None:
+        return jsonify({'error': 'Unknown SAR scene'}), 404
+    return jsonify(describe_scene(scene))
+
+@api.route('/sar/tiles/<scene_id>/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+def sar_tile(scene_id, z, x, y):
+    scene = get_scene(scene_id, SAR_SCENE_DIR)
+    if scene is None:
+        return jsonify({'error': 'Unknown SAR scene'}), 404
+    try:
+        with stage("render"):
+            png = scene.tile(z, x, y)
+    except IndexError as e:
+        return jsonify({'error': str(e)}), 404
+
+    response = Response(png, content_type="image/png")
+    # Scenes are content-addressed, so a tile never changes
+    response.headers["Cache-Control"] = "public, max-age=86400, immutable"
+    response.headers["ETag"] = f'"{scene.id}-{z}-{x}-{y}"'
+    return response
+
 # =============================================================================
 # Voice Analysis Endpoints
 # =============================================================================
 
-@app.route("/voice-analysis")
+@api.route("/voice-analysis")
 def voice_analysis_page():
     """Serve voice analysis page"""
     try:
@@ -1307,13 +2048,10 @@ def voice_analysis_page():
     except FileNotFoundError:
         return "Voice analysis page not found", 404
 
-@app.route("/api/classify-voice", methods=["POST"])
+@api.route("/api/classify-voice", methods=["POST"])
 def classify_voice():
     """Classify voice gender from audio file using ECAPA-TDNN"""
     try:
-        if voice_model is None:
-            return jsonify({"error": "Voice gender model not loaded"}), 500
-
         if "file" not in request.files:
             return jsonify({"error": "No audio file uploaded"}), 400
 
@@ -1324,40 +2062,29 @@ def classify_voice():
         if not allowed_audio_file(file.filename):
             return jsonify({"error": f"Invalid file type. Allowed: {ALLOWED_AUDIO_EXTENSIONS}"}), 400
 
-        # Save file temporarily
-        temp_path = os.path.join(UPLOAD_DIR, f"voice_{secure_filename(file.filename)}")
-        file.save(temp_path)
-        
-        print(f"📁 Saved voice file to: {temp_path}")
-        print(f"📊 File size: {os.path.getsize(temp_path)} bytes")
+        content_hash = hash_stream(file.stream)
 
-        try:
-            # Validate audio file
+        def compute():
+            _require_model("voice")  # loaded on a cache miss only
+            # Validate and decode the upload once, in memory
             print("🔍 Validating audio file...")
-            validate_audio_file(temp_path)
-            
-            # Get audio info for frontend display
-            y, sr = librosa.load(temp_path, sr=None)
-            duration = len(y) / sr
-            print(f"✅ Audio validated - Duration: {duration:.2f}s, Sample rate: {sr}Hz")
-            
+            audio = read_audio_upload(file)
+            print(f"✅ Audio validated - Duration: {audio.duration:.2f}s, Sample rate: {audio.samplerate}Hz")
+
             # Classify gender using ECAPA-TDNN
             print("🎯 Starting gender classification...")
-            result = predict_voice_gender_ecapa(temp_path)
-            
-            # Clean up
-            os.remove(temp_path)
-            
+            result = predict_voice_gender_ecapa(audio)
+
             print("✅ Voice classification completed successfully")
-            return jsonify({
+            return {
                 "success": True,
                 "gender": result["gender"],
                 "confidence": result["confidence"],
                 "probabilities": result["probabilities"],
                 "audio_info": {
-                    "duration": round(duration, 2),
-                    "sample_rate": sr,
-                    "samples": len(y)
+                    "duration": round(audio.duration, 2),
+                    "sample_rate": audio.samplerate,
+                    "samples": len(audio.samples)
                 },
                 "model_info": {
                     "model_type": "ECAPA-TDNN",
@@ -1366,15 +2093,9 @@ def classify_voice():
                 },
                 "message": "Voice gender classification successful",
                 "timestamp": datetime.now().isoformat()
-            })
-            
-        except Exception as e:
-            # Clean up on error
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            print(f"❌ Error during classification: {str(e)}")
-            traceback.print_exc()
-            raise e
+            }
+
+        return cached_response("classify_voice", content_hash, upload_params(file), "voice", compute)
 
     except Exception as e:
         print(f"❌ Voice classification endpoint error: {str(e)}")
@@ -1384,28 +2105,119 @@ def classify_voice():
             "error": f"Voice classification failed: {str(e)}"
         }), 500
 
-@app.route("/api/voice-model-status", methods=["GET"])
+# Bulk clips bypass batchers["voice"] on purpose: predict_batch sorts them by
+# duration and crops each bucket to its shortest clip, which the batcher's
+# exact-length grouping cannot do. To keep them from crowding out single-clip
+# traffic, at most VOICE_BATCH_CONCURRENCY bulk requests run at once.
+VOICE_BATCH_MAX_FILES = int(os.environ.get("VOICE_BATCH_MAX_FILES", 64))
+VOICE_BATCH_SIZE_RANGE = (1, 64)
+voice_batch_slots = threading.BoundedSemaphore(int(os.environ.get("VOICE_BATCH_CONCURRENCY", 1)))
+
+@api.route("/api/classify-voice/batch", methods=["POST"])
+def classify_voice_batch():
+    """Classify the gender of many uploaded clips ("files") in bucketed batches"""
+    try:
+        files = request.files.getlist("files") or request.files.getlist("file")
+        if not files:
+            return jsonify({"error": "No audio files uploaded"}), 400
+        if len(files) > VOICE_BATCH_MAX_FILES:
+            return jsonify({"error": f"{len(files)} files uploaded; the limit is {VOICE_BATCH_MAX_FILES}"}), 400
+        try:
+            batch_size = int(request.values.get("batch_size", 32))
+        except ValueError:
+            return jsonify({"error": "batch_size must be an integer"}), 400
+        batch_size = min(max(batch_size, VOICE_BATCH_SIZE_RANGE[0]), VOICE_BATCH_SIZE_RANGE[1])
+
+        voice_model = models.get("voice")
+        if voice_model is None:
+            return jsonify({"error": "Voice gender model not loaded"}), 500
+
+        names, clips, failures = [], [], []
+        for file in files:
+            if not allowed_audio_file(file.filename):
+                failures.append({"filename": file.filename, "error": "Invalid file type"})
+                continue
+            try:
+                clips.append(preprocess_audio_for_ecapa(read_audio_upload(file)))
+                names.append(file.filename)
+            except Exception as e:
+                failures.append({"filename": file.filename, "error": str(e)})
+
+        started = datetime.now()
+        with voice_batch_slots:
+            predictions = voice_model.predict_batch(clips, voice_device, batch_size=batch_size)
+        elapsed = (datetime.now() - started).total_seconds()
+        print(f"✅ Classified {len(clips)} voice clips in {elapsed:.2f}s")
+
+        return jsonify({
+            "success": True,
+            "results": [
+                {
+                    "filename": name,
+                    "gender": p["gender"],
+                    "confidence": round(max(p["probabilities"].values()), 4),
+                    "probabilities": {k: round(v, 4) for k, v in p["probabilities"].items()}
+                }
+                for name, p in zip(names, predictions)
+            ],
+            "failures": failures,
+            "inference_seconds": round(elapsed, 3),
+            "timestamp": datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        print(f"❌ Batch voice classification error: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            "success": False,
+            "error": f"Batch voice classification failed: {str(e)}"
+        }), 500
+
+@api.route("/api/voice-model-status", methods=["GET"])
 def voice_model_status():
-    """Get voice model status"""
+    """Get voice model status (read-only; never triggers a load)"""
+    state = models.status()["voice"]["state"]
+    loaded = state == "loaded"
     return jsonify({
-        "model_loaded": voice_model is not None,
-        "system_ready": voice_model is not None,
+        "model_loaded": loaded,
+        "state": state,
+        # A model that has not been loaded yet is loaded by the first request
+        "system_ready": state in ("loaded", "not_loaded"),
         "model_type": "ECAPA-TDNN",
         "model_architecture": "Deep Speaker Embedding Network",
         "input_requirements": "16kHz audio, 80-band Mel-spectrogram",
-        "device": str(device) if voice_model else "None",
+        "device": str(voice_device) if loaded else "None",
         "timestamp": datetime.now().isoformat()
     })
 
-# =============================================================================
-# Application Entry Point
-# =============================================================================
-# Add this to your Flask app (before the if __name__ == "__main__": section)
-@app.route("/debug/routes")
+@api.route("/api/models/<name>/load", methods=["POST"])
+def load_model(name):
+    """Explicit warm-up: load a registered model now instead of on first use.
+
+    A model whose earlier load failed (e.g. a transient download error) is
+    retried here; ordinary requests keep the remembered failure.
+    """
+    if name not in models.names():
+        return jsonify({"error": f"Unknown model '{name}'", "models": models.names()}), 404
+    loaded = models.retry(name) is not None
+    return jsonify({"model": name, **models.status()[name]}), 200 if loaded else 500
+
+@api.before_app_request
+def log_request_info():
+    print(f"📥 Incoming request: {request.method} {request.path}")
+    if request.files:
+        print(f"📁 Files: {list(request.files.keys())}")
+
+@api.after_app_request
+def log_response_info(response):
+    print(f"📤 Outgoing response: {response.status_code}")
+    return response
+
+@api.route("/debug/routes")
 def debug_routes():
     """Debug endpoint to show all available routes"""
     routes = []
-    for rule in app.url_map.iter_rules():
+    for rule in current_app.url_map.iter_rules():
         routes.append({
             'endpoint': rule.endpoint,
             'methods': list(rule.methods),
@@ -1416,11 +2228,45 @@ def debug_routes():
         'routes': routes
     })
 
+# =============================================================================
+# Application Factory & Entry Points
+# =============================================================================
+# Production: gunicorn -c gunicorn.conf.py wsgi:app (see gunicorn.conf.py).
+# With preload_app the master imports this module, loads the PRELOAD_MODELS
+# once and forks; workers share those weights copy-on-write and call
+# after_fork() to rebuild per-process state. Development: python app.py.
+
+def create_app(config=None):
+    """Build the Flask application around the ``api`` blueprint"""
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+    if config:
+        app.config.update(config)
+    # Allow all origins for development
+    CORS(app)
+    app.register_blueprint(api)
+    return app
+
+def after_fork(torch_threads=None):
+    """Re-initialize per-process state in a worker forked from a preloading master.
+
+    Threads and pools do not survive fork(): the batchers, the job pool and
+    the SAR conversion pool notice the new pid and start their own on first use. What is left is sizing torch's
+    intra-op pool for this worker, so N workers do not each spin up one
+    thread per core.
+    """
+    if torch_threads:
+        torch.set_num_threads(int(torch_threads))
+    print(f"👷 Worker {os.getpid()} ready (torch threads: {torch.get_num_threads()}, "
+          f"models: {', '.join(n for n in models.names() if models.is_loaded(n)) or 'none loaded'})")
+
 if __name__ == "__main__":
+    models.preload_from_env()
+    app = create_app()
     print(f"🚀 Starting Multi-Model Medical Analysis Server")
     print(f"📍 Upload directory: {os.path.abspath(UPLOAD_DIR)}")
     print(f"📊 Supported file types: {ALLOWED_EXTENSIONS}")
-    print(f"🤖 Models: ECG - {'Loaded' if ecg_model else 'Not loaded'}, EEG - {'Loaded' if eeg_model else 'Not loaded'}, Drone - {'Loaded' if model else 'Not loaded'}, Voice (ECAPA-TDNN) - {'Loaded' if voice_model else 'Not loaded'}")
+    print(f"🤖 Models: " + ", ".join(f"{name} - {info['state']}" for name, info in models.status().items()))
     print(f"🌐 Web Applications:")
     print(f"   - Main: http://127.0.0.1:5000")
     print(f"   - ECG Analysis: http://127.0.0.1:5000/ecg")
@@ -1430,19 +2276,8 @@ if __name__ == "__main__":
     print(f"   - Voice Analysis: http://127.0.0.1:5000/voice-analysis")
     print(f"   - Spectrogram Analysis: http://127.0.0.1:5000/spectro")
     print(f"🌐 API Health: http://127.0.0.1:5000/api/health")
-    
-@app.before_request
-def log_request_info():
-    print(f"📥 Incoming request: {request.method} {request.path}")
-    if request.files:
-        print(f"📁 Files: {list(request.files.keys())}")
-
-@app.after_request
-def log_response_info(response):
-    print(f"📤 Outgoing response: {response.status_code}")
-    return response
-    # Run the app
-
 
-port = int(os.environ.get("PORT", 5000))
-app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
+    # Run the app; FLASK_DEBUG=1 turns on the reloader and debugger (never on a shared host)
+    port = int(os.environ.get("PORT", 5000))
+    debug = os.environ.get("FLASK_DEBUG", "0").lower() in ("1", "true", "yes")
+    app.run(debug=debug, host='0.0.0.0', port=port)
@@ -0,0 +1,86 @@
+# =============================================================================
+# Zero-Copy NumPy Upload Loading
+# =============================================================================
+# ``np.load`` on an upload copies the whole payload at least once, and its
+# ``mmap_mode`` only works with file names. These helpers parse the .npy header
+# themselves so an upload can be viewed in place: small uploads straight from
+# their bytes with ``np.frombuffer``, large ones (which werkzeug has already
+# spooled to a temporary file) memory-mapped from that file descriptor.
+
+import io
+import tempfile
+
+import numpy as np
+
+
+def read_npy_header(fp):
+    """Parse a .npy header from ``fp``; returns (shape, fortran_order, dtype, data_offset)."""
+    version = np.lib.format.read_magic(fp)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+    return shape, fortran_order, dtype, fp.tell()
+
+
+def npy_from_bytes(data, allow_pickle=False):
+    """View a .npy payload held in memory without copying it (read-only)."""
+    shape, fortran_order, dtype, offset = read_npy_header(io.BytesIO(data))
+    if dtype.hasobject:
+        if not allow_pickle:
+            raise ValueError("Object arrays are not supported")
+        return np.load(io.BytesIO(data), allow_pickle=True)
+    count = int(np.prod(shape)) if shape else 1
+    array = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+    return array.reshape(shape, order="F" if fortran_order else "C")
+
+
+def backing_file(stream):
+    """Return the real file behind an upload stream, or None if it lives in memory.
+
+    Small werkzeug uploads are kept in a SpooledTemporaryFile that has not
+    rolled over to disk yet; asking those for a fileno would force a write, so
+    they count as in-memory.
+    """
+    if isinstance(stream, tempfile.SpooledTemporaryFile):
+        if not getattr(stream, "_rolled", False):
+            return None
+        stream = stream._file
+    try:
+        stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    return stream
+
+
+def open_npy_upload(stream, allow_pickle=False):
+    """Load a .npy upload, memory-mapping it when it is already on disk."""
+    fp = backing_file(stream)
+    if fp is not None:
+        fp.seek(0)
+        shape, fortran_order, dtype, offset = read_npy_header(fp)
+        if not dtype.hasobject:
+            return np.memmap(fp, dtype=dtype, mode="r", offset=offset, shape=shape,
+                             order="F" if fortran_order else "C")
+    stream.seek(0)
+    return npy_from_bytes(stream.read(), allow_pickle=allow_pickle)
+
+
+def open_raw_upload(stream, dtype, row_width):
+    """View a headerless binary upload as ``(-1, row_width)`` rows of ``dtype``."""
+    dtype = np.dtype(dtype)
+    row_bytes = dtype.itemsize * row_width
+    fp = backing_file(stream)
+    if fp is not None:
+        fp.seek(0, io.SEEK_END)
+        size = fp.tell()
+        if size % row_bytes:
+            raise ValueError(f"Binary payload of {size} bytes is not a whole number of {row_width}-value rows")
+        if size == 0:
+            return np.zeros((0, row_width), dtype=dtype)
+        return np.memmap(fp, dtype=dtype, mode="r", shape=(size // row_bytes, row_width))
+    stream.seek(0)
+    data = stream.read()
+    if len(data) % row_bytes:
+        raise ValueError(f"Binary payload of {len(data)} bytes is not a whole number of {row_width}-value rows")
+    return np.frombuffer(data, dtype=dtype).reshape(-1, row_width)
@@ -0,0 +1,278 @@
+# =============================================================================
+# Decode-Once Audio Ingestion
+# =============================================================================
+# Every audio endpoint reads the upload into memory once, probes its header,
+# decodes it once into a mono float32 buffer and asks that buffer for the
+# sample rate its model needs. Resampled views are cached on the buffer so two
+# consumers at the same rate share one resample.
+
+import io
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import soundfile as sf
+import torch
+import torchaudio
+
+
+class AudioInfo:
+    """Header-level facts about an upload, read without decoding the samples."""
+
+    def __init__(self, samplerate, channels, frames, format=None, subtype=None):
+        self.samplerate = int(samplerate)
+        self.channels = int(channels)
+        self.frames = int(frames)
+        self.format = format
+        self.subtype = subtype
+
+    @property
+    def duration(self):
+        return self.frames / self.samplerate if self.samplerate else 0.0
+
+    def to_dict(self):
+        return {
+            "sample_rate": self.samplerate,
+            "channels": self.channels,
+            "frames": self.frames,
+            "duration": round(self.duration, 3),
+            "format": self.format,
+            "subtype": self.subtype,
+        }
+
+
+def probe_audio(data):
+    """Read the container header with libsndfile, or return None if it cannot."""
+    try:
+        info = sf.info(io.BytesIO(data))
+    except Exception:
+        return None
+    return AudioInfo(info.samplerate, info.channels, info.frames, info.format, info.subtype)
+
+
+class DecodedAudio:
+    """A mono float32 decode of one upload plus cached resampled views."""
+
+    def __init__(self, samples, samplerate, info=None, size_bytes=None):
+        self.samples = np.ascontiguousarray(samples, dtype=np.float32)
+        self.samplerate = int(samplerate)
+        self.info = info
+        self.size_bytes = size_bytes
+        self._views = {self.samplerate: self.samples}
+        self._lock = threading.Lock()
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.samplerate if self.samplerate else 0.0
+
+    def resampled(self, target_sr):
+        """Return the signal at ``target_sr`` (cached, treat as read-only)."""
+        target_sr = int(target_sr)
+        view = self._views.get(target_sr)
+        if view is not None:
+            return view
+        with self._lock:
+            view = self._views.get(target_sr)
+            if view is None:
+                view = resample(self.samples, self.samplerate, target_sr)
+                self._views[target_sr] = view
+        return view
+
+    def head(self, target_sr, seconds):
+        """First ``seconds`` of the signal at ``target_sr`` (treat as read-only).
+
+        Unless the full resample is already cached, only the head (plus a
+        little context for the filter) is resampled, so classifying the
+        first seconds of a long upload does not resample all of it.
+        """
+        target_sr = int(target_sr)
+        n_out = int(round(target_sr * seconds))
+        view = self._views.get(target_sr)
+        if view is not None:
+            return view[:n_out]
+        n_in = int(math.ceil(seconds * self.samplerate)) + max(1, self.samplerate // 100)
+        if n_in >= len(self.samples):
+            return self.resampled(target_sr)[:n_out]
+        return resample(self.samples[:n_in], self.samplerate, target_sr)[:n_out]
+
+    def tensor(self, target_sr, seconds=None):
+        """The signal at ``target_sr`` as a ``(1, samples)`` float tensor."""
+        samples = self.resampled(target_sr) if seconds is None else self.head(target_sr, seconds)
+        return torch.from_numpy(samples).unsqueeze(0)
+
+
+# =============================================================================
+# Resampler Kernel Cache
+# =============================================================================
+# torchaudio's Resample transform computes its sinc kernel in the constructor.
+# Uploads come from a handful of recorder rates, so one transform per
+# (source_rate, target_rate, quality) is kept process-wide and reused.
+
+RESAMPLE_QUALITY = {
+    "fast": {"lowpass_filter_width": 4, "rolloff": 0.9},
+    "default": {"lowpass_filter_width": 6, "rolloff": 0.99},
+    "high": {"lowpass_filter_width": 16, "rolloff": 0.945},
+}
+
+
+class ResamplerCache:
+    """Size-bounded LRU of ``torchaudio.transforms.Resample`` modules."""
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, orig_sr, target_sr, quality="default"):
+        if quality not in RESAMPLE_QUALITY:
+            raise ValueError(f"Unknown resample quality '{quality}'. Use one of {list(RESAMPLE_QUALITY)}")
+        key = (int(orig_sr), int(target_sr), quality)
+        with self._lock:
+            resampler = self._entries.get(key)
+            if resampler is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return resampler
+            self.misses += 1
+
+        # Build outside the lock; a duplicate build under a race is harmless
+        resampler = torchaudio.transforms.Resample(
+            orig_freq=key[0], new_freq=key[1], **RESAMPLE_QUALITY[quality])
+        with self._lock:
+            self._entries[key] = resampler
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return resampler
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "keys": [f"{o}->{t}:{q}" for o, t, q in self._entries],
+            }
+
+
+resampler_cache = ResamplerCache(int(os.environ.get("RESAMPLER_CACHE_SIZE", 16)))
+
+
+def get_resampler(orig_sr, target_sr, quality="default"):
+    """Shared, cached Resample transform for a rate pair and quality preset."""
+    return resampler_cache.get(orig_sr, target_sr, quality)
+
+
+def resample(samples, orig_sr, target_sr, quality="default"):
+    """Band-limited sinc resampling of a 1D float32 array."""
+    if orig_sr == target_sr:
+        return samples
+    with torch.no_grad():
+        out = get_resampler(orig_sr, target_sr, quality)(torch.from_numpy(samples))
+    return out.numpy().astype(np.float32, copy=False)
+
+
+def iter_resampled_blocks(data, target_sr, block_seconds=30.0, filename=None):
+    """Yield the upload as consecutive mono float32 blocks at ``target_sr``.
+
+    Only one block (plus a little context) is decoded at a time, so memory
+    stays flat however long the recording is. Blocks are cut on multiples of
+    the resampling period and resampled with context from their neighbours,
+    so joined together they match a whole-file resample. Formats libsndfile
+    cannot stream are decoded whole and then sliced.
+    """
+    target_sr = int(target_sr)
+    try:
+        f = sf.SoundFile(io.BytesIO(data))
+    except Exception:
+        audio = decode_audio(data, filename)
+        samples = audio.resampled(target_sr)
+        step = max(1, int(target_sr * block_seconds))
+        for start in range(0, len(samples), step):
+            yield samples[start:start + step]
+        return
+
+    with f:
+        orig_sr = f.samplerate
+        g = math.gcd(orig_sr, target_sr)
+        in_step, out_step = orig_sr // g, target_sr // g
+        # Source samples per block and of context, rounded to whole resampling periods
+        block = max(1, int(orig_sr * block_seconds) // in_step) * in_step
+        context = max(1, int(orig_sr * 0.01) // in_step + 1) * in_step
+
+        def read(frames):
+            chunk = f.read(frames, dtype="float32", always_2d=True)
+            return chunk.mean(axis=1) if chunk.shape[1] > 1 else chunk[:, 0]
+
+        tail = np.zeros(0, dtype=np.float32)
+        current = read(block)
+        while len(current):
+            ahead = read(block)
+            padded = np.concatenate([tail, current, ahead[:context]])
+            out = resample(padded, orig_sr, target_sr)
+            start = len(tail) // in_step * out_step
+            stop = start + int(math.ceil(len(current) * target_sr / orig_sr))
+            yield np.ascontiguousarray(out[start:stop])
+            tail = current[-context:]
+            current = ahead
+
+
+def decode_audio(data, filename=None):
+    """Decode an in-memory upload to mono float32 at its native sample rate.
+
+    libsndfile handles WAV/FLAC/OGG (and MP3 on recent builds) straight from
+    memory. Containers it cannot read (m4a/aac) fall back to librosa's
+    audioread backend, which needs a real file, so only that path writes a
+    short-lived temporary file.
+    """
+    info = probe_audio(data)
+    try:
+        samples, sr = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+        samples = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+    except Exception:
+        samples, sr = _decode_with_librosa(data, filename)
+    return DecodedAudio(samples, sr, info=info, size_bytes=len(data))
+
+
+def _decode_with_librosa(data, filename=None):
+    import librosa
+
+    suffix = os.path.splitext(filename)[1] if filename else ""
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        tmp.write(data)
+        tmp.flush()
+        samples, sr = librosa.load(tmp.name, sr=None, mono=True)
+    return samples.astype(np.float32, copy=False), sr
+
+
+def validate_audio(data, info=None, decoded=None, min_bytes=100, min_samples=400, min_samplerate=8000):
+    """Reject uploads that are too small, too short or too low-rate.
+
+    Checks the probed header first so obviously bad files are rejected before
+    decoding; pass ``decoded`` to check formats that could not be probed.
+    """
+    if len(data) < min_bytes:
+        raise ValueError(f"Audio file too small ({len(data)} bytes)")
+
+    if info is not None:
+        samplerate, frames = info.samplerate, info.frames
+    elif decoded is not None:
+        samplerate, frames = decoded.samplerate, len(decoded.samples)
+    else:
+        return
+
+    if frames < min_samples:
+        raise ValueError(f"Audio too short: {frames} samples")
+    if samplerate < min_samplerate:
+        raise ValueError(f"Sample rate too low: {samplerate} Hz")
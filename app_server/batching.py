@@ -0,0 +1,165 @@
+# =============================================================================
+# Cross-Request Dynamic Micro-Batching
+# =============================================================================
+# Request threads submit single inputs to a MicroBatcher and block on a future.
+# A background worker drains the queue, waiting at most ``max_wait_ms`` for up
+# to ``max_batch_size`` inputs, runs one batched forward pass and hands each
+# caller back its own result.
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Collect concurrent requests into batches for a single ``batch_fn``.
+
+    ``batch_fn`` receives a list of inputs and must return a list of results
+    of the same length and order. If it raises, every caller in that batch
+    gets the exception.
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size=8, max_wait_ms=5.0):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._queue = queue.Queue()
+        self._worker = None
+        self._pid = None
+        self._submitted = 0
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._largest_batch = 0
+        self._batch_sizes = {}
+        self._busy_s = 0.0
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(), so a forked worker starts its own
+        if self._worker is not None and self._pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is not None and self._pid == os.getpid() and self._worker.is_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                self._reset_state()
+            self._pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+            self._worker.start()
+
+    def submit(self, item, timeout=None):
+        """Queue ``item`` and block until its result is ready."""
+        self._ensure_worker()
+        future = Future()
+        with self._stats_lock:
+            self._submitted += 1
+        self._queue.put((item, future))
+        return future.result(timeout=timeout)
+
+    def submit_many(self, items, timeout=None):
+        """Queue every item at once and block until all results are ready (in order).
+
+        The items share batches with each other and with concurrent callers,
+        and the model is still only ever called from the batcher thread.
+        """
+        self._ensure_worker()
+        futures = [Future() for _ in items]
+        with self._stats_lock:
+            self._submitted += len(futures)
+        for item, future in zip(items, futures):
+            self._queue.put((item, future))
+        return [future.result(timeout=timeout) for future in futures]
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            start = time.perf_counter()
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name} batch returned {len(results)} results for {len(items)} inputs")
+            except Exception as e:
+                with self._stats_lock:
+                    self._errors += 1
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            elapsed = time.perf_counter() - start
+
+            with self._stats_lock:
+                size = len(batch)
+                self._batches += 1
+                self._items += size
+                self._busy_s += elapsed
+                self._largest_batch = max(self._largest_batch, size)
+                self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait_s * 1000.0, 3),
+                "queue_depth": self._queue.qsize(),
+                "submitted": self._submitted,
+                "batches": self._batches,
+                "items": self._items,
+                "errors": self._errors,
+                "mean_batch_size": round(self._items / self._batches, 3) if self._batches else 0.0,
+                "largest_batch": self._largest_batch,
+                "batch_size_counts": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                "mean_batch_time_ms": round(1000.0 * self._busy_s / self._batches, 3) if self._batches else 0.0,
+            }
+
+
+def batcher_from_env(name, batch_fn, max_batch_size=8, max_wait_ms=5.0):
+    """Build a MicroBatcher whose limits can be overridden per model.
+
+    Reads ``BATCH_<NAME>_MAX_SIZE`` and ``BATCH_<NAME>_MAX_WAIT_MS``, e.g.
+    ``BATCH_ECG_MAX_SIZE=16``. A max size of 1 disables batching.
+    """
+    prefix = f"BATCH_{name.upper()}_"
+    return MicroBatcher(
+        name,
+        batch_fn,
+        max_batch_size=int(os.environ.get(prefix + "MAX_SIZE", max_batch_size)),
+        max_wait_ms=float(os.environ.get(prefix + "MAX_WAIT_MS", max_wait_ms)),
+    )
+
+
+def group_by_length(items):
+    """Map each distinct last-dimension size to the indices of the items that have it.
+
+    Used for audio models where zero-padding would change the result, so only
+    equal-length clips are stacked together.
+    """
+    groups = {}
+    for i, item in enumerate(items):
+        groups.setdefault(item.shape[-1], []).append(i)
+    return groups
@@ -0,0 +1,545 @@
+# =============================================================================
+# Pipeline Benchmark Suite
+# =============================================================================
+# Runs every analysis path stage by stage, in process, on the recordings in
+# Test_data/ and on synthetic inputs scaled 1x..100x, and writes one JSON
+# document per run:
+#
+#   ecg      parse (CSV) / inference, segmented inference on long recordings
+#   eeg      load / preprocess / inference / end to end
+#   drone    decode / preprocess / inference, sliding-window timeline
+#   voice    decode / preprocess / inference
+#   doppler  simulate, upload_car: decode / analyze / JSON / binary transport
+#   sar      statistics / render / analyze (synthetic GeoTIFFs)
+#
+# Each stage gets one warm-up call, ``--repeats`` timed calls (wall and
+# process CPU time; CPU above wall means the stage ran multi-threaded) and one
+# extra call under tracemalloc for the peak of Python/NumPy allocations.
+# Native buffers (torch, TensorFlow, GDAL) are not traced; rss_high_water_mb
+# is the process-wide peak after the stage.
+#
+# Models whose weights are absent are replaced by random-weight stand-ins with
+# the same interface, so timings stay comparable run to run (but not to the
+# real model). Inputs are seeded; torch runs on ``--threads`` threads.
+#
+#   python benchmark.py run -o bench.json --scales 1,10,100
+#   python benchmark.py compare baseline.json bench.json --threshold 0.15
+#   python benchmark.py run -o bench.json --baseline baseline.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA = os.path.join(HERE, "..", "Test_data")
+CASES = ("ecg", "eeg", "drone", "voice", "doppler", "sar")
+SEED = 1234
+
+
+# =============================================================================
+# Measurement
+# =============================================================================
+
+def _rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure(fn, repeats=5, memory=True):
+    """Time ``fn`` (after one warm-up call); returns (stats dict, last result)."""
+    result = fn()
+    walls, cpus = [], []
+    for _ in range(repeats):
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        result = fn()
+        walls.append(time.perf_counter() - wall_start)
+        cpus.append(time.process_time() - cpu_start)
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+
+    stats = {
+        "repeats": repeats,
+        "wall_s": round(float(np.median(walls)), 6),
+        "wall_min_s": round(min(walls), 6),
+        "wall_max_s": round(max(walls), 6),
+        "cpu_s": round(float(np.median(cpus)), 6),
+        "peak_traced_mb": round(peak_mb, 3) if peak_mb is not None else None,
+        "rss_high_water_mb": round(_rss_mb(), 1),
+    }
+    return stats, result
+
+
+class Bench:
+    """Collects one row per (case, input, scale, stage)."""
+
+    def __init__(self, repeats, memory=True, verbose=True):
+        self.repeats = repeats
+        self.memory = memory
+        self.verbose = verbose
+        self.rows = []
+
+    def runner(self, case, source, scale, **info):
+        def run(stage, fn, repeats=None):
+            # The pipelines log as they go; keep the cost, drop the output
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                stats, result = measure(fn, self.repeats if repeats is None else repeats, self.memory)
+            row = {"case": case, "input": source, "scale": scale, "stage": stage, **info, **stats}
+            self.rows.append(row)
+            if self.verbose:
+                print(f"  {case:8s} {source:40.40s} x{scale:<4g} {stage:18s} "
+                      f"wall {stats['wall_s'] * 1000:10.2f} ms  cpu {stats['cpu_s'] * 1000:10.2f} ms  "
+                      f"peak {stats['peak_traced_mb'] or 0:8.1f} MB")
+            return result
+        return run
+
+    def skip(self, case, source, scale, reason):
+        self.rows.append({"case": case, "input": source, "scale": scale, "stage": None, "skipped": reason})
+        if self.verbose:
+            print(f"  {case:8s} {source:40.40s} x{scale:<4g} skipped: {reason}")
+
+
+def key_of(row):
+    return row["case"], row["input"], row["scale"], row["stage"]
+
+
+# =============================================================================
+# Inputs
+# =============================================================================
+
+def upload(data, filename):
+    """A fresh in-memory upload, as Flask hands it to the handlers."""
+    from werkzeug.datastructures import FileStorage
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def test_files(folder, extensions):
+    path = os.path.join(TEST_DATA, folder)
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, n) for n in os.listdir(path) if n.lower().endswith(extensions))
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def synthetic_ecg_csv(rows, rng):
+    t = np.arange(rows) / 400.0
+    beats = np.sin(2 * np.pi * 1.2 * t) ** 15  # ~72 bpm spikes
+    leads = beats[:, None] * rng.uniform(0.3, 1.2, 12) + rng.normal(0, 0.02, (rows, 12))
+    buf = io.StringIO()
+    buf.write("I,II,III,aVR,aVL,aVF,V1,V2,V3,V4,V5,V6\n")
+    np.savetxt(buf, leads, delimiter=",", fmt="%.3f")
+    return buf.getvalue().encode("utf-8")
+
+
+def synthetic_eeg_npy(trials, rng):
+    buf = io.BytesIO()
+    np.save(buf, rng.normal(0, 20, (trials, 128, 19)).astype(np.float32))
+    return buf.getvalue()
+
+
+def synthetic_wav(seconds, rng, sr=16000, tone=440.0):
+    import soundfile as sf
+    t = np.arange(int(seconds * sr)) / sr
+    signal = 0.3 * np.sin(2 * np.pi * tone * t) + 0.05 * rng.normal(size=t.size)
+    buf = io.BytesIO()
+    sf.write(buf, signal.astype(np.float32), sr, format="WAV", subtype="PCM_16")
+    return buf.getvalue()
+
+
+def synthetic_geotiff(path, side, rng):
+    import rasterio
+    from rasterio.transform import from_origin
+    from rasterio.windows import Window
+    profile = {"driver": "GTiff", "width": side, "height": side, "count": 1, "dtype": "float32",
+               "tiled": True, "blockxsize": 256, "blockysize": 256,
+               "transform": from_origin(0, 0, 10, 10), "crs": "EPSG:32633"}
+    with rasterio.open(path, "w", **profile) as dst:
+        step = 1024
+        for row in range(0, side, step):
+            h = min(step, side - row)
+            # Gamma-distributed speckle (4 looks) over a smooth backscatter field
+            field = 0.05 + 0.04 * np.sin(np.arange(row, row + h) / 200.0)[:, None]
+            block = (field * rng.gamma(4.0, 0.25, (h, side))).astype(np.float32)
+            dst.write(block, 1, window=Window(0, row, side, h))
+
+
+# =============================================================================
+# Random-Weight Stand-ins
+# =============================================================================
+
+def _eeg_stand_in():
+    import torch.nn as nn
+    return nn.Sequential(nn.Conv1d(19, 16, 7, padding=3), nn.ReLU(), nn.AdaptiveAvgPool1d(1),
+                         nn.Flatten(), nn.Linear(16, 5)).eval()
+
+
+def _drone_stand_in():
+    """Log-mel front end + small conv net with the Hugging Face call interface."""
+    import torch
+    import torch.nn as nn
+    import torchaudio
+
+    class Processor:
+        def __call__(self, waveforms, sampling_rate=16000, return_tensors="pt", padding=True):
+            length = max(len(w) for w in waveforms)
+            batch = torch.zeros(len(waveforms), length)
+            for i, w in enumerate(waveforms):
+                batch[i, :len(w)] = torch.from_numpy(np.asarray(w, dtype=np.float32))
+            return {"input_values": batch}
+
+    class Classifier(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.config = SimpleNamespace(id2label={0: "no_drone", 1: "drone"})
+            self.frontend = torchaudio.transforms.MelSpectrogram(16000, n_fft=400, hop_length=160, n_mels=64)
+            self.net = nn.Sequential(nn.Conv1d(64, 128, 3, padding=1), nn.ReLU(), nn.AdaptiveAvgPool1d(1),
+                                     nn.Flatten(), nn.Linear(128, 2))
+
+        def forward(self, input_values):
+            return SimpleNamespace(logits=self.net(torch.log(self.frontend(input_values) + 1e-6)))
+
+    return Processor(), Classifier().eval()
+
+
+def _drone_weights_cached(model_name):
+    try:
+        from huggingface_hub import try_to_load_from_cache
+        return isinstance(try_to_load_from_cache(model_name, "config.json"), str)
+    except Exception:
+        return False
+
+
+def install_stand_ins(app, force=False):
+    """Register random-weight loaders for every model whose weights are missing."""
+    import torch
+    from voice_model import ECAPA_gender
+
+    def ecg_loader():
+        from model import get_model
+        return get_model(n_classes=6, last_layer="sigmoid")
+
+    def voice_loader():
+        return ECAPA_gender(C=1024).to(app.voice_device).eval()
+
+    missing = {
+        "ecg": force or not os.path.exists(app.ECG_MODEL_PATH),
+        "eeg": force or not os.path.exists(app.EEG_MODEL_PATH),
+        "drone": force or not _drone_weights_cached(app.MODEL_NAME),
+        "voice": force or not os.path.exists(app.VOICE_MODEL_PATH),
+    }
+    loaders = {"ecg": ecg_loader, "eeg": _eeg_stand_in, "drone": _drone_stand_in, "voice": voice_loader}
+    replaced = []
+    for name, absent in missing.items():
+        if absent:
+            app.models.register(name, loaders[name], "random-weight stand-in (benchmark)", "stand-in")
+            replaced.append(name)
+    torch.manual_seed(SEED)
+    return replaced
+
+
+# =============================================================================
+# Cases
+# =============================================================================
+
+def bench_ecg(app, bench, scales, rng):
+    from ecg_io import fit_ecg_input, load_ecg_array
+    inputs = [(os.path.basename(p), read(p), 1) for p in test_files("ECG", (".csv",))]
+    inputs += [("synthetic", synthetic_ecg_csv(4096 * s, rng), s) for s in scales]
+    for source, data, scale in inputs:
+        run = bench.runner("ecg", source, scale, bytes=len(data))
+        array = run("parse", lambda: fit_ecg_input(load_ecg_array(upload(data, "ecg.csv"))[0]))
+        run("inference", lambda: app._ecg_batch([array]))
+        if source == "synthetic":
+            recording = run("parse_full", lambda: load_ecg_array(upload(data, "ecg.csv"), max_rows=None)[0])
+            run("inference_segmented", lambda: app.predict_ecg_segments(recording))
+
+
+def bench_eeg(app, bench, scales, rng):
+    import torch
+    from array_io import open_npy_upload
+    inputs = [(os.path.basename(p), read(p), 1) for p in test_files("EEG", (".npy",))]
+    inputs += [("synthetic", synthetic_eeg_npy(64 * s, rng), s) for s in scales]
+    for source, data, scale in inputs:
+        run = bench.runner("eeg", source, scale, bytes=len(data))
+        signal = run("load", lambda: open_npy_upload(io.BytesIO(data), allow_pickle=True))
+        tensor = run("preprocess", lambda: app.preprocess_eeg_signal(signal))
+        run("inference", lambda: torch.softmax(app._eeg_batch([tensor])[0], dim=1))
+        run("end_to_end", lambda: app.run_eeg_model_inference(signal))
+
+
+def bench_drone(app, bench, scales, rng):
+    from audio_io import decode_audio
+    inputs = [(os.path.basename(p), read(p), 1) for p in test_files("Drone", (".wav",))]
+    inputs += [("synthetic", synthetic_wav(10.0 * s, rng), s) for s in scales]
+    for source, data, scale in inputs:
+        run = bench.runner("drone", source, scale, bytes=len(data))
+        audio = run("decode", lambda: decode_audio(data, "clip.wav"))
+        waveform = run("preprocess", lambda: audio.head(16000, 5.0))
+        run("inference", lambda: app._drone_batch([waveform]))
+        if source == "synthetic":
+            run("timeline", lambda: app.predict_drone_timeline(data, "clip.wav"),
+                repeats=min(bench.repeats, 3))
+
+
+def bench_voice(app, bench, scales, rng):
+    from audio_io import decode_audio
+    # Test_data has no speech; synthetic clips only
+    for scale in scales:
+        data = synthetic_wav(3.0 * scale, rng, sr=22050, tone=160.0)
+        run = bench.runner("voice", "synthetic", scale, bytes=len(data))
+        audio = run("decode", lambda: decode_audio(data, "voice.wav"))
+        tensor = run("preprocess", lambda: app.preprocess_audio_for_ecapa(audio))
+        run("inference", lambda: app._voice_batch([tensor]))
+
+
+def bench_doppler(app, bench, scales, rng):
+    from audio_io import decode_audio
+    from doppler import PassBy, encode_spectrogram_response
+    inputs = [(os.path.basename(p), read(p), 1) for p in test_files("Doppler", (".wav",))]
+    for scale in scales:
+        # 400 m track: 80 m/s is a 5 s pass-by, scaled by slowing the source down
+        passby = PassBy(1, 120.0, 80.0 / scale, 10.0)
+        run = bench.runner("doppler", "simulate", scale, seconds=round(passby.duration, 2))
+        data = run("simulate", lambda: passby.wav_header() + b"".join(passby.pcm16_blocks()))
+        inputs.append(("synthetic", data, scale))
+
+    for source, data, scale in inputs:
+        run = bench.runner("doppler", source, scale, bytes=len(data))
+        run("decode", lambda: decode_audio(data, "car.wav").resampled(44100))
+        result = run("analyze", lambda: app.compute_car_doppler(data, "car.wav"))
+        run("serialize_json", lambda: json.dumps({k: v.tolist() if isinstance(v, np.ndarray) else v
+                                                  for k, v in result.items()}))
+        run("serialize_binary", lambda: encode_spectrogram_response(result))
+
+
+def bench_sar(app, bench, scales, rng):
+    from sar_convert import render_raster_png
+    from sar_stats import raster_statistics
+    with tempfile.TemporaryDirectory(prefix="sar-bench-") as tmp:
+        for scale in scales:
+            side = int(round(1024 * np.sqrt(scale)))
+            path = os.path.join(tmp, f"scene_x{scale}.tif")
+            synthetic_geotiff(path, side, rng)
+            data = read(path)
+            run = bench.runner("sar", "synthetic", scale, pixels=side * side, bytes=len(data))
+            run("statistics", lambda: raster_statistics(path).stats())
+            run("render", lambda: render_raster_png(path))
+            run("analyze", lambda: app.run_sar_analysis(data, "scene.tif"))
+
+
+BENCHMARKS = {
+    "ecg": bench_ecg,
+    "eeg": bench_eeg,
+    "drone": bench_drone,
+    "voice": bench_voice,
+    "doppler": bench_doppler,
+    "sar": bench_sar,
+}
+
+
+# =============================================================================
+# Run / Compare
+# =============================================================================
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_suite(cases=CASES, scales=(1, 10), repeats=5, threads=1, memory=True, stand_ins=False, verbose=True):
+    """Run the selected cases; returns the JSON-serialisable report."""
+    # The app resolves model files and upload dirs relative to its own folder
+    os.chdir(HERE)
+    os.environ.pop("PRELOAD_MODELS", None)
+    os.environ.setdefault("RESULT_CACHE_ENABLED", "0")
+    import torch
+    import app
+
+    torch.set_num_threads(threads)
+    replaced = install_stand_ins(app, force=stand_ins)
+    bench = Bench(repeats, memory=memory, verbose=verbose)
+    rng = np.random.default_rng(SEED)
+    started = time.perf_counter()
+
+    for case in cases:
+        if verbose:
+            print(f"▶ {case}")
+        try:
+            BENCHMARKS[case](app, bench, scales, rng)
+        except ImportError as e:
+            bench.skip(case, "*", 0, f"missing dependency: {e}")
+        except Exception as e:
+            bench.skip(case, "*", 0, f"{type(e).__name__}: {e}")
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch_threads": threads,
+            "repeats": repeats,
+            "scales": list(scales),
+            "seed": SEED,
+            "stand_ins": replaced,
+            "total_seconds": round(time.perf_counter() - started, 3),
+        },
+        "results": bench.rows,
+    }
+
+
+def compare(baseline, current, threshold=0.15, min_delta_s=0.005, memory_threshold=None):
+    """Stage-by-stage comparison; a stage regresses when its median wall time
+    grows by more than ``threshold`` (fraction) *and* ``min_delta_s`` seconds.
+
+    Coverage losses regress too: a case skipped in the current run is
+    reported once as ``skipped``, and any other baseline stage the current
+    run did not produce as ``missing``.
+    """
+    base = {key_of(r): r for r in baseline["results"] if r.get("stage")}
+    seen = set()
+    skipped = set()
+    rows = []
+    for row in current["results"]:
+        if not row.get("stage"):
+            group = key_of(row)[:3]
+            skipped.add(group)
+            rows.append({"key": (*group, "*"), "status": "skipped", "reason": row.get("skipped")})
+            continue
+        seen.add(key_of(row))
+        old = base.get(key_of(row))
+        if old is None:
+            rows.append({"key": key_of(row), "status": "new", "wall_s": row["wall_s"]})
+            continue
+        delta = row["wall_s"] - old["wall_s"]
+        ratio = row["wall_s"] / old["wall_s"] if old["wall_s"] > 0 else float("inf")
+        status = "ok"
+        if ratio > 1 + threshold and delta > min_delta_s:
+            status = "regression"
+        elif ratio < 1 - threshold and -delta > min_delta_s:
+            status = "improvement"
+        if (memory_threshold is not None and status == "ok" and old.get("peak_traced_mb")
+                and row.get("peak_traced_mb") is not None
+                and row["peak_traced_mb"] > old["peak_traced_mb"] * (1 + memory_threshold)):
+            status = "memory_regression"
+        rows.append({"key": key_of(row), "status": status, "baseline_s": old["wall_s"],
+                     "wall_s": row["wall_s"], "ratio": round(ratio, 3),
+                     "baseline_peak_mb": old.get("peak_traced_mb"), "peak_mb": row.get("peak_traced_mb")})
+    for key, old in base.items():
+        if key not in seen and key[:3] not in skipped:
+            rows.append({"key": key, "status": "missing", "baseline_s": old["wall_s"]})
+    return rows
+
+
+REGRESSION_STATUSES = ("regression", "memory_regression", "missing", "skipped")
+
+
+def print_comparison(rows):
+    for row in rows:
+        case, source, scale, stage = row["key"]
+        label = f"{case}/{source[:30]}/x{scale:g}/{stage}"
+        if row["status"] == "new":
+            print(f"  NEW          {label:70s} {row['wall_s'] * 1000:10.2f} ms")
+            continue
+        if row["status"] == "skipped":
+            print(f"❌ {row['status']:12s} {label:70s} {row['reason']}")
+            continue
+        if row["status"] == "missing":
+            print(f"❌ {row['status']:12s} {label:70s} {row['baseline_s'] * 1000:10.2f} -> (not run)")
+            continue
+        marker = {"ok": "  ", "improvement": "✅", "regression": "❌", "memory_regression": "⚠️"}[row["status"]]
+        print(f"{marker} {row['status']:12s} {label:70s} {row['baseline_s'] * 1000:10.2f} -> "
+              f"{row['wall_s'] * 1000:10.2f} ms  (x{row['ratio']})")
+    regressions = [r for r in rows if r["status"] in REGRESSION_STATUSES]
+    print(f"{len(regressions)} regression(s) in {len(rows)} stage(s)")
+    return regressions
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark DeepSignal analysis pipelines stage by stage")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="run the benchmark suite")
+    run_p.add_argument("-o", "--output", default="bench.json", help="JSON report path")
+    run_p.add_argument("--cases", default=",".join(CASES), help=f"comma-separated subset of {CASES}")
+    run_p.add_argument("--scales", default="1,10", help="synthetic input scales, e.g. 1,10,100")
+    run_p.add_argument("--repeats", type=int, default=5, help="timed calls per stage (after one warm-up)")
+    run_p.add_argument("--threads", type=int, default=1, help="torch intra-op threads")
+    run_p.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    run_p.add_argument("--stand-ins", action="store_true", help="use random-weight models even if weights exist")
+    run_p.add_argument("--baseline", help="compare against this report after the run")
+    run_p.add_argument("--threshold", type=float, default=0.15)
+
+    cmp_p = sub.add_parser("compare", help="compare two reports")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("current")
+    cmp_p.add_argument("--threshold", type=float, default=0.15,
+                       help="allowed relative slowdown of a stage's median wall time")
+    cmp_p.add_argument("--min-delta-ms", type=float, default=5.0,
+                       help="ignore slowdowns smaller than this many milliseconds")
+    cmp_p.add_argument("--memory-threshold", type=float, default=None,
+                       help="also flag stages whose traced peak grows by this fraction")
+    args = parser.parse_args(argv)
+
+    # run_suite switches to this folder; resolve the user's paths first
+    for name in ("output", "baseline", "current"):
+        if getattr(args, name, None):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    if args.command == "run":
+        cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+        unknown = set(cases) - set(CASES)
+        if unknown:
+            parser.error(f"unknown cases: {sorted(unknown)}")
+        scales = [float(s) if "." in s else int(s) for s in args.scales.split(",") if s.strip()]
+        report = run_suite(cases, scales, args.repeats, args.threads, not args.no_memory, args.stand_ins)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(report['results'])} rows to {args.output} in {report['meta']['total_seconds']}s")
+        if args.baseline:
+            regressions = print_comparison(compare(_load(args.baseline), report, args.threshold))
+            return 1 if regressions else 0
+        return 0
+
+    regressions = print_comparison(compare(_load(args.baseline), _load(args.current), args.threshold,
+                                           args.min_delta_ms / 1000.0, args.memory_threshold))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# =============================================================================
+# Bounded LRU Cache
+# =============================================================================
+# Shared by the features that keep computed results around between requests
+# (spectrogram tiles, synthesized audio, ...). Entries are evicted least
+# recently used first once either the entry count or the byte budget is hit.
+# Values that hold resources (open files) can be released through ``on_evict``.
+
+import threading
+from collections import OrderedDict
+
+
+def sizeof(value):
+    """Best-effort payload size in bytes (arrays and bytes; 0 for anything else)."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    nbytes = getattr(value, "nbytes", None)
+    if nbytes is not None:
+        return int(nbytes)
+    if isinstance(value, (tuple, list)):
+        return sum(sizeof(item) for item in value)
+    return 0
+
+
+class LRUCache:
+    """Thread-safe LRU mapping bounded by entry count and total payload bytes."""
+
+    def __init__(self, max_entries=128, max_bytes=None, name="cache", on_evict=None):
+        self.name = name
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = int(max_bytes) if max_bytes else None
+        self.on_evict = on_evict  # on_evict(key, value), called outside the lock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return value  # Never cache something bigger than the whole budget
+        dropped = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+                if old[0] is not value:
+                    dropped.append((key, old[0]))
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self.bytes > self.max_bytes):
+                evicted_key, (evicted, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+                dropped.append((evicted_key, evicted))
+        self._release(dropped)
+        return value
+
+    def pop(self, key, default=None):
+        """Remove ``key`` (releasing it through ``on_evict``) and return its value."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self.bytes -= entry[1]
+        self._release([(key, entry[0])])
+        return entry[0]
+
+    def _release(self, dropped):
+        if self.on_evict is None:
+            return
+        for key, value in dropped:
+            try:
+                self.on_evict(key, value)
+            except Exception as e:
+                print(f"⚠️ {self.name}: releasing evicted entry failed: {e}")
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for ``key``, computing and storing it on a miss.
+
+        The computation runs outside the lock; two concurrent misses for the
+        same key both compute and the second store wins, which is harmless.
+        """
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            dropped = [(key, entry[0]) for key, entry in self._entries.items()]
+            self._entries.clear()
+            self.bytes = 0
+        self._release(dropped)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,321 @@
+# =============================================================================
+# Doppler Analysis Helpers
+# =============================================================================
+
+import json
+import math
+import os
+
+import numpy as np
+
+# Upper bound on STFT frames for /upload_car; longer recordings get a larger hop
+DOPPLER_MAX_FRAMES = int(os.environ.get("DOPPLER_MAX_FRAMES", 4096))
+
+
+def choose_stft_params(n_samples, n_fft=8192, hop_length=256, max_frames=DOPPLER_MAX_FRAMES):
+    """Pick (n_fft, hop_length) so a recording never yields more than ~max_frames frames.
+
+    Short recordings keep the full-resolution defaults. Longer ones grow the
+    hop, and the FFT grows with it (in powers of two) so consecutive windows
+    still overlap and no audio falls between frames.
+    """
+    hop = max(hop_length, int(math.ceil(n_samples / max(1, max_frames))))
+    while n_fft < hop:
+        n_fft *= 2
+    return n_fft, hop
+
+
+def track_dominant_frequency(magnitude, freqs, rel_height=0.3):
+    """Dominant frequency of every STFT frame, vectorized over all frames.
+
+    Equivalent to running ``scipy.signal.find_peaks(col, height=col.max() * rel_height,
+    distance=...)`` on each column, taking the strongest peak and refining it
+    with parabolic interpolation, falling back to the column argmax when a
+    column has no peak. The strongest peak always survives find_peaks'
+    distance filter, so only local maxima and the height threshold matter.
+    (Exactly flat-topped peaks, where find_peaks picks the plateau centre, are
+    not treated as peaks here; STFT magnitudes practically never tie.)
+
+    ``magnitude`` is (bins, frames); ``freqs`` holds the bin centre frequencies.
+    """
+    magnitude = np.asarray(magnitude)
+    n_bins, n_frames = magnitude.shape
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float64)
+    fallback = freqs[np.argmax(magnitude, axis=0)]
+    if n_bins < 3:
+        return fallback
+
+    interior = magnitude[1:-1]
+    threshold = magnitude.max(axis=0) * rel_height
+    is_peak = (interior > magnitude[:-2]) & (interior > magnitude[2:]) & (interior >= threshold)
+    has_peak = is_peak.any(axis=0)
+
+    # Strongest qualifying peak per frame (index into the full bin axis)
+    idx = np.argmax(np.where(is_peak, interior, -np.inf), axis=0) + 1
+    frames = np.arange(n_frames)
+    y0 = magnitude[idx - 1, frames]
+    y1 = magnitude[idx, frames]
+    y2 = magnitude[idx + 1, frames]
+
+    # Parabolic interpolation around the peak bin
+    denom = y0 - 2 * y1 + y2
+    safe = denom != 0
+    offset = np.where(safe, 0.5 * (y0 - y2) / np.where(safe, denom, 1), 0)
+    refined = freqs[idx] + offset * (freqs[1] - freqs[0])
+
+    return np.where(has_peak, refined, fallback)
+
+
+# =============================================================================
+# Compact Spectrogram Transport
+# =============================================================================
+# /upload_car?format=binary returns a multipart/form-data body (readable in the
+# browser with ``response.formData()``): a small JSON "meta" part with the
+# scalar results, shapes and scales, plus binary parts for the spectrogram and
+# the per-frame tracks, downsampled on the server to the requested pixel size.
+
+def _pool_edges(n, bins):
+    bins = max(1, min(int(bins), n))
+    return np.linspace(0, n, bins + 1).round().astype(np.int64)
+
+
+def downsample_max(array, bins, axis):
+    """Max-pool ``array`` along ``axis`` into at most ``bins`` buckets (keeps tonal lines)."""
+    n = array.shape[axis]
+    if n <= bins:
+        return array
+    return np.maximum.reduceat(array, _pool_edges(n, bins)[:-1], axis=axis)
+
+
+def downsample_mean(values, bins):
+    """Average a 1D track into at most ``bins`` buckets."""
+    n = len(values)
+    if n <= bins:
+        return np.asarray(values, dtype=np.float32)
+    edges = _pool_edges(n, bins)
+    return (np.add.reduceat(values, edges[:-1]) / np.diff(edges)).astype(np.float32)
+
+
+def quantize_spectrogram(db, dtype="uint8"):
+    """Quantize a dB spectrogram; returns (array, scale, offset) with value = offset + q * scale."""
+    if dtype == "float16":
+        return db.astype("<f2"), 1.0, 0.0
+    if dtype != "uint8":
+        raise ValueError("dtype must be 'uint8' or 'float16'")
+    lo, hi = float(np.min(db)), float(np.max(db))
+    scale = (hi - lo) / 255.0 or 1.0
+    q = np.clip(np.round((db - lo) / scale), 0, 255).astype(np.uint8)
+    return q, scale, lo
+
+
+def encode_multipart(parts):
+    """Encode ``(name, content_type, payload, filename)`` parts as multipart/form-data."""
+    boundary = "deepsignal-" + os.urandom(12).hex()
+    chunks = []
+    for name, content_type, payload, filename in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename:
+            disposition += f'; filename="{filename}"'
+        chunks.append(
+            f"--{boundary}\r\nContent-Disposition: {disposition}\r\n"
+            f"Content-Type: {content_type}\r\n\r\n".encode("ascii"))
+        chunks.append(payload)
+        chunks.append(b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode("ascii"))
+    return b"".join(chunks), f"multipart/form-data; boundary={boundary}"
+
+
+def encode_spectrogram_response(result, width=1024, height=512, dtype="uint8"):
+    """Pack a /upload_car result as (body, content_type) for the binary transport.
+
+    Parts:
+      meta         JSON: scalar results plus shapes, scales and axis ranges
+      spectrogram  (height, width) uint8/float16, row-major, row 0 = lowest frequency
+      tracks       (3, width) little-endian float32 rows: times, frequencies, velocities
+    """
+    db = np.asarray(result["spectrogram"], dtype=np.float32)
+    db = downsample_max(downsample_max(db, height, axis=0), width, axis=1)
+    spectrogram, scale, offset = quantize_spectrogram(db, dtype)
+
+    tracks = np.stack([
+        downsample_mean(result["times"], width),
+        downsample_mean(result["frequencies"], width),
+        downsample_mean(result["velocities"], width),
+    ]).astype("<f4")
+
+    freq_axis = result["freq_axis"]
+    times = result["times"]
+    meta = {key: value for key, value in result.items()
+            if key not in ("spectrogram", "times", "frequencies", "velocities", "freq_axis")}
+    meta.update({
+        "spectrogram": {
+            "shape": list(spectrogram.shape),
+            "dtype": spectrogram.dtype.name,
+            "scale": scale,
+            "offset": offset,
+            "freq_min": float(freq_axis[0]) if len(freq_axis) else 0.0,
+            "freq_max": float(freq_axis[-1]) if len(freq_axis) else 0.0,
+            "time_min": float(times[0]) if len(times) else 0.0,
+            "time_max": float(times[-1]) if len(times) else 0.0,
+            "source_shape": [len(freq_axis), len(times)],
+        },
+        "tracks": {"shape": list(tracks.shape), "dtype": "float32", "rows": ["times", "frequencies", "velocities"]},
+    })
+
+    return encode_multipart([
+        ("meta", "application/json", json.dumps(meta).encode("utf-8"), None),
+        ("spectrogram", "application/octet-stream", np.ascontiguousarray(spectrogram).tobytes(), "spectrogram.bin"),
+        ("tracks", "application/octet-stream", tracks.tobytes(), "tracks.bin"),
+    ])
+
+
+# =============================================================================
+# Pass-by Synthesis (/simulate)
+# =============================================================================
+# The demo signal is synthesized in fixed-size blocks. Phase, the noise
+# filter's state and the sample clock are carried across blocks, so the
+# concatenated blocks are one continuous signal and memory stays flat however
+# long a slow pass-by lasts. The WAV header only needs the sample count, which
+# is known up front, so bytes can be streamed as soon as the first block is done.
+
+SIM_SAMPLE_RATE = 44100
+SIM_SPEED_OF_SOUND = 343.0
+SIM_X_START, SIM_X_END = -200.0, 200.0
+SIM_BLOCK = 1 << 16
+SIM_MAX_SECONDS = float(os.environ.get("SIM_MAX_SECONDS", 600))  # longest pass-by /simulate will synthesize
+ENGINE_HARMONICS = [1.0, 0.6, 0.35, 0.18, 0.1]
+SIREN_TONES = (700.0, 900.0)
+SIREN_PERIOD = 0.3  # seconds per siren tone
+
+
+class PassBy:
+    """One simulated pass-by: a source moving along x past a listener at ``dist``."""
+
+    def __init__(self, sig_type, freq, speed, dist, fs=SIM_SAMPLE_RATE, alpha=1.0):
+        if not speed > 0:
+            raise ValueError("speed must be positive")
+        self.sig_type = int(sig_type)
+        self.freq = float(freq)
+        self.speed = float(speed)
+        self.dist = float(dist)
+        self.fs = int(fs)
+        self.alpha = alpha
+        self.duration = abs(SIM_X_END - SIM_X_START) / self.speed
+        # Bounded both ways: a crawl would stream gigabytes, a near-infinite
+        # speed would leave no samples at all
+        if self.duration > SIM_MAX_SECONDS:
+            raise ValueError(f"speed too low: the pass-by would last {self.duration:.0f} s "
+                             f"(limit {SIM_MAX_SECONDS:g} s, so at least "
+                             f"{abs(SIM_X_END - SIM_X_START) / SIM_MAX_SECONDS:g} m/s)")
+        self.n_samples = int(self.fs * self.duration)
+        if self.n_samples < 1:
+            raise ValueError("speed too high: the pass-by would last less than one sample")
+        self.ramp = int(0.02 * self.fs)
+        self.noise_width = self.fs // 4000
+
+    def _geometry(self, n):
+        t = n * (self.duration / self.n_samples)
+        x = SIM_X_START + self.speed * t
+        d = np.sqrt(x ** 2 + self.dist ** 2)
+        v_radial = -(x * self.speed) / (d + 1e-12)
+        return t, d, v_radial
+
+    def _envelope(self, n, d):
+        att = 1.0 / (d ** self.alpha + 1e-12)
+        ramp = max(self.ramp - 1, 1)
+        fade = np.minimum(1.0, np.minimum(n / ramp, (self.n_samples - 1 - n) / ramp))
+        fade = np.clip(fade, 0.0, 1.0)
+        return att * fade
+
+    def _waveform(self, phase):
+        if self.sig_type == 1:
+            signal = np.zeros_like(phase)
+            for k, amp in enumerate(ENGINE_HARMONICS, start=1):
+                signal += amp * np.sin(k * phase)
+            return signal
+        if self.sig_type == 2:
+            return np.sign(np.sin(phase))
+        if self.sig_type == 3:
+            return 2 * ((phase / (2 * np.pi)) % 1) - 1
+        return np.sin(phase)
+
+    def _source_freq(self, t):
+        if self.sig_type == 4:
+            return np.where(np.floor(t / SIREN_PERIOD) % 2 == 0, *SIREN_TONES)
+        return self.freq
+
+    def raw_blocks(self, start=0, stop=None, block=SIM_BLOCK, rng=None):
+        """Yield un-normalized float64 blocks for samples [start, stop)."""
+        stop = self.n_samples if stop is None else min(stop, self.n_samples)
+        rng = rng or np.random.default_rng()
+        c = SIM_SPEED_OF_SOUND
+        phase0 = 0.0
+        # Moving-average ('same') noise filter: each output sample averages the
+        # noise from ``behind`` samples back to ``ahead`` samples forward (zero
+        # outside the signal), so the buffer carries ``width - 1`` samples over
+        width = self.noise_width
+        ahead = (width - 1) // 2
+        behind = width - 1 - ahead
+        noise_buf = np.zeros(max(0, behind - start))
+        noise_pos = max(start - behind, 0)
+
+        for b0 in range(start, stop, block):
+            n = np.arange(b0, min(b0 + block, stop), dtype=np.float64)
+            t, d, v_radial = self._geometry(n)
+
+            f_inst = np.clip(self._source_freq(t) * (c / (c - v_radial)), 20.0, self.fs / 4.0)
+            phase = phase0 + 2.0 * np.pi * np.cumsum(f_inst) / self.fs
+            phase0 = phase[-1] % (2.0 * np.pi)
+            signal = self._waveform(phase)
+
+            if self.sig_type == 1:
+                draw_end = min(b0 + len(n) + ahead, self.n_samples)
+                fresh = rng.normal(0.0, 1.0, max(0, draw_end - noise_pos))
+                noise_pos = max(noise_pos, draw_end)
+                buf = np.concatenate([noise_buf, fresh])
+                buf = np.pad(buf, (0, len(n) + width - 1 - len(buf)))
+                signal += 0.25 * np.convolve(buf, np.ones(width) / width, mode="valid")
+                noise_buf = buf[len(n):]
+
+            yield signal * self._envelope(n, d)
+
+    def peak(self, window_seconds=0.2):
+        """Peak |sample| of the raw signal, from a short window at closest approach.
+
+        Attenuation is largest where the source passes the listener, and every
+        waveform goes through all of its phases within the window, so this
+        matches the whole-signal peak without synthesizing the whole signal.
+        """
+        centre = int(self.n_samples * (0.0 - SIM_X_START) / (SIM_X_END - SIM_X_START))
+        half = int(self.fs * window_seconds / 2)
+        start, stop = max(centre - half, 0), min(centre + half, self.n_samples)
+        if stop <= start:
+            start, stop = 0, self.n_samples
+        peak = max((np.max(np.abs(b)) for b in self.raw_blocks(start, stop, block=stop - start)), default=0.0)
+        return peak or 1.0
+
+    def pcm16_blocks(self, block=SIM_BLOCK):
+        """Peak-normalized 16-bit PCM blocks of the whole pass-by."""
+        gain = 32767.0 / self.peak()
+        for signal in self.raw_blocks(block=block):
+            yield np.clip(np.round(signal * gain), -32768, 32767).astype("<i2").tobytes()
+
+    def wav_size(self):
+        return 44 + 2 * self.n_samples
+
+    def wav_header(self):
+        return wav_header(self.n_samples, self.fs)
+
+
+def wav_header(n_samples, fs, channels=1, sample_width=2):
+    """Canonical 44-byte PCM WAV header for a known number of frames."""
+    data_size = n_samples * channels * sample_width
+    return b"".join([
+        b"RIFF", (36 + data_size).to_bytes(4, "little"), b"WAVE",
+        b"fmt ", (16).to_bytes(4, "little"), (1).to_bytes(2, "little"),
+        channels.to_bytes(2, "little"), int(fs).to_bytes(4, "little"),
+        (int(fs) * channels * sample_width).to_bytes(4, "little"),
+        (channels * sample_width).to_bytes(2, "little"), (8 * sample_width).to_bytes(2, "little"),
+        b"data", data_size.to_bytes(4, "little"),
+    ])
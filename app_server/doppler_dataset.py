@@ -0,0 +1,263 @@
+# =============================================================================
+# Batch Doppler Dataset Generator
+# =============================================================================
+# Synthesizes labelled pass-by clips over a parameter grid with the same
+# physics as /simulate (radial-velocity Doppler shift, harmonic engine model,
+# siren switching, 1/d^alpha attenuation). Clips are fixed-length windows
+# around the closest approach, synthesized a batch at a time with
+# broadcasting, spread over a process pool and streamed into one .npz:
+#
+#   audio        (clips, samples) int16 (peak-normalized) or float32 (raw)
+#   type, freq, speed, dist, offset, f_approach, f_recede   (clips,) labels
+#   sample_rate, clip_seconds, alpha                        scalars
+#
+# The archive loads with a plain ``np.load``. Every batch has its own seed,
+# so the output does not depend on the number of workers.
+#
+# CLI:
+#   python doppler_dataset.py --speeds 5:40:1 --freqs 200,400,800 \
+#       --dists 5,10,20 --types 0,1,4 --repeats 2 -o doppler_train.npz
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from doppler import (SIM_SPEED_OF_SOUND, SIM_X_START, ENGINE_HARMONICS,
+                     SIREN_TONES, SIREN_PERIOD)
+
+SIGNAL_TYPES = {0: "sine", 1: "engine", 2: "square", 3: "sawtooth", 4: "siren"}
+LABELS = ("type", "freq", "speed", "dist", "offset", "f_approach", "f_recede")
+BATCH_MAX_SAMPLES = 1 << 22  # per batch: ~32 MB for each float64 intermediate
+
+
+def parameter_grid(types, freqs, speeds, dists, repeats=1):
+    """Cartesian product of the grid as (n,) label columns."""
+    rows = list(itertools.product(types, freqs, speeds, dists, range(max(1, int(repeats)))))
+    if not rows:
+        raise ValueError("Empty parameter grid")
+    columns = np.array([row[:4] for row in rows], dtype=np.float64)
+    speeds = columns[:, 2]
+    if np.any(speeds <= 0):
+        raise ValueError("speeds must be positive")
+    if np.any(~np.isin(columns[:, 0], list(SIGNAL_TYPES))):
+        raise ValueError(f"types must be in {sorted(SIGNAL_TYPES)}")
+    return {
+        "type": columns[:, 0].astype(np.int8),
+        "freq": columns[:, 1].astype(np.float32),
+        "speed": speeds.astype(np.float32),
+        "dist": columns[:, 3].astype(np.float32),
+    }
+
+
+def synthesize_batch(types, freqs, speeds, dists, offsets, sample_rate, n_samples,
+                     alpha=1.0, rng=None):
+    """Synthesize one batch of clips with broadcasting; returns (clips, samples) float64.
+
+    ``offsets`` is each clip's start time in seconds relative to the closest
+    approach (x = 0), so ``-clip_seconds / 2`` centres the clip on it.
+    """
+    rng = rng or np.random.default_rng()
+    c = SIM_SPEED_OF_SOUND
+    fs = float(sample_rate)
+    speeds = np.asarray(speeds, dtype=np.float64)[:, None]
+    dists = np.asarray(dists, dtype=np.float64)[:, None]
+    types = np.asarray(types)
+
+    t = np.asarray(offsets, dtype=np.float64)[:, None] + np.arange(n_samples) / fs
+    x = speeds * t
+    d = np.sqrt(x ** 2 + dists ** 2)
+    v_radial = -(x * speeds) / (d + 1e-12)
+
+    # Siren tones switch on time since the pass-by started, as in /simulate
+    source = np.broadcast_to(np.asarray(freqs, dtype=np.float64)[:, None], t.shape)
+    sirens = types == 4
+    if sirens.any():
+        t_start = t[sirens] - SIM_X_START / speeds[sirens]
+        source = source.copy()
+        source[sirens] = np.where(np.floor(t_start / SIREN_PERIOD) % 2 == 0, *SIREN_TONES)
+
+    f_inst = np.clip(source * (c / (c - v_radial)), 20.0, fs / 4.0)
+    # Random start phase: a clip is a window into a longer signal
+    phase = rng.uniform(0.0, 2.0 * np.pi, (len(types), 1)) + 2.0 * np.pi * np.cumsum(f_inst, axis=1) / fs
+    del f_inst, source, v_radial, x
+
+    signal = np.sin(phase)  # sine (type 0) and the siren
+    rows = types == 1
+    if rows.any():
+        p = phase[rows]
+        engine = np.zeros_like(p)
+        for k, amp in enumerate(ENGINE_HARMONICS, start=1):
+            engine += amp * np.sin(k * p)
+        # Low-passed noise: moving average of width fs/4000, as in /simulate
+        width = max(1, int(fs) // 4000)
+        noise = rng.normal(0.0, 1.0, (p.shape[0], n_samples + width - 1))
+        cs = np.cumsum(noise, axis=1)
+        cs = np.concatenate([np.zeros((p.shape[0], 1)), cs], axis=1)
+        engine += 0.25 * (cs[:, width:] - cs[:, :-width]) / width
+        signal[rows] = engine
+    rows = types == 2
+    if rows.any():
+        signal[rows] = np.sign(signal[rows])
+    rows = types == 3
+    if rows.any():
+        signal[rows] = 2 * ((phase[rows] / (2 * np.pi)) % 1) - 1
+
+    signal *= 1.0 / (d ** alpha + 1e-12)
+    return signal
+
+
+def _synthesize_chunk(spec):
+    """Process-pool entry point: one batch of clips, encoded for the archive."""
+    (index, seed, labels, sample_rate, n_samples, alpha, normalize) = spec
+    rng = np.random.default_rng([seed, index])
+    signal = synthesize_batch(labels["type"], labels["freq"], labels["speed"], labels["dist"],
+                              labels["offset"], sample_rate, n_samples, alpha=alpha, rng=rng)
+    if normalize:
+        peak = np.max(np.abs(signal), axis=1, keepdims=True)
+        signal *= 32767.0 / np.where(peak > 0, peak, 1.0)
+        return np.round(signal).astype("<i2")
+    return signal.astype("<f4")
+
+
+def _write_npy(zf, name, array):
+    with zf.open(name + ".npy", "w", force_zip64=True) as fp:
+        np.lib.format.write_array(fp, np.asarray(array), allow_pickle=False)
+
+
+def generate_dataset(output, types=(0,), freqs=(440.0,), speeds=(20.0,), dists=(10.0,), repeats=1,
+                     clip_seconds=4.0, sample_rate=16000, jitter_seconds=0.0, alpha=1.0,
+                     normalize=True, seed=0, batch_size=64, workers=None, compresslevel=1,
+                     max_batch_samples=BATCH_MAX_SAMPLES, progress=lambda *args: None):
+    """Synthesize the grid and stream it into ``output`` (.npz); returns a summary dict.
+
+    Batches shrink below ``batch_size`` clips for long clips, so a batch
+    never holds more than ``max_batch_samples`` samples (in float64).
+    """
+    started = time.perf_counter()
+    labels = parameter_grid(types, freqs, speeds, dists, repeats)
+    n_clips = len(labels["type"])
+    n_samples = int(round(clip_seconds * sample_rate))
+    if n_samples <= 0:
+        raise ValueError("clip_seconds * sample_rate must be at least one sample")
+
+    rng = np.random.default_rng(seed)
+    jitter = rng.uniform(-1.0, 1.0, n_clips) * jitter_seconds if jitter_seconds else np.zeros(n_clips)
+    labels["offset"] = (jitter - clip_seconds / 2).astype(np.float32)
+    c = SIM_SPEED_OF_SOUND
+    labels["f_approach"] = (labels["freq"] * c / (c - labels["speed"])).astype(np.float32)
+    labels["f_recede"] = (labels["freq"] * c / (c + labels["speed"])).astype(np.float32)
+
+    batch_size = max(1, min(int(batch_size), int(max_batch_samples) // n_samples))
+    specs = [
+        (i, seed, {key: value[start:start + batch_size] for key, value in labels.items()},
+         sample_rate, n_samples, alpha, normalize)
+        for i, start in enumerate(range(0, n_clips, batch_size))
+    ]
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    dtype = np.dtype("<i2" if normalize else "<f4")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    compression = zipfile.ZIP_DEFLATED if compresslevel else zipfile.ZIP_STORED
+    with zipfile.ZipFile(output, "w", compression=compression,
+                         compresslevel=compresslevel or None, allowZip64=True) as zf:
+        # audio.npy is written batch by batch; only a few batches are in memory
+        with zf.open("audio.npy", "w", force_zip64=True) as fp:
+            header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False,
+                      "shape": (n_clips, n_samples)}
+            np.lib.format.write_array_header_2_0(fp, header)
+            if workers == 1:
+                chunks = map(_synthesize_chunk, specs)
+                pool = None
+            else:
+                # spawn: safe to start from a threaded server. Children import this
+                # module (numpy only) and re-import the parent's __main__ script,
+                # so entry points must keep their start-up under a __main__ guard
+                pool = ProcessPoolExecutor(max_workers=workers,
+                                           mp_context=multiprocessing.get_context("spawn"))
+                chunks = pool.map(_synthesize_chunk, specs)
+            try:
+                for i, chunk in enumerate(chunks):
+                    fp.write(chunk.tobytes())
+                    progress((i + 1) / len(specs), f"{min((i + 1) * batch_size, n_clips)}/{n_clips} clips")
+            finally:
+                if pool is not None:
+                    pool.shutdown(cancel_futures=True)
+
+        for key in LABELS:
+            _write_npy(zf, key, labels[key])
+        _write_npy(zf, "sample_rate", np.int32(sample_rate))
+        _write_npy(zf, "clip_seconds", np.float32(clip_seconds))
+        _write_npy(zf, "alpha", np.float32(alpha))
+
+    elapsed = time.perf_counter() - started
+    return {
+        "path": output,
+        "clips": n_clips,
+        "samples_per_clip": n_samples,
+        "sample_rate": sample_rate,
+        "dtype": dtype.name,
+        "bytes": os.path.getsize(output),
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "clips_per_minute": round(n_clips / elapsed * 60, 1) if elapsed > 0 else None,
+    }
+
+
+def parse_values(text, cast=float):
+    """'5,10,20' -> [5, 10, 20]; 'start:stop:step' -> inclusive range."""
+    if ":" in text:
+        start, stop, step = (float(v) for v in text.split(":"))
+        return [cast(v) for v in np.arange(start, stop + step / 2, step)]
+    return [cast(v) for v in text.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a labelled Doppler pass-by dataset (.npz)")
+    parser.add_argument("-o", "--output", required=True, help="output .npz path")
+    parser.add_argument("--types", default="0", help="signal types " + str(SIGNAL_TYPES))
+    parser.add_argument("--freqs", default="440", help="source frequencies in Hz (list or start:stop:step)")
+    parser.add_argument("--speeds", default="20", help="speeds in m/s (list or start:stop:step)")
+    parser.add_argument("--dists", default="10", help="closest-approach distances in m (list or start:stop:step)")
+    parser.add_argument("--repeats", type=int, default=1, help="noise/jitter variants per grid point")
+    parser.add_argument("--clip-seconds", type=float, default=4.0)
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--jitter", type=float, default=0.0, help="random clip offset (+/- seconds)")
+    parser.add_argument("--alpha", type=float, default=1.0, help="attenuation exponent (1/d^alpha)")
+    parser.add_argument("--raw", action="store_true", help="store float32 without peak normalization")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--compresslevel", type=int, default=1, help="zip deflate level, 0 = store")
+    args = parser.parse_args(argv)
+
+    summary = generate_dataset(
+        args.output,
+        types=parse_values(args.types, int),
+        freqs=parse_values(args.freqs),
+        speeds=parse_values(args.speeds),
+        dists=parse_values(args.dists),
+        repeats=args.repeats,
+        clip_seconds=args.clip_seconds,
+        sample_rate=args.sample_rate,
+        jitter_seconds=args.jitter,
+        alpha=args.alpha,
+        normalize=not args.raw,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        compresslevel=args.compresslevel,
+        progress=lambda fraction, message: print(f"\r{message}", end="", flush=True),
+    )
+    print()
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# =============================================================================
+# ECG Upload Parsing
+# =============================================================================
+# Turns an ECG upload into the (4096, 12) float32 array the ResNet expects.
+#
+# Supported formats:
+#   .csv / .txt  Header row with lead names (case-insensitive), one sample per row.
+#                Only the model's leads are parsed, straight to float32, and
+#                only as many rows as are needed. Whole recordings are parsed
+#                in row chunks into a memory-mapped temporary file.
+#   .npy         (samples, 12) array in lead order. A C-contiguous float32
+#                (4096, 12) array is used as-is with no copy.
+#   .npz         First array in the archive, as for .npy.
+#   .bin / .ecg  Headerless little-endian float32, sample-major: every sample
+#                is 12 consecutive values in ECG_LEADS order
+#                (I, II, III, aVR, aVL, aVF, V1..V6), 48 bytes per sample.
+
+import io
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from array_io import open_npy_upload, open_raw_upload
+
+ECG_LEADS = ["I", "II", "III", "AVR", "AVL", "AVF", "V1", "V2", "V3", "V4", "V5", "V6"]
+ECG_SAMPLES = 4096
+ECG_SAMPLE_RATE = 400  # Hz, the rate the ResNet was trained at
+ECG_MIN_STRIDE = ECG_SAMPLES // 8  # segmented mode: at most 8 windows per 4096 samples
+ECG_CSV_CHUNK_ROWS = 65536
+ECG_EXTENSIONS = {"csv", "txt", "npy", "npz", "bin", "ecg"}
+ECG_BINARY_DTYPE = np.dtype("<f4")
+
+
+def fit_ecg_input(array, samples=ECG_SAMPLES):
+    """Truncate/zero-pad a (n, leads) recording to (samples, 12) float32.
+
+    An input that already has the right shape, dtype and layout is returned
+    unchanged, without a copy.
+    """
+    if array.ndim == 1:
+        array = array[:, None]
+    if array.shape[1] == 1:
+        # Single-lead recordings are tiled across all 12 leads
+        array = np.broadcast_to(array, (array.shape[0], len(ECG_LEADS)))
+    if (array.shape == (samples, len(ECG_LEADS)) and array.dtype == np.float32
+            and array.flags.c_contiguous):
+        return array
+    out = np.zeros((samples, len(ECG_LEADS)), dtype=np.float32)
+    n = min(samples, array.shape[0])
+    leads = min(len(ECG_LEADS), array.shape[1])
+    out[:n, :leads] = array[:n, :leads]
+    return out
+
+
+def csv_lead_columns(header_line):
+    """Map model lead index -> CSV column index from a header line."""
+    names = [c.strip().strip('"').upper() for c in header_line.lstrip("\ufeff").split(",")]
+    positions = {}
+    for col, name in enumerate(names):
+        if name in ECG_LEADS and name not in positions:
+            positions[name] = col
+    return {ECG_LEADS.index(name): col for name, col in positions.items()}
+
+
+def parse_ecg_csv(data, max_rows=ECG_SAMPLES):
+    """Parse an ECG CSV straight into a (max_rows, 12) float32 array.
+
+    Returns the array and the number of rows actually read. ``max_rows=None``
+    reads the whole file.
+    """
+    header_end = data.find(b"\n")
+    header = data[:header_end if header_end >= 0 else len(data)].decode("utf-8", errors="replace")
+    columns = csv_lead_columns(header)
+
+    rows = 0
+    parsed = None
+    if columns:
+        frame = pd.read_csv(
+            io.BytesIO(data),
+            header=0,
+            usecols=sorted(columns.values()),
+            dtype=np.float32,
+            nrows=max_rows,
+            engine="c",
+        )
+        parsed = frame.to_numpy(dtype=np.float32, copy=False)
+        rows = parsed.shape[0]
+    elif max_rows is None:
+        # No recognisable leads: count the rows so the caller can still report them
+        rows = max(0, data.count(b"\n") - 1)
+
+    out = np.zeros((max_rows if max_rows is not None else rows, len(ECG_LEADS)), dtype=np.float32)
+    if parsed is not None:
+        # usecols returns the columns in file order; scatter them into lead order
+        lead_of_column = {col: lead for lead, col in columns.items()}
+        for j, col in enumerate(sorted(columns.values())):
+            out[:rows, lead_of_column[col]] = parsed[:, j]
+    return out, rows
+
+
+def parse_ecg_csv_chunked(stream, chunk_rows=ECG_CSV_CHUNK_ROWS):
+    """Parse a whole ECG CSV into a read-only (rows, 12) float32 memmap.
+
+    The upload is read ``chunk_rows`` rows at a time and each chunk is
+    written to an anonymous temporary file, so neither the text nor the
+    array has to fit in memory. Returns the array and its row count.
+    """
+    stream.seek(0)
+    columns = csv_lead_columns(stream.readline().decode("utf-8", errors="replace"))
+    stream.seek(0)
+    row_bytes = ECG_BINARY_DTYPE.itemsize * len(ECG_LEADS)
+
+    with tempfile.TemporaryFile(prefix="ecg_") as out:
+        rows = 0
+        if columns:
+            lead_of_column = {col: lead for lead, col in columns.items()}
+            ordered = sorted(columns.values())
+            chunks = pd.read_csv(stream, header=0, usecols=ordered, dtype=np.float32,
+                                 chunksize=chunk_rows, engine="c")
+            for frame in chunks:
+                parsed = frame.to_numpy(dtype=np.float32, copy=False)
+                block = np.zeros((parsed.shape[0], len(ECG_LEADS)), dtype=ECG_BINARY_DTYPE)
+                for j, col in enumerate(ordered):
+                    block[:, lead_of_column[col]] = parsed[:, j]
+                out.write(block.tobytes())
+                rows += block.shape[0]
+        else:
+            # No recognisable leads: an all-zero (sparse) file with one row per line
+            for chunk in iter(lambda: stream.read(1 << 20), b""):
+                rows += chunk.count(b"\n")
+            rows = max(0, rows - 1)
+            out.truncate(rows * row_bytes)
+        out.flush()
+        if rows == 0:
+            return np.zeros((0, len(ECG_LEADS)), dtype=np.float32), 0
+        # The mapping outlives the (already unlinked) file once it is closed
+        return np.memmap(out, dtype=ECG_BINARY_DTYPE, mode="r", shape=(rows, len(ECG_LEADS))), rows
+
+
+def ecg_upload_format(filename):
+    ext = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    return ext if ext in ECG_EXTENSIONS else "csv"
+
+
+def load_ecg_array(file, max_rows=ECG_SAMPLES):
+    """Load an ECG upload as a (samples, leads) array plus format info.
+
+    With ``max_rows`` set only that many samples are parsed (CSV) or kept
+    (binary formats, which are views). ``max_rows=None`` keeps the whole
+    recording; binary uploads on disk are then memory-mapped, not read, and
+    CSVs are parsed chunk by chunk into a memory-mapped temporary file.
+    """
+    fmt = ecg_upload_format(file.filename)
+    stream = file.stream
+
+    if fmt in ("csv", "txt") and max_rows is None:
+        array, rows = parse_ecg_csv_chunked(stream)
+    elif fmt in ("csv", "txt"):
+        array, rows = parse_ecg_csv(stream.read(), max_rows=max_rows)
+    else:
+        if fmt == "npy":
+            array = open_npy_upload(stream)
+        elif fmt == "npz":
+            with np.load(io.BytesIO(stream.read())) as archive:
+                array = archive[archive.files[0]]
+        else:
+            array = open_raw_upload(stream, ECG_BINARY_DTYPE, len(ECG_LEADS))
+        if array.ndim == 1:
+            array = array[:, None]
+        if array.ndim != 2:
+            raise ValueError(f"Expected a (samples, leads) array, got shape {array.shape}")
+        rows = array.shape[0]
+        if max_rows is not None:
+            array = array[:max_rows]
+
+    return array, {"format": fmt, "samples": int(rows)}
+
+
+def segment_starts(total, window=ECG_SAMPLES, stride=ECG_SAMPLES):
+    """Window start offsets covering ``total`` samples.
+
+    A final window is aligned to the end of the recording so the tail is never
+    dropped; recordings shorter than one window get a single zero-padded window.
+    """
+    if total <= window:
+        return [0]
+    starts = list(range(0, total - window + 1, stride))
+    if starts[-1] + window < total:
+        starts.append(total - window)
+    return starts
+
+
+def iter_ecg_windows(array, window=ECG_SAMPLES, stride=ECG_SAMPLES, batch_size=16):
+    """Yield ``(starts, batch)`` with batch a (k, window, 12) float32 array.
+
+    Only one batch of windows is materialised at a time, so a memory-mapped
+    recording is paged in batch by batch rather than loaded whole.
+    """
+    starts = segment_starts(array.shape[0], window, stride)
+    for i in range(0, len(starts), batch_size):
+        chunk = starts[i:i + batch_size]
+        batch = np.empty((len(chunk), window, len(ECG_LEADS)), dtype=np.float32)
+        for j, start in enumerate(chunk):
+            batch[j] = fit_ecg_input(array[start:start + window], samples=window)
+        yield chunk, batch
@@ -0,0 +1,49 @@
+# =============================================================================
+# Gunicorn Configuration
+# =============================================================================
+# gunicorn -c gunicorn.conf.py wsgi:app
+#
+# preload_app loads the application (and the PRELOAD_MODELS) once in the
+# master; forked workers share the weights copy-on-write instead of each
+# holding its own copy of torch/transformers models. gc.freeze() in the
+# master moves everything loaded so far out of the collector's reach, so
+# collections in the workers do not write to (and un-share) those pages.
+#
+# Several workers by default (half the cores, at least two). State a
+# follow-up request needs is on disk, so it may land on any worker: job
+# status and results (uploads/jobs), SAR scenes (uploads/sar_scenes),
+# decoded spectrogram recordings (uploads/spectro_recordings, memory-mapped)
+# and, with RESULT_CACHE_DIR set, cached results. Still per worker: the
+# in-memory caches, merging of identical in-flight uploads, and the job pool
+# limits (JOB_WORKERS / JOB_MAX_PENDING apply to each worker).
+#
+# TensorFlow is not fork-safe once its runtime has started, so the ECG model
+# is not preloaded by default; each worker loads it on first use.
+#
+# Environment: PORT, WEB_CONCURRENCY (workers), GUNICORN_THREADS,
+# GUNICORN_TIMEOUT, GUNICORN_PRELOAD=0 to disable preloading, TORCH_THREADS
+# (per worker; default: cores / workers), PRELOAD_MODELS.
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", max(2, (os.cpu_count() or 2) // 2)))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 300))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1").lower() not in ("0", "false", "no")
+
+os.environ.setdefault("PRELOAD_MODELS", "eeg,drone,voice" if preload_app else "")
+
+
+def when_ready(server):
+    # The app is loaded (with preload_app) and no worker has been forked yet
+    gc.collect()
+    gc.freeze()
+    server.log.info("Master ready; %d objects frozen for copy-on-write sharing", gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    import app
+    torch_threads = os.environ.get("TORCH_THREADS") or max(1, (os.cpu_count() or 1) // server.cfg.workers)
+    app.after_fork(torch_threads)
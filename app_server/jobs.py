@@ -0,0 +1,210 @@
+# =============================================================================
+# Background Job Manager
+# =============================================================================
+# Opt-in asynchronous mode for heavy analyses. A submitted job runs on a
+# bounded thread pool; clients poll its id for status, progress and result.
+# Finished jobs are kept for ``ttl_seconds`` and then purged.
+#
+# With ``store_dir`` every status change (and progress, at most once a
+# second) is also written to ``<store_dir>/<job_id>.json`` atomically, so a
+# poll that lands on another gunicorn worker can still answer from disk.
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already queued or running."""
+
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+PROGRESS_PERSIST_INTERVAL = 1.0  # seconds between progress writes to the store
+STORE_SWEEP_INTERVAL = 60.0
+
+
+class Job:
+    def __init__(self, kind, on_change=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"  # queued | running | done | failed
+        self.progress = 0.0
+        self.message = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._on_change = on_change
+        self._persisted_at = 0.0
+
+    def set_progress(self, fraction, message=None):
+        self.progress = max(0.0, min(1.0, float(fraction)))
+        if message is not None:
+            self.message = message
+        if self._on_change is not None and time.time() - self._persisted_at >= PROGRESS_PERSIST_INTERVAL:
+            self.changed()
+
+    def changed(self):
+        """Report a state change to the owner (persists the job when it has a store)."""
+        if self._on_change is not None:
+            self._persisted_at = time.time()
+            self._on_change(self)
+
+    def to_dict(self, include_result=True):
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "message": self.message,
+            "created_at": datetime.fromtimestamp(self.created_at).isoformat(),
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat() if self.started_at else None,
+            "finished_at": datetime.fromtimestamp(self.finished_at).isoformat() if self.finished_at else None,
+        }
+        if self.status == "failed":
+            data["error"] = self.error
+        if include_result and self.status == "done":
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    """Run callables on a bounded executor and keep their results for a TTL."""
+
+    def __init__(self, max_workers=2, max_pending=32, ttl_seconds=600, store_dir=None):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self.ttl_seconds = float(ttl_seconds)
+        self.store_dir = store_dir
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._swept_at = 0.0
+
+    def _get_executor(self):
+        # Executor threads do not survive fork(); a forked worker makes its own
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+            self._pid = os.getpid()
+            self._jobs = {}
+        return self._executor
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Queue ``fn(*args, progress=job.set_progress, **kwargs)``; returns the Job."""
+        with self._lock:
+            executor = self._get_executor()
+            self._purge_expired()
+            active = sum(1 for job in self._jobs.values() if job.status in ("queued", "running"))
+            if active >= self.max_pending:
+                raise JobQueueFull(f"{active} jobs already pending; try again later")
+            job = Job(kind, on_change=self._persist if self.store_dir else None)
+            self._jobs[job.id] = job
+        job.changed()
+        executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        job.changed()
+        try:
+            job.result = fn(*args, progress=job.set_progress, **kwargs)
+            job.progress = 1.0
+            job.status = "done"
+        except Exception as e:
+            print(f"❌ Job {job.id} ({job.kind}) failed: {e}")
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = "failed"
+        job.finished_at = time.time()
+        job.changed()
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge_expired()
+            return self._jobs.get(job_id)
+
+    # -------------------------------------------------------------------------
+    # Shared store
+    # -------------------------------------------------------------------------
+
+    def _store_path(self, job_id):
+        return os.path.join(self.store_dir, f"{job_id}.json")
+
+    def _persist(self, job):
+        try:
+            body = json.dumps(job.to_dict(), default=str).encode("utf-8")
+            fd, tmp = tempfile.mkstemp(dir=self.store_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            os.replace(tmp, self._store_path(job.id))
+        except (OSError, TypeError, ValueError) as e:
+            print(f"⚠️ Could not persist job {job.id}: {e}")
+
+    def load(self, job_id):
+        """Persisted JSON (bytes) of a job from any process sharing the store, or None."""
+        if not self.store_dir or not re.fullmatch(r"[0-9a-f]{32}", job_id):
+            return None
+        with self._lock:
+            self._purge_expired()
+        try:
+            with open(self._store_path(job_id), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _sweep_store(self, now):
+        # Jobs are not rewritten once finished, so the mtime is their finish time
+        self._swept_at = now
+        try:
+            names = os.listdir(self.store_dir)
+        except OSError:
+            return
+        for name in names:
+            job_id = name.split(".", 1)[0]
+            if job_id in self._jobs:
+                continue
+            path = os.path.join(self.store_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl_seconds:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.ttl_seconds]
+        for job_id in expired:
+            del self._jobs[job_id]
+            if self.store_dir:
+                try:
+                    os.unlink(self._store_path(job_id))
+                except OSError:
+                    pass
+        if self.store_dir and now - self._swept_at > STORE_SWEEP_INTERVAL:
+            self._sweep_store(now)
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "ttl_seconds": self.ttl_seconds,
+                "store_dir": self.store_dir,
+                "jobs": counts,
+            }
@@ -0,0 +1,435 @@
+# =============================================================================
+# Concurrent Load Test
+# =============================================================================
+# Replays a weighted mix of real uploads (Test_data/ ECG, EEG, drone, voice,
+# Doppler; a synthetic GeoTIFF for SAR) against the app on this machine.
+# Each gunicorn configuration in the sweep (workers x threads x preload) is
+# started on a free localhost port, warmed up, then driven by
+# ``--concurrency`` closed-loop clients for ``--duration`` seconds:
+#
+#   throughput, p50/p95/p99 latency, error rate   overall and per request kind
+#   RSS / PSS per worker                          sampled during the run (Linux)
+#
+# Nothing leaves the machine: the server runs with the Hugging Face hub in
+# offline mode, and ``--stand-ins`` swaps missing model weights for the
+# benchmark suite's random-weight stand-ins. Requests send cache=0 so the
+# result cache does not turn the run into a cache benchmark (``--cache``).
+#
+#   python loadtest.py --workers 1,2,4 --threads 1,4 --preload both -o load.json
+#   python loadtest.py --url http://127.0.0.1:5000 --concurrency 16 --duration 60
+
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from benchmark import HERE, SEED, read, synthetic_geotiff, test_files
+
+DEFAULT_MIX = "ecg=3,eeg=2,drone=3,voice=2,doppler=1,sar=1"
+REQUEST_TIMEOUT = 300.0
+
+
+# =============================================================================
+# Traffic
+# =============================================================================
+
+class Upload:
+    """One replayable request: a multipart upload (or JSON body) to ``path``."""
+
+    def __init__(self, kind, path, filename=None, data=None, fields=None, json_body=None):
+        self.kind = kind
+        self.path = path
+        self.filename = filename
+        if json_body is not None:
+            self.body = json.dumps(json_body).encode("utf-8")
+            self.content_type = "application/json"
+        else:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for name, value in (fields or {}).items():
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                             f'{value}\r\n'.encode("utf-8"))
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+                         f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'
+                         .encode("utf-8"))
+            parts.append(data)
+            parts.append(f"\r\n--{boundary}--\r\n".encode("utf-8"))
+            self.body = b"".join(parts)
+            self.content_type = f"multipart/form-data; boundary={boundary}"
+
+
+def build_traffic(workdir, cache=False):
+    """All replayable requests by kind, from Test_data plus a synthetic SAR scene."""
+    fields = {} if cache else {"cache": "0"}
+    traffic = {
+        "ecg": [Upload("ecg", "/api/analyze_ecg", os.path.basename(p), read(p), fields)
+                for p in test_files("ECG", (".csv",))],
+        "eeg": [Upload("eeg", "/api/classify_eeg", os.path.basename(p), read(p), fields)
+                for p in test_files("EEG", (".npy",))],
+        "drone": [Upload("drone", "/predict", os.path.basename(p), read(p), fields)
+                  for p in test_files("Drone", (".wav",)) + test_files("Noise", (".wav",))],
+        # Test_data has no speech; any clip exercises the same decode/inference path
+        "voice": [Upload("voice", "/api/classify-voice", os.path.basename(p), read(p), fields)
+                  for p in test_files("Birds", (".wav",))],
+        "doppler": [Upload("doppler", "/upload_car", os.path.basename(p), read(p), fields)
+                    for p in test_files("Doppler", (".wav",))],
+        "simulate": [Upload("simulate", "/simulate", json_body={"type": t, "freq": 120, "speed": s, "dist": 10})
+                     for t, s in ((1, 20), (2, 30), (4, 25))],
+    }
+    try:
+        path = os.path.join(workdir, "scene.tif")
+        synthetic_geotiff(path, 1024, np.random.default_rng(SEED))
+        traffic["sar"] = [Upload("sar", "/sar/analyze", "scene.tif", read(path), fields)]
+    except ImportError:
+        traffic["sar"] = []
+    return {kind: uploads for kind, uploads in traffic.items() if uploads}
+
+
+def parse_mix(text, available):
+    mix = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        kind, _, weight = item.partition("=")
+        kind = kind.strip()
+        if kind not in available:
+            print(f"⚠️ No inputs for '{kind}'; dropped from the mix")
+            continue
+        mix[kind] = float(weight or 1)
+    if not mix:
+        raise ValueError("empty traffic mix")
+    return mix
+
+
+# =============================================================================
+# Load Generation
+# =============================================================================
+
+def drive(base_url, traffic, mix, concurrency, duration, warmup=0.0, seed=SEED):
+    """Closed-loop clients, each with one keep-alive connection.
+
+    Returns (samples, elapsed) where samples are (kind, seconds, ok) for
+    requests *started* after the warm-up period.
+    """
+    url = urlsplit(base_url)
+    kinds, weights = list(mix), list(mix.values())
+    samples, lock = [], threading.Lock()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def client(index):
+        rng = random.Random(seed + index)
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=REQUEST_TIMEOUT)
+        local = []
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            upload = rng.choice(traffic[rng.choices(kinds, weights)[0]])
+            ok = False
+            try:
+                conn.request("POST", upload.path, body=upload.body, headers={"Content-Type": upload.content_type})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status < 400
+                if response.getheader("Connection", "").lower() == "close":
+                    conn.close()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=REQUEST_TIMEOUT)
+            if now >= measure_from:
+                local.append((upload.kind, time.perf_counter() - now, ok))
+        conn.close()
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Clients finish their last request after stop_at; count the real window
+    elapsed = max(time.perf_counter(), stop_at) - measure_from
+    return samples, elapsed
+
+
+def summarize(samples, elapsed):
+    def block(rows):
+        if not rows:
+            return {"requests": 0}
+        latencies = np.array([r[1] for r in rows]) * 1000.0
+        errors = sum(1 for r in rows if not r[2])
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {
+            "requests": len(rows),
+            "throughput_rps": round(len(rows) / elapsed, 3),
+            "error_rate": round(errors / len(rows), 4),
+            "latency_ms": {"mean": round(float(latencies.mean()), 2), "p50": round(float(p50), 2),
+                           "p95": round(float(p95), 2), "p99": round(float(p99), 2),
+                           "max": round(float(latencies.max()), 2)},
+        }
+
+    summary = block(samples)
+    summary["by_kind"] = {kind: block([s for s in samples if s[0] == kind])
+                          for kind in sorted({s[0] for s in samples})}
+    return summary
+
+
+# =============================================================================
+# Process Memory (Linux /proc)
+# =============================================================================
+
+def _children(pid):
+    kids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Field 4 is the parent pid; the command name may contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            kids.append(int(entry))
+    return kids
+
+
+def _memory_mb(pid):
+    """(rss, pss) in MB; PSS splits pages shared with the master (preload) fairly."""
+    rss = pss = None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) / 1024
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return rss, pss
+
+
+class MemorySampler(threading.Thread):
+    """Peak RSS/PSS of the gunicorn master and each worker, sampled every ``interval``."""
+
+    def __init__(self, master_pid, interval=1.0):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peaks = {}
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        if not os.path.isdir("/proc"):
+            return
+        for pid in [self.master_pid] + _children(self.master_pid):
+            rss, pss = _memory_mb(pid)
+            if rss is None:
+                continue
+            peak = self.peaks.setdefault(pid, {"rss_mb": 0.0, "pss_mb": 0.0})
+            peak["rss_mb"] = max(peak["rss_mb"], rss)
+            if pss is not None:
+                peak["pss_mb"] = max(peak["pss_mb"], pss)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.sample()
+        workers = [dict(pid=pid, **{k: round(v, 1) for k, v in peak.items()})
+                   for pid, peak in self.peaks.items() if pid != self.master_pid]
+        master = self.peaks.get(self.master_pid, {})
+        return {
+            "master": {k: round(v, 1) for k, v in master.items()},
+            "workers": workers,
+            "worker_rss_mb_max": max((w["rss_mb"] for w in workers), default=None),
+            "worker_pss_mb_total": round(sum(w["pss_mb"] for w in workers), 1) if workers else None,
+        }
+
+
+# =============================================================================
+# Gunicorn Configurations
+# =============================================================================
+
+def stand_in_app():
+    """gunicorn factory: wsgi.py with random-weight stand-ins for missing models."""
+    import app
+    from benchmark import install_stand_ins
+    install_stand_ins(app)
+    app.models.preload_from_env()
+    return app.create_app()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(base_url, proc, timeout):
+    url = urlsplit(base_url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection(url.hostname, url.port, timeout=5)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"server not ready after {timeout}s")
+
+
+def start_server(workers, threads, preload, stand_ins, log_path, boot_timeout=180):
+    port = _free_port()
+    target = "loadtest:stand_in_app()" if stand_ins else "wsgi:app"
+    # gunicorn.conf.py supplies the production hooks (gc.freeze, post_fork);
+    # the sweep overrides workers, threads and preloading
+    cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", target, "--bind", f"127.0.0.1:{port}",
+           "--workers", str(workers), "--threads", str(threads), "--timeout", str(int(REQUEST_TIMEOUT))]
+    env = dict(os.environ, HF_HUB_OFFLINE="1", TRANSFORMERS_OFFLINE="1", GUNICORN_PRELOAD="1" if preload else "0")
+    log = open(log_path, "ab")
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_ready(base_url, proc, boot_timeout)
+    except Exception:
+        stop_server(proc)
+        log.close()
+        raise
+    return proc, base_url, log
+
+
+def stop_server(proc):
+    if proc.poll() is None:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+
+
+def run_config(config, traffic, mix, args, log_path):
+    workers, threads, preload = config
+    label = f"w{workers}-t{threads}-{'preload' if preload else 'no-preload'}"
+    print(f"▶ {label}: starting gunicorn")
+    boot_start = time.perf_counter()
+    proc, base_url, log = start_server(workers, threads, preload, args.stand_ins, log_path)
+    boot_seconds = time.perf_counter() - boot_start
+    sampler = MemorySampler(proc.pid)
+    try:
+        sampler.start()
+        samples, elapsed = drive(base_url, traffic, mix, args.concurrency, args.duration, args.warmup)
+        memory = sampler.stop()
+    finally:
+        stop_server(proc)
+        log.close()
+    result = {"config": label, "workers": workers, "threads": threads, "preload": preload,
+              "boot_seconds": round(boot_seconds, 2), "elapsed_seconds": round(elapsed, 2),
+              **summarize(samples, elapsed), "memory": memory}
+    print_result(result)
+    return result
+
+
+def print_result(result):
+    if not result.get("requests"):
+        print(f"  {result.get('config', '')}: no requests completed")
+        return
+    lat = result["latency_ms"]
+    rss = (result.get("memory") or {}).get("worker_rss_mb_max")
+    print(f"  {result.get('config', 'target'):24s} {result['throughput_rps']:8.2f} req/s  "
+          f"p50 {lat['p50']:8.1f}  p95 {lat['p95']:8.1f}  p99 {lat['p99']:8.1f} ms  "
+          f"errors {result['error_rate'] * 100:5.1f}%" + (f"  worker RSS {rss:.0f} MB" if rss else ""))
+    for kind, block in result["by_kind"].items():
+        if block["requests"]:
+            print(f"      {kind:10s} {block['requests']:6d} req  p50 {block['latency_ms']['p50']:8.1f}  "
+                  f"p99 {block['latency_ms']['p99']:8.1f} ms  errors {block['error_rate'] * 100:5.1f}%")
+
+
+def _int_list(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay mixed uploads against the app under gunicorn")
+    parser.add_argument("--url", help="drive an already running server instead of sweeping gunicorn configs")
+    parser.add_argument("--workers", default="1,2", help="gunicorn worker counts to sweep")
+    parser.add_argument("--threads", default="1,4", help="gunicorn threads per worker to sweep")
+    parser.add_argument("--preload", choices=("on", "off", "both"), default="both")
+    parser.add_argument("--concurrency", type=int, default=8, help="closed-loop clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds per configuration")
+    parser.add_argument("--warmup", type=float, default=10.0, help="unmeasured seconds first (model loads)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="kind=weight list; kinds: ecg, eeg, drone, "
+                                                           "voice, doppler, sar, simulate")
+    parser.add_argument("--stand-ins", action="store_true", help="random-weight models for missing weights")
+    parser.add_argument("--cache", action="store_true", help="let the result cache serve repeated uploads")
+    parser.add_argument("-o", "--output", help="JSON report path")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        traffic = build_traffic(workdir, cache=args.cache)
+        mix = parse_mix(args.mix, traffic)
+        print(f"Mix: {mix}; {sum(len(traffic[k]) for k in mix)} distinct uploads")
+
+        if args.url:
+            samples, elapsed = drive(args.url, traffic, mix, args.concurrency, args.duration, args.warmup)
+            results = [dict(config=args.url, **summarize(samples, elapsed))]
+            print_result(results[0])
+        else:
+            preloads = {"on": [True], "off": [False], "both": [False, True]}[args.preload]
+            configs = [(w, t, p) for w in _int_list(args.workers) for t in _int_list(args.threads)
+                       for p in preloads]
+            log_path = os.path.join(tempfile.gettempdir(), "deepsignal-loadtest-server.log")
+            results = []
+            for config in configs:
+                try:
+                    results.append(run_config(config, traffic, mix, args, log_path))
+                except Exception as e:
+                    print(f"  ❌ {config}: {e} (see {log_path})")
+                    results.append({"workers": config[0], "threads": config[1], "preload": config[2],
+                                    "error": str(e)})
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cpu_count": os.cpu_count(),
+        "mix": mix,
+        "concurrency": args.concurrency,
+        "duration_seconds": args.duration,
+        "warmup_seconds": args.warmup,
+        "result_cache": args.cache,
+        "stand_ins": args.stand_ins,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+# =============================================================================
+# In-Process Metrics
+# =============================================================================
+# Counters, gauges and histograms rendered in the Prometheus text format
+# (version 0.0.4) by ``/metrics``. Every metric keeps one small lock; an
+# observation is a bisect plus a few integer increments, cheap enough for
+# every request. Values are per process: under gunicorn each worker reports
+# its own series, which Prometheus sums across scrape targets.
+#
+# Stage timers label their observations with the route of the request being
+# served on the current thread (``set_route``); work running on background
+# job threads is labelled "background". Each stage is also a tracing span.
+
+import bisect
+import threading
+import time
+
+from tracing import span
+
+# Seconds: Prometheus' default buckets, extended for multi-second analyses
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Bytes: 1 KB to 256 MB in powers of four
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+            lines.extend(self._render_series(series))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def _render_series(self, series):
+        for key, value in series:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._series.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_series(self, series):
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class MetricsRegistry:
+    """Named metrics plus collectors that report existing stats at scrape time."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._add(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram, name, help_text, labels, buckets=buckets)
+
+    def add_collector(self, collect):
+        """``collect(registry)`` runs before each render, e.g. to ``set`` gauges."""
+        self._collectors.append(collect)
+
+    def render(self):
+        for collect in self._collectors:
+            try:
+                collect(self)
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "deepsignal_stage_duration_seconds",
+    "Time spent in one processing stage of a request (decode, preprocess, inference, render, serialize).",
+    labels=("route", "stage"),
+)
+
+_local = threading.local()
+
+
+def set_route(route):
+    """Route label for stage timers on this thread (None to clear)."""
+    _local.route = route
+
+
+def current_route():
+    return getattr(_local, "route", None) or "background"
+
+
+class stage:
+    """Time the block as stage ``name`` of the current route; ``.ms`` is set on exit."""
+
+    __slots__ = ("name", "seconds", "_start", "_span")
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = None
+
+    @property
+    def ms(self):
+        return self.seconds * 1000.0
+
+    def __enter__(self):
+        self._span = span(self.name)
+        self._span.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        self._span.__exit__(*exc)
+        stage_seconds.observe(self.seconds, route=current_route(), stage=self.name)
+        return False
@@ -0,0 +1,153 @@
+# =============================================================================
+# Lazy Model Registry
+# =============================================================================
+# Models are registered with a loader function and only built the first time
+# an endpoint asks for them. Each model has its own lock so a slow load (e.g.
+# TensorFlow) never blocks requests for a model that is already available.
+
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+
+
+def file_version(path):
+    """Cheap version tag for a weights file: name, size and modification time."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return f"{os.path.basename(path)}:missing"
+    return f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+class ModelEntry:
+    """Bookkeeping for a single registered model."""
+
+    def __init__(self, name, loader, description="", version=None):
+        self.name = name
+        self.loader = loader
+        self.description = description
+        self.version = version
+        self.lock = threading.Lock()
+        self.value = None
+        self.state = "not_loaded"  # not_loaded | loading | loaded | failed
+        self.error = None
+        self.load_time_s = None
+        self.loaded_at = None
+
+    def status(self):
+        return {
+            "state": self.state,
+            "loaded": self.state == "loaded",
+            "load_time_s": round(self.load_time_s, 3) if self.load_time_s is not None else None,
+            "loaded_at": self.loaded_at,
+            "error": self.error,
+            "description": self.description,
+            "version": self.version,
+        }
+
+
+class ModelRegistry:
+    """Loads models on first use, behind a per-model lock."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, description="", version=None):
+        """Register (or replace) the loader for ``name``. Nothing is loaded yet.
+
+        ``version`` identifies the weights (see ``file_version``); result
+        caches include it in their keys so new weights never serve old results.
+        """
+        with self._lock:
+            self._entries[name] = ModelEntry(name, loader, description, version)
+
+    def version(self, name):
+        return self._entries[name].version
+
+    def names(self):
+        return list(self._entries.keys())
+
+    def get(self, name):
+        """Return the loaded model, loading it on first use.
+
+        Returns None if the loader failed; the failure is remembered so that
+        every request does not retry an expensive broken load. Call
+        ``retry(name)`` (or ``reset(name)``) to force another attempt.
+        """
+        entry = self._entries[name]
+        if entry.state == "loaded":
+            return entry.value
+        if entry.state == "failed":
+            return None
+
+        with entry.lock:
+            # Another thread may have finished the load while we waited
+            if entry.state in ("loaded", "failed"):
+                return entry.value
+
+            entry.state = "loading"
+            print(f"🚀 Loading model '{name}'...")
+            start = time.perf_counter()
+            try:
+                value = entry.loader()
+                if value is None:
+                    raise RuntimeError("loader returned None")
+                entry.value = value
+                entry.state = "loaded"
+                entry.error = None
+                print(f"✅ Model '{name}' loaded in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                print(f"❌ Error loading model '{name}': {e}")
+                traceback.print_exc()
+                entry.value = None
+                entry.state = "failed"
+                entry.error = str(e)
+            entry.load_time_s = time.perf_counter() - start
+            entry.loaded_at = datetime.now().isoformat()
+            return entry.value
+
+    def is_loaded(self, name):
+        return self._entries[name].state == "loaded"
+
+    def reset(self, name):
+        """Drop a model (loaded or failed) so the next ``get`` loads it again."""
+        entry = self._entries[name]
+        with entry.lock:
+            entry.value = None
+            entry.state = "not_loaded"
+            entry.error = None
+            entry.load_time_s = None
+            entry.loaded_at = None
+
+    def retry(self, name):
+        """Like ``get``, but a remembered failure is forgotten and the load tried again."""
+        entry = self._entries[name]
+        with entry.lock:
+            if entry.state == "failed":
+                entry.state = "not_loaded"
+                entry.error = None
+        return self.get(name)
+
+    def preload(self, names=None):
+        """Eagerly load ``names`` (default: every registered model)."""
+        for name in names if names is not None else self.names():
+            if name not in self._entries:
+                print(f"⚠️ Cannot preload unknown model '{name}'")
+                continue
+            self.get(name)
+
+    def preload_from_env(self, var="PRELOAD_MODELS"):
+        """Preload the comma-separated models named in ``var`` ('all' for every model)."""
+        value = os.environ.get(var, "").strip()
+        if not value:
+            return
+        if value.lower() == "all":
+            self.preload()
+        else:
+            self.preload([n.strip() for n in value.split(",") if n.strip()])
+
+    def status(self):
+        return {name: entry.status() for name, entry in self._entries.items()}
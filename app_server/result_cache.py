@@ -0,0 +1,160 @@
+# =============================================================================
+# Content-Addressed Result Cache
+# =============================================================================
+# Analysis results keyed by what determines them: the SHA-256 of the uploaded
+# bytes, the endpoint, its parameters and the model version. Lookups go
+#
+#   memory LRU  ->  on-disk store (optional, shared by every worker process)
+#               ->  compute, merged with identical in-flight requests
+#
+# Results are JSON documents, written to disk atomically (temp file + rename),
+# so concurrent gunicorn workers can share one RESULT_CACHE_DIR safely. Hits
+# hand back the stored bytes as they are, never re-parsed; per-run fields
+# (timestamps, timings) are stripped before storing so a hit does not replay
+# the clock readings of the request that computed it.
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+
+from cache import LRUCache
+
+# Top-level result fields that describe one run rather than the result
+VOLATILE_KEYS = ("timestamp", "timing", "inference_seconds", "processing_seconds",
+                 "trials_per_second", "throughput_audio_seconds_per_second")
+
+
+def hash_stream(stream, chunk_size=1 << 20):
+    """SHA-256 of a seekable upload stream, read in chunks; rewinds it afterwards."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache:
+    """JSON result cache with in-memory LRU, optional disk tier and request coalescing."""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, disk_dir=None, enabled=True,
+                 volatile_keys=VOLATILE_KEYS):
+        self.enabled = enabled
+        self.volatile_keys = frozenset(volatile_keys)
+        self.memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes, name="results")
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.computed = 0
+
+    @staticmethod
+    def make_key(endpoint, content_hash, params=None, model_version=None):
+        payload = json.dumps([endpoint, content_hash, params or {}, model_version],
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, body):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠️ Could not persist cached result {key[:12]}: {e}")
+
+    @staticmethod
+    def encode(result):
+        return json.dumps(result, separators=(",", ":")).encode("utf-8")
+
+    def get_or_compute(self, key, compute):
+        """Return ``(body, source)``: the result as JSON bytes, and where it came from.
+
+        Source is memory, disk, coalesced or computed. ``compute`` must return
+        a JSON-serialisable dict; only the request that computed it sees its
+        volatile fields. Exceptions are not cached; they propagate to the
+        caller and to every merged waiter.
+        """
+        if not self.enabled:
+            return self.encode(compute()), "disabled"
+
+        body = self.memory.get(key)
+        if body is not None:
+            return body, "memory"
+        body = self._read_disk(key)
+        if body is not None:
+            self.memory.put(key, body)
+            with self._lock:
+                self.disk_hits += 1
+            return body, "disk"
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result(), "coalesced"
+
+        try:
+            result = compute()
+            body = self.encode(result)
+            stored = body
+            if isinstance(result, dict) and not self.volatile_keys.isdisjoint(result):
+                stored = self.encode({k: v for k, v in result.items() if k not in self.volatile_keys})
+            self.memory.put(key, stored)
+            self._write_disk(key, stored)
+            with self._lock:
+                self.computed += 1
+            future.set_result(stored)
+            return body, "computed"
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        memory = self.memory.stats()
+        with self._lock:
+            served = memory["hits"] + self.disk_hits + self.coalesced
+            total = served + self.computed
+            return {
+                "enabled": self.enabled,
+                "memory": memory,
+                "disk_dir": self.disk_dir,
+                "disk_hits": self.disk_hits,
+                "coalesced": self.coalesced,
+                "computed": self.computed,
+                "inflight": len(self._inflight),
+                "hit_rate": round(served / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,253 @@
+# =============================================================================
+# Bulk GeoTIFF Conversion
+# =============================================================================
+# Decode-and-render only: no statistics, no figures. Each raster becomes
+#
+#   png   a dB grayscale preview (2nd-98th percentile stretch), longer side
+#         at most ``max_size`` pixels (0 = full resolution)
+#   tif   a tiled (256x256), deflate-compressed GeoTIFF with internal
+#         overviews, copied block by block so memory stays flat
+#
+# Files are fanned out over a process pool: the server shares one lazily
+# started pool per worker process (``shared_pool``) across all requests, the
+# CLI starts its own. CLI:
+#   python sar_convert.py /data/campaign -o /data/previews --format png --workers 8
+
+import argparse
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+
+from sar_render import SAR_DISPLAY_SIZE, colorize, encode_png, percentile_stretch
+from sar_stats import iter_windows, read_quicklook, to_db
+
+TIFF_EXTENSIONS = (".tif", ".tiff")
+CONVERT_FORMATS = ("png", "tif")
+# Zip uploads: rasters extracted per archive and their total uncompressed size
+EXTRACT_MAX_FILES = int(os.environ.get("CONVERT_MAX_FILES", 256))
+EXTRACT_MAX_BYTES = int(float(os.environ.get("CONVERT_MAX_EXTRACT_MB", 4096)) * 1024 * 1024)
+
+
+def render_raster_png(path, max_size=SAR_DISPLAY_SIZE, band=1):
+    """PNG bytes of a raster band in dB, stretched on its own 2-98 percentiles."""
+    with rasterio.open(path) as src:
+        if max_size:
+            values = read_quicklook(src, band, max_size=max_size)
+        else:
+            values = src.read(band, out_dtype=np.float32)
+    db = to_db(values)
+    vmin, vmax = percentile_stretch(db)
+    return encode_png(colorize(db, vmin, vmax, cmap="gray"))
+
+
+def write_tiled_geotiff(path, out_path, block_size=256, compress="deflate"):
+    """Copy a raster to a tiled, compressed GeoTIFF with internal overviews."""
+    with rasterio.open(path) as src:
+        profile = src.profile.copy()
+        profile.update(driver="GTiff", tiled=True, blockxsize=block_size, blockysize=block_size,
+                       compress=compress, BIGTIFF="IF_SAFER")
+        with rasterio.open(out_path, "w", **profile) as dst:
+            for window in iter_windows(src):
+                dst.write(src.read(window=window), window=window)
+            factors = []
+            size = max(src.width, src.height)
+            while size > block_size:
+                factors.append(2 ** (len(factors) + 1))
+                size //= 2
+            if factors:
+                dst.build_overviews(factors, Resampling.average)
+                dst.update_tags(ns="rio_overview", resampling="average")
+
+
+def unique_name(name, used):
+    """``name``, or ``stem_1.ext``, ``stem_2.ext``... if it is already in ``used``."""
+    stem, ext = os.path.splitext(name)
+    candidate, i = name, 0
+    while candidate.lower() in used:
+        i += 1
+        candidate = f"{stem}_{i}{ext}"
+    used.add(candidate.lower())
+    return candidate
+
+
+def convert_one(job):
+    """Process-pool entry point: (path, out_path, fmt, max_size) -> result dict."""
+    path, out_path, fmt, max_size = job
+    started = time.perf_counter()
+    try:
+        if fmt == "png":
+            with open(out_path, "wb") as out:
+                out.write(render_raster_png(path, max_size=max_size))
+        else:
+            write_tiled_geotiff(path, out_path)
+        return {"input": os.path.basename(path), "output": os.path.basename(out_path),
+                "bytes": os.path.getsize(out_path), "seconds": round(time.perf_counter() - started, 3)}
+    except Exception as e:
+        return {"input": os.path.basename(path), "error": str(e)}
+
+
+def find_rasters(paths):
+    """Expand files and directories (recursively) into a sorted list of TIFFs."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found.extend(os.path.join(root, n) for n in names if n.lower().endswith(TIFF_EXTENSIONS))
+        elif path.lower().endswith(TIFF_EXTENSIONS):
+            found.append(path)
+    return sorted(found)
+
+
+def extract_rasters(zip_path, dest_dir, used=None, max_files=EXTRACT_MAX_FILES, max_bytes=EXTRACT_MAX_BYTES):
+    """Extract only the TIFFs of a zip, flattened to names unique within ``used``.
+
+    Raises ValueError past ``max_files`` rasters or ``max_bytes`` extracted.
+    The declared sizes are checked up front and the bytes actually written
+    are counted too, since a crafted archive can understate them.
+    """
+    extracted = []
+    used = set() if used is None else used
+    with zipfile.ZipFile(zip_path) as archive:
+        members = [info for info in archive.infolist()
+                   if not info.is_dir() and os.path.basename(info.filename).lower().endswith(TIFF_EXTENSIONS)
+                   and not os.path.basename(info.filename).startswith(".")]
+        if len(members) > max_files:
+            raise ValueError(f"Archive holds {len(members)} rasters; the limit is {max_files}")
+        declared = sum(info.file_size for info in members)
+        if declared > max_bytes:
+            raise ValueError(f"Archive expands to {declared / 2**20:.0f} MB; the limit is {max_bytes / 2**20:.0f} MB")
+
+        written = 0
+        for info in members:
+            target = os.path.join(dest_dir, unique_name(os.path.basename(info.filename), used))
+            with archive.open(info) as src, open(target, "wb") as out:
+                while True:
+                    chunk = src.read(1 << 20)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > max_bytes:
+                        raise ValueError(f"Archive expands past {max_bytes / 2**20:.0f} MB")
+                    out.write(chunk)
+            extracted.append(target)
+    return extracted
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def shared_pool(workers):
+    """The process-wide conversion pool, started on first use.
+
+    Pool processes belong to the process that started them, so a forked
+    worker notices the new pid and starts its own; a pool broken by a dead
+    child is replaced too.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid() or getattr(_pool, "_broken", False):
+            # spawn: safe to start from a threaded server
+            _pool = ProcessPoolExecutor(max_workers=max(1, int(workers)),
+                                        mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None and _pool_pid == os.getpid():
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown_pool)
+
+
+def convert_many(paths, out_dir, fmt="png", max_size=SAR_DISPLAY_SIZE, workers=None,
+                 progress=lambda *args: None, pool=None):
+    """Convert every raster in ``paths`` into ``out_dir``; returns a summary dict.
+
+    With ``pool`` the files run on that executor (shared, left running);
+    otherwise a pool of ``workers`` processes is started for this call.
+    """
+    if fmt not in CONVERT_FORMATS:
+        raise ValueError(f"format must be one of {CONVERT_FORMATS}")
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+    used = set()
+    jobs = [(path, os.path.join(out_dir, unique_name(f"{os.path.splitext(os.path.basename(path))[0]}.{fmt}", used)),
+             fmt, max_size) for path in paths]
+    own_pool = None
+    if pool is not None:
+        workers = pool._max_workers
+        outputs = pool.map(convert_one, jobs)
+    else:
+        workers = max(1, min(int(workers or os.cpu_count() or 1), len(jobs) or 1))
+        if workers == 1:
+            outputs = map(convert_one, jobs)
+        else:
+            # spawn: safe to start from a threaded server
+            own_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            outputs = own_pool.map(convert_one, jobs)
+
+    results = []
+    try:
+        for result in outputs:
+            results.append(result)
+            progress(len(results) / len(jobs), f"{len(results)}/{len(jobs)} files")
+    except BrokenProcessPool as e:
+        raise RuntimeError("A conversion process died (out of memory?); the pool will be restarted") from e
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "format": fmt,
+        "files": len(jobs),
+        "converted": sum(1 for r in results if "error" not in r),
+        "failed": sum(1 for r in results if "error" in r),
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert GeoTIFFs to PNG previews or tiled GeoTIFFs")
+    parser.add_argument("inputs", nargs="+", help="TIFF files and/or directories (searched recursively)")
+    parser.add_argument("-o", "--output", required=True, help="output directory")
+    parser.add_argument("--format", choices=CONVERT_FORMATS, default="png")
+    parser.add_argument("--max-size", type=int, default=SAR_DISPLAY_SIZE,
+                        help="PNG longer side in pixels (0 = full resolution)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    paths = find_rasters(args.inputs)
+    if not paths:
+        parser.error("no .tif/.tiff files found")
+    summary = convert_many(paths, args.output, fmt=args.format, max_size=args.max_size,
+                           workers=args.workers,
+                           progress=lambda fraction, message: print(f"\r{message}", end="", flush=True))
+    print()
+    for result in summary["results"]:
+        if "error" in result:
+            print(f"FAILED {result['input']}: {result['error']}")
+    print(f"{summary['converted']}/{summary['files']} converted in {summary['seconds']}s "
+          f"with {summary['workers']} workers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# =============================================================================
+# SAR Quicklook Renderer
+# =============================================================================
+# Renders rasters straight to PNG without matplotlib: downsample to the
+# display size, stretch between two values (usually dB percentiles), map
+# through a precomputed 256-entry colormap lookup table and encode. The
+# histogram is returned as bin counts and drawn by the frontend.
+
+import base64
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+SAR_DISPLAY_SIZE = int(os.environ.get("SAR_DISPLAY_SIZE", 1024))
+STRETCH_PERCENTILES = (2.0, 98.0)
+
+
+def _lut_from_anchors(hex_colors):
+    """256x3 uint8 table, linearly interpolated between evenly spaced anchors."""
+    anchors = np.array([[int(h[i:i + 2], 16) for i in (0, 2, 4)] for h in hex_colors], dtype=np.float64)
+    x = np.linspace(0.0, 1.0, len(anchors))
+    grid = np.linspace(0.0, 1.0, 256)
+    return np.stack([np.interp(grid, x, anchors[:, c]) for c in range(3)], axis=1).round().astype(np.uint8)
+
+
+COLORMAPS = {
+    "gray": None,  # rendered as 8-bit grayscale, no lookup needed
+    "viridis": _lut_from_anchors(["440154", "482878", "3e4989", "31688e", "26828e",
+                                  "1f9e89", "35b779", "6dcd59", "b4de2c", "fde725"]),
+    "inferno": _lut_from_anchors(["000004", "1b0c41", "4a0c6b", "781c6d", "a52c60",
+                                  "cf4446", "ed6925", "fb9b06", "f7d13d", "fcffa4"]),
+}
+
+
+def downsample(values, max_size=SAR_DISPLAY_SIZE):
+    """Block-average a 2D array so its longer side is at most ``max_size``."""
+    h, w = values.shape
+    factor = int(np.ceil(max(h, w) / max_size))
+    if factor <= 1:
+        return values
+    h2, w2 = h // factor, w // factor
+    if h2 == 0 or w2 == 0:
+        return values[::factor, ::factor]
+    blocks = values[:h2 * factor, :w2 * factor].reshape(h2, factor, w2, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def percentile_stretch(values, percentiles=STRETCH_PERCENTILES):
+    """(vmin, vmax) from percentiles of the finite values of a (display-sized) array."""
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return 0.0, 1.0
+    vmin, vmax = np.percentile(finite, percentiles)
+    return float(vmin), float(vmax)
+
+
+def colorize(values, vmin, vmax, cmap="gray"):
+    """Map values to uint8 through the stretch and colormap; NaNs become index 0."""
+    if cmap not in COLORMAPS:
+        raise ValueError(f"Unknown colormap '{cmap}'. Use one of {list(COLORMAPS)}")
+    span = vmax - vmin if vmax > vmin else 1.0
+    scaled = (values - np.float32(vmin)) * np.float32(255.0 / span)
+    np.nan_to_num(scaled, copy=False, nan=0.0)
+    index = np.clip(scaled, 0, 255).astype(np.uint8)
+    lut = COLORMAPS[cmap]
+    return index if lut is None else lut[index]
+
+
+def encode_png(pixels, compress_level=3):
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="PNG", compress_level=compress_level)
+    return buf.getvalue()
+
+
+def render_quicklook(values, vmin=None, vmax=None, cmap="gray", max_size=SAR_DISPLAY_SIZE):
+    """PNG bytes of a 2D array, downsampled, stretched and colour-mapped.
+
+    Without explicit limits the array's own 2nd-98th percentiles are used.
+    """
+    values = downsample(np.asarray(values, dtype=np.float32), max_size)
+    if vmin is None or vmax is None:
+        auto_min, auto_max = percentile_stretch(values)
+        vmin = auto_min if vmin is None else vmin
+        vmax = auto_max if vmax is None else vmax
+    return encode_png(colorize(values, vmin, vmax, cmap))
+
+
+def png_base64(png_bytes):
+    return base64.b64encode(png_bytes).decode("utf-8")
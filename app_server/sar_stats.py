@@ -0,0 +1,207 @@
+# =============================================================================
+# Tiled SAR Statistics
+# =============================================================================
+# Backscatter statistics for rasters of any size in one streaming pass.
+# Band 1 is read one block-aligned window at a time, converted to dB in
+# float32, and folded into running accumulators:
+#
+#   count / mean / M2   merged per window (Chan et al.), so mean, std and
+#                       variance are exact up to float rounding
+#   min / max           exact
+#   fine histogram      fixed-width bins over a fixed dB range; the median and
+#                       the 200-bin display histogram are derived from it
+#
+# Peak memory is a few copies of one window whatever the scene size. Windows
+# can be spread over a thread pool (GDAL and NumPy release the GIL); each
+# thread reads through its own dataset handle.
+
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+SAR_WINDOW_PIXELS = int(os.environ.get("SAR_WINDOW_PIXELS", 1 << 22))  # ~16 MB of float32
+SAR_STATS_WORKERS = int(os.environ.get("SAR_STATS_WORKERS", 1))
+DB_EPSILON = 1e-6  # added before log10 so zero pixels stay finite
+
+
+def to_db(block):
+    """10*log10(block + eps) as float32 (in place when the block already is float32)."""
+    out = block if block.dtype == np.float32 else block.astype(np.float32)
+    out += DB_EPSILON
+    np.log10(out, out=out)
+    out *= 10.0
+    return out
+
+
+class SARStatsAccumulator:
+    """Streaming mean/variance/min/max and fine histogram of dB values.
+
+    The histogram has ``bin_width`` dB bins over ``db_range``; values outside
+    the range are counted in the first or last bin. The median is linearly
+    interpolated inside its bin, so it is within ``bin_width`` dB of the exact
+    median as long as the median itself lies inside ``db_range``.
+    """
+
+    def __init__(self, bin_width=0.01, db_range=(-150.0, 150.0)):
+        self.bin_width = float(bin_width)
+        self.lo, self.hi = float(db_range[0]), float(db_range[1])
+        self.n_bins = int(math.ceil((self.hi - self.lo) / self.bin_width))
+        self.counts = np.zeros(self.n_bins, dtype=np.int64)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.invalid = 0
+
+    def update(self, db):
+        """Fold one block of dB values (any shape) into the accumulator."""
+        db = db.ravel()
+        finite = np.isfinite(db)
+        if not finite.all():
+            self.invalid += int(db.size - np.count_nonzero(finite))
+            db = db[finite]
+        if db.size == 0:
+            return self
+
+        n = db.size
+        mean = float(db.mean(dtype=np.float64))
+        m2 = float(np.square(db - np.float32(mean), dtype=np.float64).sum())
+        self._combine(n, mean, m2, float(db.min()), float(db.max()))
+
+        idx = ((db - np.float32(self.lo)) * np.float32(1.0 / self.bin_width)).astype(np.int64)
+        np.clip(idx, 0, self.n_bins - 1, out=idx)
+        self.counts += np.bincount(idx, minlength=self.n_bins)
+        return self
+
+    def _combine(self, n, mean, m2, vmin, vmax):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, vmin)
+        self.max = max(self.max, vmax)
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+            self.counts += other.counts
+        self.invalid += other.invalid
+        return self
+
+    def percentile(self, q):
+        """Approximate ``q``-th percentile (0-100), within ``bin_width`` dB."""
+        if not self.count:
+            return math.nan
+        cumulative = np.cumsum(self.counts)
+        rank = self.count * float(q) / 100.0
+        i = min(int(np.searchsorted(cumulative, rank)), self.n_bins - 1)
+        before = cumulative[i - 1] if i else 0
+        fraction = (rank - before) / self.counts[i] if self.counts[i] else 0.5
+        value = self.lo + (i + fraction) * self.bin_width
+        return float(min(max(value, self.min), self.max))
+
+    def median(self):
+        return self.percentile(50)
+
+    def histogram(self, bins=200):
+        """``bins`` equal bins over [min, max], re-binned from the fine histogram.
+
+        Returns (counts, edges). Fine bins are assigned by their centre, so
+        each edge is accurate to ``bin_width``.
+        """
+        if not self.count:
+            return np.zeros(bins, dtype=np.int64), np.linspace(0.0, 1.0, bins + 1)
+        lo, hi = self.min, self.max if self.max > self.min else self.min + self.bin_width
+        edges = np.linspace(lo, hi, bins + 1)
+        first = max(0, int((lo - self.lo) / self.bin_width))
+        last = min(self.n_bins, int((hi - self.lo) / self.bin_width) + 1)
+        centres = self.lo + (np.arange(first, last) + 0.5) * self.bin_width
+        target = np.clip(((centres - lo) / (hi - lo) * bins).astype(np.int64), 0, bins - 1)
+        counts = np.bincount(target, weights=self.counts[first:last], minlength=bins).astype(np.int64)
+        return counts, edges
+
+    def stats(self):
+        variance = self.m2 / self.count if self.count else math.nan
+        return {
+            'mean': round(self.mean if self.count else math.nan, 4),
+            'median': round(self.median(), 4),
+            'min': round(self.min if self.count else math.nan, 4),
+            'max': round(self.max if self.count else math.nan, 4),
+            'std': round(math.sqrt(variance), 4),
+            'variance': round(variance, 4),
+            'pixels': self.count,
+            'invalid_pixels': self.invalid,
+            'median_error_bound_db': self.bin_width,
+        }
+
+
+def iter_windows(src, target_pixels=SAR_WINDOW_PIXELS):
+    """Windows aligned to the raster's internal blocks, each about ``target_pixels``.
+
+    Striped GeoTIFFs have one-row blocks, so blocks are merged until a window
+    holds roughly ``target_pixels`` pixels.
+    """
+    block_h, block_w = src.block_shapes[0]
+    block_w = min(block_w, src.width)
+    across = max(1, min(int(math.ceil(src.width / block_w)), target_pixels // max(1, block_h * block_w)))
+    win_w = min(src.width, block_w * across)
+    down = max(1, target_pixels // max(1, win_w * block_h))
+    win_h = min(src.height, block_h * down)
+    for row in range(0, src.height, win_h):
+        for col in range(0, src.width, win_w):
+            yield Window(col, row, min(win_w, src.width - col), min(win_h, src.height - row))
+
+
+def raster_statistics(path, band=1, workers=SAR_STATS_WORKERS, target_pixels=SAR_WINDOW_PIXELS,
+                      progress=lambda *args: None):
+    """One-pass dB statistics of a raster band; returns the SARStatsAccumulator."""
+    with rasterio.open(path) as src:
+        windows = list(iter_windows(src, target_pixels))
+
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def process(window):
+        src = getattr(local, "src", None)
+        if src is None:
+            src = local.src = rasterio.open(path)
+            with handles_lock:
+                handles.append(src)
+        acc = SARStatsAccumulator()
+        acc.update(to_db(src.read(band, window=window, out_dtype=np.float32)))
+        return acc
+
+    total = SARStatsAccumulator()
+    try:
+        if workers <= 1:
+            results = map(process, windows)
+            for i, acc in enumerate(results):
+                total.merge(acc)
+                progress((i + 1) / len(windows), "statistics")
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sar") as pool:
+                for i, acc in enumerate(pool.map(process, windows)):
+                    total.merge(acc)
+                    progress((i + 1) / len(windows), "statistics")
+    finally:
+        for src in handles:
+            src.close()
+    return total
+
+
+def read_quicklook(src, band=1, max_size=2048):
+    """Band decimated so its longer side is at most ``max_size`` (uses overviews when present)."""
+    scale = max(src.width, src.height) / max_size
+    if scale <= 1:
+        return src.read(band, out_dtype=np.float32)
+    shape = (max(1, int(src.height / scale)), max(1, int(src.width / scale)))
+    return src.read(band, out_shape=shape, resampling=Resampling.average, out_dtype=np.float32)
@@ -0,0 +1,242 @@
+# =============================================================================
+# SAR Deep-Zoom Tile Server
+# =============================================================================
+# Uploaded rasters are kept on disk (content-addressed) and served as
+# 256x256 PNG tiles in pixel space:
+#
+#   zoom max_zoom   one raster pixel per tile pixel (full resolution)
+#   zoom z          2**(max_zoom - z) raster pixels per tile pixel
+#   zoom 0          the whole scene fits in one tile
+#
+# Tiles are decimated windowed reads (Resampling.average) rendered in dB with
+# one stretch per scene, so neighbouring tiles match. Large uploads get
+# internal overviews while they are still a private temporary file, before
+# the scene id is returned, so a stored scene is never rewritten under its
+# readers (threads or other gunicorn workers); GDAL then serves coarse reads
+# from the overviews instead of the full-resolution band.
+# Rendered tiles are kept in a bounded LRU shared by all viewers. Read handles
+# are closed when a scene leaves the scene cache, and stored scenes not used
+# for SAR_SCENE_TTL seconds are deleted.
+
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from cache import LRUCache
+from sar_render import colorize, encode_png, STRETCH_PERCENTILES, percentile_stretch
+from sar_stats import read_quicklook, to_db
+
+TILE_SIZE = 256
+OVERVIEW_MIN_SIZE = 2048  # smaller scenes are read directly at every zoom
+SCENE_TTL = float(os.environ.get("SAR_SCENE_TTL", 24 * 3600))
+SCENE_TOUCH_INTERVAL = 300.0  # seconds between last-used updates of a scene file
+SWEEP_INTERVAL = 600.0
+
+tile_cache = LRUCache(
+    max_entries=int(os.environ.get("SAR_TILE_CACHE_ENTRIES", 8192)),
+    max_bytes=int(float(os.environ.get("SAR_TILE_CACHE_MB", 256)) * 1024 * 1024),
+    name="sar_tiles",
+)
+scenes = LRUCache(max_entries=int(os.environ.get("SAR_MAX_SCENES", 16)), name="sar_scenes",
+                  on_evict=lambda scene_id, scene: scene.close())
+_scenes_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+class SARScene:
+    """One stored raster: geometry, display stretch and per-thread read handles."""
+
+    def __init__(self, scene_id, path, band=1):
+        self.id = scene_id
+        self.path = path
+        self.band = band
+        self._local = threading.local()
+        self._handles = []
+        self._handles_lock = threading.Lock()
+        self._touched = 0.0
+        with rasterio.open(path) as src:
+            self.width, self.height = src.width, src.height
+            self.crs = str(src.crs) if src.crs else None
+            self.dtype = str(src.dtypes[0])
+            self.has_overviews = bool(src.overviews(band))
+            # Fixed stretch for every tile, from a decimated read of the whole scene
+            self.vmin, self.vmax = percentile_stretch(to_db(read_quicklook(src, band)), STRETCH_PERCENTILES)
+        self.max_zoom = max(0, int(math.ceil(math.log2(max(self.width, self.height) / TILE_SIZE))))
+
+    def _src(self):
+        src = getattr(self._local, "src", None)
+        if src is None or src.closed:
+            src = self._local.src = rasterio.open(self.path)
+            with self._handles_lock:
+                self._handles.append(src)
+        return src
+
+    def close(self):
+        """Close every thread's read handle; a later read reopens its own."""
+        with self._handles_lock:
+            handles, self._handles = self._handles, []
+        for src in handles:
+            try:
+                src.close()
+            except Exception:
+                pass
+
+    def touch(self):
+        """Mark the stored file as recently used (its mtime), for the TTL sweep."""
+        now = time.time()
+        if now - self._touched < SCENE_TOUCH_INTERVAL:
+            return
+        self._touched = now
+        try:
+            os.utime(self.path)
+        except OSError:
+            pass
+
+    def describe(self):
+        return {
+            "scene_id": self.id,
+            "width": self.width,
+            "height": self.height,
+            "crs": self.crs,
+            "dtype": self.dtype,
+            "tile_size": TILE_SIZE,
+            "min_zoom": 0,
+            "max_zoom": self.max_zoom,
+            "stretch_db": [round(self.vmin, 4), round(self.vmax, 4)],
+            "overviews": self.has_overviews,
+        }
+
+    def tiles_at(self, z):
+        scale = 1 << (self.max_zoom - z)
+        span = TILE_SIZE * scale
+        return int(math.ceil(self.width / span)), int(math.ceil(self.height / span))
+
+    def tile(self, z, x, y):
+        """PNG bytes for tile (z, x, y); raises IndexError outside the pyramid."""
+        if not 0 <= z <= self.max_zoom:
+            raise IndexError(f"zoom must be in [0, {self.max_zoom}]")
+        nx, ny = self.tiles_at(z)
+        if not (0 <= x < nx and 0 <= y < ny):
+            raise IndexError(f"tile ({x}, {y}) is outside the {nx}x{ny} grid at zoom {z}")
+
+        key = (self.id, z, x, y)
+        png = tile_cache.get(key)
+        if png is None:
+            png = tile_cache.put(key, self._render(z, x, y))
+        return png
+
+    def _render(self, z, x, y):
+        scale = 1 << (self.max_zoom - z)
+        span = TILE_SIZE * scale
+        col, row = x * span, y * span
+        w, h = min(span, self.width - col), min(span, self.height - row)
+        out_w, out_h = max(1, int(math.ceil(w / scale))), max(1, int(math.ceil(h / scale)))
+
+        data = self._src().read(self.band, window=Window(col, row, w, h), out_shape=(out_h, out_w),
+                                resampling=Resampling.average, out_dtype=np.float32)
+        gray = colorize(to_db(data), self.vmin, self.vmax, cmap="gray")
+
+        # Edge tiles are padded to full size; the padding is transparent
+        pixels = np.zeros((TILE_SIZE, TILE_SIZE, 2), dtype=np.uint8)
+        pixels[:out_h, :out_w, 0] = gray
+        pixels[:out_h, :out_w, 1] = 255
+        return encode_png(pixels, compress_level=1)
+
+
+def scene_path(scene_dir, scene_id):
+    return os.path.join(scene_dir, f"{scene_id}.tif")
+
+
+def build_overviews(path, band=1):
+    """Add internal overviews down to one tile to a large raster that has none.
+
+    Only ever called on a file no reader has opened yet.
+    """
+    with rasterio.open(path) as src:
+        size = max(src.width, src.height)
+        if size < OVERVIEW_MIN_SIZE or src.overviews(band):
+            return
+    factors = []
+    while size > TILE_SIZE:
+        factors.append(2 ** (len(factors) + 1))
+        size //= 2
+    try:
+        with rasterio.open(path, "r+") as dst:
+            dst.build_overviews(factors, Resampling.average)
+            dst.update_tags(ns="rio_overview", resampling="average")
+    except Exception as e:
+        # Still servable, only coarse zooms read the full-resolution band
+        print(f"⚠️ Could not build overviews for {os.path.basename(path)}: {e}")
+
+
+def prune_scenes(scene_dir, ttl_seconds=SCENE_TTL):
+    """Delete stored scenes (and stray uploads) unused for ``ttl_seconds``."""
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+    try:
+        names = os.listdir(scene_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(scene_dir, name)
+        try:
+            if now - os.path.getmtime(path) <= ttl_seconds:
+                continue
+            scenes.pop(name.split(".", 1)[0])
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def register_scene(stream, scene_dir):
+    """Store an uploaded raster (deduplicated by content) and return its SARScene."""
+    os.makedirs(scene_dir, exist_ok=True)
+    prune_scenes(scene_dir)
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(scene_dir, f".upload-{os.getpid()}-{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as out:
+        for chunk in iter(lambda: stream.read(1 << 20), b""):
+            digest.update(chunk)
+            out.write(chunk)
+    scene_id = digest.hexdigest()[:24]
+    path = scene_path(scene_dir, scene_id)
+    if os.path.exists(path):
+        os.unlink(tmp_path)
+    else:
+        try:
+            with rasterio.open(tmp_path):
+                pass
+        except Exception:
+            os.unlink(tmp_path)
+            raise ValueError("Not a readable raster")
+        build_overviews(tmp_path)
+        os.replace(tmp_path, path)
+    return get_scene(scene_id, scene_dir)
+
+
+def get_scene(scene_id, scene_dir):
+    """The SARScene for ``scene_id`` (reopened from disk if it fell out of memory), or None."""
+    if not re.fullmatch(r"[0-9a-f]{24}", scene_id):
+        return None
+    scene = scenes.get(scene_id)
+    if scene is None:
+        path = scene_path(scene_dir, scene_id)
+        if not os.path.exists(path):
+            return None
+        with _scenes_lock:
+            scene = scenes.get(scene_id)
+            if scene is None:
+                scene = scenes.put(scene_id, SARScene(scene_id, path))
+    scene.touch()
+    return scene
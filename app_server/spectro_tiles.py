@@ -0,0 +1,329 @@
+# =============================================================================
+# Spectrogram Tile Pyramid
+# =============================================================================
+# Level-of-detail spectrogram for long recordings. A recording is decoded once
+# and kept; tiles are addressed by (level, time_tile, freq_tile) and computed
+# lazily, only for the part of the signal they cover.
+#
+#   level 0    full resolution: an N_FFT-point FFT every HOP samples
+#   level L    hop = HOP * 2**L; each column is the max of two adjacent
+#              level L-1 columns, so no audio falls between columns, tonal
+#              lines survive zooming out and the FFT never grows past N_FFT
+#   top level  the whole recording fits in one time tile
+#
+# Every tile is TILE_FRAMES columns by TILE_BINS frequency bins of uint8 dBFS
+# on a fixed scale (DB_FLOOR..0 dB), so tiles can be computed independently and
+# still line up. Computing one time column fills all of its frequency tiles;
+# a coarse column is pooled from the two finer columns under it (taken from
+# the tile cache, or computed and cached on the way), so memory per request
+# stays a few columns however long the recording is.
+#
+# With a ``store_dir`` the decoded samples are written there once (float32
+# .npy plus a .json with the sample rate) and memory-mapped, so every gunicorn
+# worker can serve tiles for a recording another worker registered, and the
+# page cache holds one copy for all of them. Stored recordings unused for
+# SPECTRO_RECORDING_TTL seconds are deleted.
+
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from cache import LRUCache
+
+SPECTRO_N_FFT = 2048
+SPECTRO_HOP = 256
+TILE_FRAMES = 256
+TILE_BINS = 256
+DB_FLOOR = -120.0
+MAX_LEVELS = 20
+RECORDING_TTL = float(os.environ.get("SPECTRO_RECORDING_TTL", 24 * 3600))
+RECORDING_TOUCH_INTERVAL = 300.0  # seconds between last-used updates of a stored recording
+SWEEP_INTERVAL = 600.0
+
+tile_cache = LRUCache(
+    max_entries=int(os.environ.get("SPECTRO_TILE_CACHE_ENTRIES", 4096)),
+    max_bytes=int(float(os.environ.get("SPECTRO_TILE_CACHE_MB", 128)) * 1024 * 1024),
+    name="spectro_tiles",
+)
+# Decoded recordings, bounded by count and by their float32 samples (per process;
+# with a store_dir they are memory-mapped views of the shared stored copy)
+recordings = LRUCache(
+    max_entries=int(os.environ.get("SPECTRO_MAX_RECORDINGS", 8)),
+    max_bytes=int(float(os.environ.get("SPECTRO_RECORDINGS_MB", 512)) * 1024 * 1024),
+    name="spectro_recordings",
+)
+_recordings_lock = threading.Lock()
+_last_sweep = 0.0
+_touched = {}
+
+
+def recording_id(data):
+    """Content-derived id: re-uploading the same file reuses its tiles."""
+    return hashlib.sha256(data).hexdigest()[:24]
+
+
+class SpectrogramPyramid:
+    """Lazily computed spectrogram tiles for one decoded recording."""
+
+    def __init__(self, rec_id, samples, samplerate, n_fft=SPECTRO_N_FFT, hop=SPECTRO_HOP,
+                 tile_frames=TILE_FRAMES, tile_bins=TILE_BINS, db_floor=DB_FLOOR):
+        self.id = rec_id
+        self.samples = np.ascontiguousarray(samples, dtype=np.float32)
+        self.samplerate = int(samplerate)
+        self.n_fft = int(n_fft)
+        self.hop = int(hop)
+        self.tile_frames = int(tile_frames)
+        self.tile_bins = int(tile_bins)
+        self.db_floor = float(db_floor)
+        self.n_bins = self.n_fft // 2  # Nyquist bin dropped so bins tile evenly
+        self.freq_tiles = int(math.ceil(self.n_bins / self.tile_bins))
+        self.levels = 1
+        while self.levels < MAX_LEVELS and self.frames(self.levels - 1) > self.tile_frames:
+            self.levels += 1
+        self.window = np.hanning(self.n_fft + 1)[:-1].astype(np.float32)
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.samplerate if self.samplerate else 0.0
+
+    @property
+    def nbytes(self):
+        """Memory held by the pyramid (samples plus FFT window), for cache accounting."""
+        return self.samples.nbytes + self.window.nbytes
+
+    def level_hop(self, level):
+        return self.hop << level
+
+    def frames(self, level):
+        # Centered frames, as librosa.stft(center=True) counts them
+        return 1 + len(self.samples) // self.level_hop(level)
+
+    def time_tiles(self, level):
+        return int(math.ceil(self.frames(level) / self.tile_frames))
+
+    def describe(self):
+        return {
+            "id": self.id,
+            "sample_rate": self.samplerate,
+            "duration": round(self.duration, 3),
+            "n_fft": self.n_fft,
+            "hop_length": self.hop,
+            "tile_frames": self.tile_frames,
+            "tile_bins": self.tile_bins,
+            "freq_bins": self.n_bins,
+            "freq_tiles": self.freq_tiles,
+            "hz_per_bin": self.samplerate / self.n_fft,
+            "db_range": [self.db_floor, 0.0],
+            "levels": [
+                {
+                    "level": level,
+                    "hop_length": self.level_hop(level),
+                    "frames": self.frames(level),
+                    "time_tiles": self.time_tiles(level),
+                    "seconds_per_tile": self.tile_frames * self.level_hop(level) / self.samplerate,
+                }
+                for level in range(self.levels)
+            ],
+        }
+
+    def check_address(self, level, time_tile, freq_tile):
+        if not 0 <= level < self.levels:
+            raise IndexError(f"level must be in [0, {self.levels - 1}]")
+        if not 0 <= time_tile < self.time_tiles(level):
+            raise IndexError(f"time_tile must be in [0, {self.time_tiles(level) - 1}] at level {level}")
+        if not 0 <= freq_tile < self.freq_tiles:
+            raise IndexError(f"freq_tile must be in [0, {self.freq_tiles - 1}]")
+
+    def tile(self, level, time_tile, freq_tile):
+        """uint8 (tile_bins, tile_frames) tile, row 0 = lowest frequency (cached)."""
+        self.check_address(level, time_tile, freq_tile)
+        tile = tile_cache.get((self.id, level, time_tile, freq_tile))
+        if tile is None:
+            tile = self._column(level, time_tile)[freq_tile]
+        return tile
+
+    def _column(self, level, time_tile):
+        """All frequency tiles of one time tile, from the cache or computed and cached."""
+        column = [tile_cache.get((self.id, level, time_tile, f)) for f in range(self.freq_tiles)]
+        if any(tile is None for tile in column):
+            column = self._compute_column(level, time_tile)
+            for f in range(self.freq_tiles):
+                tile_cache.put((self.id, level, time_tile, f), column[f])
+        return column
+
+    def _compute_column(self, level, time_tile):
+        if level == 0:
+            return self._split(self._fft_column(time_tile))
+
+        # Column j pools level-1 columns 2j and 2j + 1, i.e. time tiles 2t and 2t + 1
+        height = self.freq_tiles * self.tile_bins
+        finer = np.zeros((height, 2 * self.tile_frames), dtype=np.uint8)
+        for half in range(2):
+            child = 2 * time_tile + half
+            if child < self.time_tiles(level - 1):
+                finer[:, half * self.tile_frames:(half + 1) * self.tile_frames] = \
+                    np.concatenate(self._column(level - 1, child))
+        # Max of quantized dB is the quantized max, since the scale is monotonic
+        return self._split(finer.reshape(height, self.tile_frames, 2).max(axis=2))
+
+    def _fft_column(self, time_tile):
+        """Level-0 columns of one time tile, one batch of N_FFT-point FFTs."""
+        hop, n_fft = self.hop, self.n_fft
+        first = time_tile * self.tile_frames
+        count = min(self.tile_frames, self.frames(0) - first)
+
+        # Samples under frames [first, first + count), zero-padded at the edges
+        start = first * hop - n_fft // 2
+        stop = (first + count - 1) * hop + n_fft - n_fft // 2
+        segment = np.zeros(stop - start, dtype=np.float32)
+        lo, hi = max(start, 0), min(stop, len(self.samples))
+        if hi > lo:
+            segment[lo - start:hi - start] = self.samples[lo:hi]
+
+        frames = np.lib.stride_tricks.sliding_window_view(segment, n_fft)[::hop][:count]
+        magnitude = np.abs(np.fft.rfft(frames * self.window, axis=1))[:, :self.n_bins]
+
+        # dB relative to a full-scale sine, quantized on the fixed scale
+        reference = self.window.sum() / 2
+        db = 20 * np.log10(np.maximum(magnitude / reference, 1e-12))
+        q = np.clip((db - self.db_floor) * (255.0 / -self.db_floor), 0, 255).astype(np.uint8)
+
+        column = np.zeros((self.freq_tiles * self.tile_bins, self.tile_frames), dtype=np.uint8)
+        column[:self.n_bins, :count] = q.T
+        return column
+
+    def _split(self, column):
+        return [np.ascontiguousarray(column[f * self.tile_bins:(f + 1) * self.tile_bins])
+                for f in range(self.freq_tiles)]
+
+
+def recording_paths(store_dir, rec_id):
+    """(samples .npy, metadata .json) of a stored recording."""
+    base = os.path.join(store_dir, rec_id)
+    return f"{base}.npy", f"{base}.json"
+
+
+def _write_atomic(path, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def store_recording(store_dir, rec_id, samples, samplerate):
+    """Write decoded samples to ``store_dir``; the .json goes last and marks it complete."""
+    os.makedirs(store_dir, exist_ok=True)
+    npy_path, meta_path = recording_paths(store_dir, rec_id)
+    samples = np.ascontiguousarray(samples, dtype=np.float32)
+    _write_atomic(npy_path, lambda f: np.save(f, samples, allow_pickle=False))
+    meta = json.dumps({"sample_rate": int(samplerate), "samples": len(samples)}).encode("utf-8")
+    _write_atomic(meta_path, lambda f: f.write(meta))
+
+
+def load_recording(store_dir, rec_id):
+    """The stored recording as a pyramid over memory-mapped samples, or None."""
+    npy_path, meta_path = recording_paths(store_dir, rec_id)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        samples = np.load(npy_path, mmap_mode="r", allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+    return SpectrogramPyramid(rec_id, samples, meta["sample_rate"])
+
+
+def touch_recording(store_dir, rec_id):
+    """Mark a stored recording as recently used (file mtimes), for the TTL sweep."""
+    now = time.time()
+    if now - _touched.get(rec_id, 0.0) < RECORDING_TOUCH_INTERVAL:
+        return
+    _touched[rec_id] = now
+    for path in recording_paths(store_dir, rec_id):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+def prune_recordings(store_dir, ttl_seconds=RECORDING_TTL):
+    """Delete stored recordings (and stray temp files) unused for ``ttl_seconds``."""
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+    try:
+        names = os.listdir(store_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(store_dir, name)
+        try:
+            if now - os.path.getmtime(path) <= ttl_seconds:
+                continue
+            rec_id = name.split(".", 1)[0]
+            recordings.pop(rec_id)
+            _touched.pop(rec_id, None)
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def register_recording(data, decode, store_dir=None):
+    """Return the pyramid for an upload, decoding it only the first time it is seen.
+
+    With ``store_dir`` the decode is shared with every worker through the
+    stored copy, and the pyramid reads the memory-mapped samples.
+    """
+    rec_id = recording_id(data)
+    pyramid = get_recording(rec_id, store_dir)
+    if pyramid is None:
+        audio = decode(data)
+        pyramid = SpectrogramPyramid(rec_id, audio.samples, audio.samplerate)
+        if recordings.max_bytes is not None and pyramid.nbytes > recordings.max_bytes:
+            # It could never be cached, so its tiles could never be fetched
+            raise ValueError(f"Recording too long for tiled viewing ({pyramid.nbytes / 2**20:.0f} MB decoded, "
+                             f"limit {recordings.max_bytes / 2**20:.0f} MB)")
+        if store_dir:
+            prune_recordings(store_dir)
+            store_recording(store_dir, rec_id, pyramid.samples, pyramid.samplerate)
+            pyramid = load_recording(store_dir, rec_id) or pyramid
+        recordings.put(rec_id, pyramid)
+    return pyramid
+
+
+def get_recording(rec_id, store_dir=None):
+    """The pyramid for ``rec_id`` (reopened from ``store_dir`` if not in memory), or None."""
+    if not re.fullmatch(r"[0-9a-f]{24}", rec_id):
+        return None
+    pyramid = recordings.get(rec_id)
+    if pyramid is None and store_dir:
+        with _recordings_lock:
+            pyramid = recordings.get(rec_id)
+            if pyramid is None:
+                pyramid = load_recording(store_dir, rec_id)
+                if pyramid is not None:
+                    recordings.put(rec_id, pyramid)
+    if pyramid is not None and store_dir:
+        touch_recording(store_dir, rec_id)
+    return pyramid
+
+
+def encode_tile_png(tile):
+    """Grayscale PNG of a tile, flipped so high frequencies are at the top."""
+    buf = io.BytesIO()
+    Image.fromarray(tile[::-1]).save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
@@ -0,0 +1,246 @@
+# =============================================================================
+# Request Tracing
+# =============================================================================
+# Nested spans with durations and input sizes for one request (or background
+# job) at a time per thread:
+#
+#   trace  POST /upload_car                      20.41 s
+#     span   upload          bytes=48 MB          0.62 s
+#     span   compute_car_doppler                 19.20 s
+#       span   decode                             3.10 s
+#       span   preprocess    (STFT)              14.90 s
+#       ...
+#     span   serialize                            0.58 s
+#
+# Finished traces slower than ``slow_ms`` go into a fixed-size ring buffer
+# that /debug/traces serves. With tracing off, ``span`` is one thread-local
+# lookup returning a shared no-op context manager, and ``traced`` functions
+# call straight through.
+
+import functools
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+TRACE_ENABLED = os.environ.get("TRACE_ENABLED", "0").lower() in ("1", "true", "yes")
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", 1000))
+TRACE_BUFFER = int(os.environ.get("TRACE_BUFFER", 100))
+TRACE_MAX_SPANS = 2000  # per trace; long loops stop recording instead of growing without bound
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def describe_value(value):
+    """Short size description of an argument: shape/dtype for arrays, length for bytes."""
+    shape = getattr(value, "shape", None)
+    if shape is not None:
+        dtype = getattr(value, "dtype", None)
+        return f"{tuple(shape)} {dtype}" if dtype is not None else str(tuple(shape))
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"{len(value)} bytes"
+    return None
+
+
+class Span:
+    __slots__ = ("name", "attrs", "children", "start", "duration", "_trace")
+
+    def __init__(self, trace, name, attrs):
+        self._trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+        self.start = None
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self._trace.stack
+        stack[-1].children.append(self)
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self._trace.stack.pop()
+        return False
+
+    def to_dict(self, origin):
+        data = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000.0, 3),
+            "duration_ms": round(self.duration * 1000.0, 3) if self.duration is not None else None,
+        }
+        if self.attrs:
+            data["attrs"] = {k: v if isinstance(v, (int, float, bool, type(None))) else str(v)
+                             for k, v in self.attrs.items()}
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class Trace:
+    def __init__(self, name, attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.started_at = datetime.now().isoformat()
+        self.root = Span(self, name, attrs)
+        self.root.start = time.perf_counter()
+        self.stack = [self.root]
+        self.spans = 1
+
+    def span(self, name, attrs):
+        if self.spans >= TRACE_MAX_SPANS:
+            self.root.attrs["truncated"] = True
+            return NOOP_SPAN
+        self.spans += 1
+        return Span(self, name, attrs)
+
+    @property
+    def duration_ms(self):
+        return self.root.duration * 1000.0
+
+    def summary(self):
+        return {
+            "trace_id": self.id,
+            "name": self.root.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "spans": self.spans,
+            "error": self.root.attrs.get("error"),
+        }
+
+    def to_dict(self):
+        data = self.summary()
+        data["root"] = self.root.to_dict(self.root.start)
+        return data
+
+
+class TraceRecorder:
+    """Starts and finishes traces per thread and keeps the slow ones."""
+
+    def __init__(self, enabled=TRACE_ENABLED, slow_ms=TRACE_SLOW_MS, capacity=TRACE_BUFFER):
+        self.enabled = enabled
+        self.slow_ms = float(slow_ms)
+        self._slow = deque(maxlen=max(1, int(capacity)))
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.finished = 0
+        self.kept = 0
+
+    def current(self):
+        return getattr(self._local, "trace", None)
+
+    def start(self, name, force=False, **attrs):
+        """Begin a trace on this thread; returns it, or None when tracing is off."""
+        if not (self.enabled or force) or self.current() is not None:
+            return None
+        trace = self._local.trace = Trace(name, attrs)
+        return trace
+
+    def finish(self, trace, error=None, keep=False):
+        """End ``trace``; keep it if it was slow (or ``keep``). Returns whether it was kept."""
+        if trace is None or self.current() is not trace:
+            return False
+        self._local.trace = None
+        trace.root.duration = time.perf_counter() - trace.root.start
+        if error is not None:
+            trace.root.attrs["error"] = str(error)
+        kept = keep or trace.duration_ms >= self.slow_ms
+        with self._lock:
+            self.finished += 1
+            if kept:
+                self._slow.append(trace)
+                self.kept += 1
+        return kept
+
+    def span(self, name, **attrs):
+        trace = getattr(self._local, "trace", None)
+        if trace is None:
+            return NOOP_SPAN
+        return trace.span(name, attrs)
+
+    def traces(self):
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def get(self, trace_id):
+        with self._lock:
+            for trace in self._slow:
+                if trace.id == trace_id:
+                    return trace
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._slow.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "slow_ms": self.slow_ms,
+                "capacity": self._slow.maxlen,
+                "buffered": len(self._slow),
+                "finished": self.finished,
+                "kept": self.kept,
+            }
+
+
+tracer = TraceRecorder()
+span = tracer.span
+
+
+def traced(name=None):
+    """Decorator: run the function inside a span named after it, with argument sizes."""
+    def decorate(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = getattr(tracer._local, "trace", None)
+            if trace is None:
+                return fn(*args, **kwargs)
+            attrs = {}
+            for i, value in enumerate(args):
+                described = describe_value(value)
+                if described is not None:
+                    attrs[f"arg{i}"] = described
+            with trace.span(span_name, attrs):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def run_traced(name, fn, *args, **kwargs):
+    """Call ``fn`` inside its own trace (for background jobs, which have no request)."""
+    trace = tracer.start(name)
+    if trace is None:
+        return fn(*args, **kwargs)
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        tracer.finish(trace, error=e)
+        raise
+    tracer.finish(trace)
+    return result
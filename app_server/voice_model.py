@@ -1,7 +1,7 @@
 ## This script is based on the https://github.com/TaoRuijie/ECAPA-TDNN/blob/main/model.py
 ## I made some changes to the original code for training a binary classifier.
 
-from typing import Optional
+from typing import Dict, List, Optional, Union
 import math
 
 import torch
@@ -9,7 +9,8 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 import torchaudio
-from torchaudio.transforms import Resample
+
+from audio_io import get_resampler
 
 
 from huggingface_hub import PyTorchModelHubMixin
@@ -107,17 +108,30 @@ class ECAPA_gender(nn.Module, PyTorchModelHubMixin):
         self.bn6 = nn.BatchNorm1d(192)
         self.fc7 = nn.Linear(192, 2)
         self.pred2gender = {0 : 'male', 1 : 'female'}
+        # Pre-emphasis filter and MelSpectrogram per device, built on first use.
+        # Kept in a plain dict (not submodules) so the state_dict is unchanged.
+        self._frontends = {}
+
+    def _frontend(self, device : torch.device):
+        frontend = self._frontends.get(device)
+        if frontend is None:
+            flipped_filter = torch.FloatTensor([-0.97, 1.]).unsqueeze(0).unsqueeze(0).to(device)
+            melspec = torchaudio.transforms.MelSpectrogram(sample_rate=16000, n_fft=512, win_length=400, hop_length=160, \
+                                                           f_min = 20, f_max = 7600, window_fn=torch.hamming_window, n_mels=80).to(device)
+            frontend = (flipped_filter, melspec)
+            self._frontends[device] = frontend
+        return frontend
 
     def logtorchfbank(self, x : torch.Tensor) -> torch.Tensor:
+        flipped_filter, melspec = self._frontend(x.device)
+
         # Preemphasis
-        flipped_filter = torch.FloatTensor([-0.97, 1.]).unsqueeze(0).unsqueeze(0).to(x.device)
         x = x.unsqueeze(1)
         x = F.pad(x, (1, 0), 'reflect')
         x = F.conv1d(x, flipped_filter).squeeze(1)
 
         # Melspectrogram
-        x = torchaudio.transforms.MelSpectrogram(sample_rate=16000, n_fft=512, win_length=400, hop_length=160, \
-                                                 f_min = 20, f_max = 7600, window_fn=torch.hamming_window, n_mels=80).to(x.device)(x) + 1e-6
+        x = melspec(x) + 1e-6
         
         # Log and normalize
         x = x.log()   
@@ -159,8 +173,7 @@ class ECAPA_gender(nn.Module, PyTorchModelHubMixin):
     def load_audio(self, path: str) -> torch.Tensor:
         audio, sr = torchaudio.load(path)
         if sr != 16000:
-            resampler = Resample(orig_freq=sr, new_freq=16000)
-            audio = resampler(audio)
+            audio = get_resampler(sr, 16000)(audio)
         return audio.mean(dim=0, keepdim=True)  # Convert to mono if stereo
     
     def predict(self, audio : torch.Tensor, device: torch.device) -> torch.Tensor:
@@ -172,3 +185,49 @@ class ECAPA_gender(nn.Module, PyTorchModelHubMixin):
             output = self.forward(audio)
             _, pred = output.max(1)
         return self.pred2gender[pred.item()]
+
+    def predict_batch(self, audios : List[Union[str, torch.Tensor]], device: torch.device,
+                      batch_size : int = 32, bucket_seconds : float = 0.5,
+                      max_seconds : Optional[float] = None) -> List[Dict]:
+        """Classify many clips with few forward passes.
+
+        ``audios`` are file paths or 16 kHz mono tensors. Clips are sorted by
+        duration and grouped into buckets whose lengths differ by at most
+        ``bucket_seconds``; each bucket is cropped to its shortest clip rather
+        than zero-padded, since padding would skew the utterance statistics.
+        Returns one ``{"gender", "probabilities"}`` dict per input, in order.
+        """
+        clips = []
+        for audio in audios:
+            clip = self.load_audio(audio) if isinstance(audio, str) else audio
+            clip = clip.reshape(-1)
+            if max_seconds is not None:
+                clip = clip[:int(16000 * max_seconds)]
+            clips.append(clip)
+
+        order = sorted(range(len(clips)), key=lambda i: clips[i].shape[0])
+        tolerance = int(16000 * bucket_seconds)
+        buckets, current = [], []
+        for i in order:
+            if current and (len(current) >= batch_size or
+                            clips[i].shape[0] - clips[current[0]].shape[0] > tolerance):
+                buckets.append(current)
+                current = []
+            current.append(i)
+        if current:
+            buckets.append(current)
+
+        self.eval()
+        results : List[Optional[Dict]] = [None] * len(clips)
+        with torch.no_grad():
+            for bucket in buckets:
+                length = clips[bucket[0]].shape[0]
+                batch = torch.stack([clips[i][:length] for i in bucket]).to(device)
+                probs = torch.softmax(self.forward(batch), dim=1).cpu()
+                for row, i in enumerate(bucket):
+                    pred = int(probs[row].argmax())
+                    results[i] = {
+                        "gender": self.pred2gender[pred],
+                        "probabilities": {"male": float(probs[row, 0]), "female": float(probs[row, 1])},
+                    }
+        return results
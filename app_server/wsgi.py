@@ -0,0 +1,13 @@
+# =============================================================================
+# Production WSGI Entry Point
+# =============================================================================
+# gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Under preload_app this module is imported once by the gunicorn master:
+# the PRELOAD_MODELS are loaded here, before any worker is forked, so their
+# weights are shared copy-on-write by every worker.
+
+from app import create_app, models
+
+models.preload_from_env()
+app = create_app()
@@ -139,6 +139,31 @@ function downloadSound() {
 
 // ==================== DETECTION FUNCTIONS ====================
 
+// Decode the multipart (format=binary) /upload_car response into the
+// same shape as the JSON one. The spectrogram stays a typed array:
+// value(dB) = offset + q * scale, row 0 = lowest frequency.
+async function decodeDopplerResponse(response) {
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!contentType.startsWith('multipart/form-data')) {
+        return response.json();
+    }
+
+    const parts = await response.formData();
+    const data = JSON.parse(parts.get('meta'));
+
+    const [rows, width] = data.tracks.shape;
+    const tracks = new Float32Array(await parts.get('tracks').arrayBuffer());
+    data.times = Array.from(tracks.subarray(0, width));
+    data.frequencies = Array.from(tracks.subarray(width, 2 * width));
+    data.velocities = Array.from(tracks.subarray(2 * width, rows * width));
+
+    const buffer = await parts.get('spectrogram').arrayBuffer();
+    data.spectrogram.data = data.spectrogram.dtype === 'uint8'
+        ? new Uint8Array(buffer)
+        : new Uint16Array(buffer);  // float16 bits
+    return data;
+}
+
 function initializeFileUpload() {
     const uploadArea = document.querySelector('.upload-area');
     const fileInput = document.getElementById('audioFile');
@@ -223,6 +248,10 @@ async function detectDoppler() {
         
         const formData = new FormData();
         formData.append('file', file);
+        // Compact transport: tracks and spectrogram come back as binary parts
+        formData.append('format', 'binary');
+        formData.append('width', '1024');
+        formData.append('height', '256');
 
         const response = await fetch('http://127.0.0.1:5000/upload_car', {
             method: 'POST',
@@ -242,7 +271,7 @@ async function detectDoppler() {
             throw new Error(errorMessage);
         }
 
-        const data = await response.json();
+        const data = await decodeDopplerResponse(response);
         console.log('Analysis completed successfully');
         currentDetectionData = data;
         
@@ -274,7 +303,7 @@ function displayDetectionResults(data) {
             <div class="small">
                 <div>Confidence: High</div>
                 <div>Analysis Duration: ${data.times[data.times.length - 1].toFixed(2)}s</div>
-                <div>Time Frames: ${data.times.length}</div>
+                <div>Time Frames: ${data.stft ? data.stft.frames : data.times.length}</div>
             </div>
         `;
     }
@@ -591,6 +591,60 @@ class SARAnalyzer {
         }
     }
 
+    // Bar chart of the histogram returned by /sar/analyze (bin counts + edges)
+    drawHistogram(canvas, histogram) {
+        const ctx = canvas.getContext('2d');
+        const { counts, edges } = histogram;
+        const width = canvas.width;
+        const height = canvas.height;
+        const pad = { left: 60, right: 15, top: 25, bottom: 45 };
+        const plotW = width - pad.left - pad.right;
+        const plotH = height - pad.top - pad.bottom;
+        const maxCount = Math.max(1, ...counts);
+        const lo = edges[0];
+        const hi = edges[edges.length - 1];
+        const x = v => pad.left + ((v - lo) / ((hi - lo) || 1)) * plotW;
+
+        ctx.fillStyle = '#ffffff';
+        ctx.fillRect(0, 0, width, height);
+
+        ctx.fillStyle = 'darkorange';
+        ctx.strokeStyle = 'black';
+        ctx.lineWidth = 0.5;
+        counts.forEach((count, i) => {
+            const barH = (count / maxCount) * plotH;
+            const x0 = x(edges[i]);
+            const barW = Math.max(1, x(edges[i + 1]) - x0);
+            ctx.fillRect(x0, pad.top + plotH - barH, barW, barH);
+            ctx.strokeRect(x0, pad.top + plotH - barH, barW, barH);
+        });
+
+        // Axes, ticks and labels
+        ctx.strokeStyle = '#333';
+        ctx.lineWidth = 1;
+        ctx.beginPath();
+        ctx.moveTo(pad.left, pad.top);
+        ctx.lineTo(pad.left, pad.top + plotH);
+        ctx.lineTo(pad.left + plotW, pad.top + plotH);
+        ctx.stroke();
+
+        ctx.fillStyle = '#333';
+        ctx.font = '12px sans-serif';
+        ctx.textAlign = 'center';
+        for (let i = 0; i <= 5; i++) {
+            const v = lo + (i / 5) * (hi - lo);
+            ctx.fillText(v.toFixed(1), x(v), pad.top + plotH + 16);
+        }
+        ctx.fillText(`Backscatter Intensity (${histogram.unit || 'dB'})`, pad.left + plotW / 2, height - 8);
+        ctx.fillText('Histogram of Pixel Intensities', pad.left + plotW / 2, 16);
+
+        ctx.textAlign = 'right';
+        for (let i = 0; i <= 4; i++) {
+            const c = (i / 4) * maxCount;
+            ctx.fillText(c >= 1000 ? `${(c / 1000).toFixed(0)}k` : c.toFixed(0), pad.left - 6, pad.top + plotH - (i / 4) * plotH + 4);
+        }
+    }
+
     displaySarResults(data) {
         const resultsSection = document.getElementById('sarResultsSection');
         if (!resultsSection) {
@@ -611,14 +665,15 @@ class SARAnalyzer {
             }
         }
         
-        if (data.generated_plot) {
+        if (data.histogram) {
             const result2Element = document.getElementById('sarResult2');
             if (result2Element) {
                 result2Element.innerHTML = `
                     <h6>Intensity Analysis Plot</h6>
-                    <img src="${data.generated_plot}" alt="SAR Analysis Plot" class="result-image">
+                    <canvas id="sarHistogramCanvas" class="result-image" width="800" height="400"></canvas>
                     <p class="mt-2 text-muted small">Intensity distribution and histogram</p>
                 `;
+                this.drawHistogram(document.getElementById('sarHistogramCanvas'), data.histogram);
             }
         }
         
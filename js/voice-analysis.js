@@ -33,6 +33,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (data.model_loaded) {
                     modelStatus.textContent = "ECAPA-TDNN Model loaded successfully ✓";
                     modelStatus.parentElement.classList.add('bg-success', 'text-white');
+                } else if (data.state === "not_loaded") {
+                    modelStatus.textContent = "ECAPA-TDNN Model loads on first request";
+                    modelStatus.parentElement.classList.add('bg-success', 'text-white');
                 } else {
                     modelStatus.textContent = "Model not loaded";
                     modelStatus.parentElement.classList.add('bg-warning', 'text-dark');